@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, g
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from flask_mail import Mail
@@ -6,10 +6,27 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from config import config
 from app.models import User
+from app.cache import ResponseCache
+from app.singleflight import SingleFlight
+from app.admission import AdmissionController
+from app.jobs import JobManager
+from app.sessions import SessionStore
+from app.compression import ResponseCompressor
+from app.retention import UsageCompactor
+from app.json_provider import OrjsonProvider
+from autonomous_agent import configure_providers, configure_upstream_client
+import fast_json
 
 bcrypt = Bcrypt()
 mail = Mail()
 login_manager = LoginManager()
+response_cache = ResponseCache()
+single_flight = SingleFlight()
+admission = AdmissionController()
+job_manager = JobManager()
+session_store = SessionStore()
+compressor = ResponseCompressor()
+usage_compactor = UsageCompactor()
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"]
@@ -20,11 +37,46 @@ def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
+    # Request and response JSON through orjson when it is installed
+    if fast_json.orjson is not None:
+        app.json = OrjsonProvider(app)
+    
     # Initialize extensions
     bcrypt.init_app(app)
     mail.init_app(app)
     login_manager.init_app(app)
     limiter.init_app(app)
+    response_cache.init_app(app)
+    single_flight.init_app(app)
+    admission.init_app(app)
+    job_manager.init_app(app)
+    session_store.init_app(app)
+    compressor.init_app(app)
+    usage_compactor.init_app(app)
+    
+    # Shared keep-alive pool for upstream model calls
+    configure_upstream_client(
+        pool_size=app.config['UPSTREAM_POOL_SIZE'],
+        connect_timeout=app.config['UPSTREAM_CONNECT_TIMEOUT'],
+        read_timeout=app.config['UPSTREAM_READ_TIMEOUT'],
+        max_retries=app.config['UPSTREAM_MAX_RETRIES'],
+        backoff_base=app.config['UPSTREAM_RETRY_BACKOFF'],
+        backoff_max=app.config['UPSTREAM_RETRY_BACKOFF_MAX'],
+        hedge=app.config['UPSTREAM_HEDGE'],
+        hedge_quantile=app.config['UPSTREAM_HEDGE_QUANTILE'],
+        hedge_min_samples=app.config['UPSTREAM_HEDGE_MIN_SAMPLES'],
+        breaker_enabled=app.config['UPSTREAM_BREAKER_ENABLED'],
+        breaker_window=app.config['UPSTREAM_BREAKER_WINDOW'],
+        breaker_min_calls=app.config['UPSTREAM_BREAKER_MIN_CALLS'],
+        breaker_failure_ratio=app.config['UPSTREAM_BREAKER_FAILURE_RATIO'],
+        breaker_slow_call=app.config['UPSTREAM_BREAKER_SLOW_CALL'],
+        breaker_slow_ratio=app.config['UPSTREAM_BREAKER_SLOW_RATIO'],
+        breaker_open_seconds=app.config['UPSTREAM_BREAKER_OPEN_SECONDS']
+    )
+    configure_providers(
+        providers=app.config['UPSTREAM_PROVIDERS'],
+        failover_after=app.config['UPSTREAM_FAILOVER_AFTER']
+    )
     
     # Configure login manager
     login_manager.login_view = 'auth.login'
@@ -59,4 +111,12 @@ def create_app(config_name='default'):
         response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
         return response
     
+    # Report whether an agent answer came from the response cache
+    @app.after_request
+    def set_cache_header(response):
+        cache_status = g.get('cache_status')
+        if cache_status:
+            response.headers['X-Cache'] = cache_status
+        return response
+    
     return app
@@ -0,0 +1,127 @@
+"""
+Admission control and load shedding in front of upstream calls
+"""
+import math
+import threading
+import time
+from autonomous_agent import UpstreamUnavailable
+
+
+class AdmissionRejected(UpstreamUnavailable):
+    """Raised when the admission queue is full or the wait timed out"""
+
+
+class AdmissionController:
+    """
+    Bounded concurrency gate with a waiting queue.
+
+    At most ``limit`` upstream calls run at once per worker; up to
+    ``max_queue`` more wait for a slot, and anything beyond that is
+    rejected immediately. When adaptive, the limit follows AIMD: it grows
+    by one slot per limit's worth of fast, successful calls and is cut
+    multiplicatively when a call fails or exceeds the target latency.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.adaptive = True
+        self.limit = 8.0
+        self.min_limit = 1
+        self.max_limit = 32
+        self.max_queue = 16
+        self.queue_timeout = 10.0
+        self.target_latency = 60.0
+        self.backoff_ratio = 0.75
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._latency_ewma = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the gate from application config"""
+        self.enabled = app.config.get('ADMISSION_ENABLED', True)
+        self.adaptive = app.config.get('ADMISSION_ADAPTIVE', True)
+        self.min_limit = app.config.get('ADMISSION_MIN_CONCURRENCY', self.min_limit)
+        self.max_limit = app.config.get('ADMISSION_MAX_CONCURRENCY', self.max_limit)
+        self.limit = float(app.config.get('ADMISSION_INITIAL_CONCURRENCY', self.limit))
+        self.max_queue = app.config.get('ADMISSION_QUEUE_SIZE', self.max_queue)
+        self.queue_timeout = app.config.get('ADMISSION_QUEUE_TIMEOUT', self.queue_timeout)
+        self.target_latency = app.config.get('ADMISSION_TARGET_LATENCY', self.target_latency)
+
+    def acquire(self):
+        """
+        Take a slot, waiting in the queue if all slots are busy.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        if not self.enabled:
+            return
+        with self._cond:
+            if self._waiting == 0 and self._in_flight < int(self.limit):
+                self._in_flight += 1
+                self._admitted += 1
+                return
+
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise AdmissionRejected('Server is at capacity, please retry later',
+                                        retry_after=self._retry_after())
+
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self._in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise AdmissionRejected('Timed out waiting for capacity, please retry later',
+                                                retry_after=self._retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            self._admitted += 1
+
+    def release(self, latency, failed=False):
+        """Return a slot and feed the call outcome into the limit"""
+        if not self.enabled:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            if self._latency_ewma is None:
+                self._latency_ewma = latency
+            else:
+                self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * latency
+
+            if self.adaptive:
+                if failed or latency > self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _retry_after(self):
+        """Estimate seconds until the queue drains enough to admit a new call (lock held)"""
+        latency = self._latency_ewma or self.queue_timeout
+        return max(1, math.ceil(latency * (self._waiting + 1) / max(1, int(self.limit))))
+
+    def stats(self):
+        """Return gate counters for monitoring"""
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'limit': int(self.limit),
+                'in_flight': self._in_flight,
+                'queue_depth': self._waiting,
+                'queue_size': self.max_queue,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'latency_ewma': round(self._latency_ewma, 3) if self._latency_ewma is not None else None
+            }
@@ -89,8 +89,7 @@ def user_detail(user_id):
     api_keys = APIKey.query_by_user_id(user_id)
     
     # Get usage statistics
-    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_usage = len(APIUsage.query_by_user_id(user_id, start_date=month_start))
+    monthly_usage = APIUsage.count_by_month(user_id, datetime.utcnow().date())
     
     return render_template('admin/user_detail.html',
                          user=user,
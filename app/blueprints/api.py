@@ -1,14 +1,45 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, Response, stream_with_context, g
 from functools import wraps
+from app import response_cache, single_flight, admission, job_manager, session_store, usage_compactor
+from app.jobs import Job
+from app.sessions import SessionBusy, summary_prompt
+from app.cache import cache_bypass_requested
+from app.upstream import query_agent, stream_agent, request_deadline
 from app.models import APIKey, User, APIUsage
+from app.utils import sse_event, SSE_DONE, SSE_HEADERS, token_fields, tokens_dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import time
-from autonomous_agent import AutonomousAgent
+import fast_json
+from autonomous_agent import AutonomousAgent, TokenUsage, UpstreamUnavailable, get_provider_registry
 
 api_bp = Blueprint('api', __name__)
 
-def require_api_key(f):
-    """Decorator to require API key authentication"""
+# Agent task types: request field holding the input, and prompt template
+TASK_TYPES = {
+    'query': ('prompt', "{}"),
+    'research': ('topic', "Research and provide comprehensive information about: {}"),
+    'code': ('requirements', "Generate code for the following requirements: {}"),
+    'analyze': ('content', "Analyze the following content:\n\n{}")
+}
+
+def build_task_prompt(task_type, data):
+    """Build the final prompt for a task type, or None if its input is missing"""
+    field, template = TASK_TYPES[task_type]
+    if not isinstance(data, dict) or field not in data:
+        return None
+    return template.format(data[field])
+
+def require_api_key(f=None, check_quota=True):
+    """
+    Decorator to require API key authentication
+    
+    Use ``@require_api_key(check_quota=False)`` for endpoints that must keep
+    working after the plan limits are reached, such as fetching job results.
+    """
+    if f is None:
+        return lambda func: require_api_key(func, check_quota=check_quota)
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
         api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
@@ -36,13 +67,14 @@ def require_api_key(f):
             }), 403
         
         # Check rate limits
-        if not user.can_make_request():
+        if check_quota and not user.can_make_request():
             plan = user.get_plan()
             limits = current_app.config['API_RATE_LIMITS'].get(plan, {})
             return jsonify({
                 'error': 'Rate limit exceeded',
                 'message': f'You have exceeded your {plan} plan limits',
-                'limits': limits
+                'limits': limits,
+                'token_limits': current_app.config['API_TOKEN_LIMITS'].get(plan, {})
             }), 429
         
         # Update last used timestamp
@@ -56,8 +88,9 @@ def require_api_key(f):
     
     return decorated_function
 
-def log_api_usage(endpoint, method, status_code, response_time):
-    """Log API usage"""
+def log_api_usage(endpoint, method, status_code, response_time, time_to_first_token=None,
+                  tokens=None):
+    """Log API usage, with upstream token counts when known"""
     if hasattr(request, 'api_key') and hasattr(request, 'api_user'):
         usage = APIUsage(
             user_id=request.api_user.id,
@@ -65,16 +98,109 @@ def log_api_usage(endpoint, method, status_code, response_time):
             endpoint=endpoint,
             method=method,
             status_code=status_code,
-            response_time=response_time
+            response_time=response_time,
+            time_to_first_token=time_to_first_token,
+            **token_fields(tokens)
         )
 
+
+def unavailable_response(endpoint, error, start_time):
+    """Shed a request with 503 and a Retry-After hint"""
+    log_api_usage(endpoint, 'POST', 503, time.time() - start_time)
+    response = jsonify({
+        'error': 'Service unavailable',
+        'message': str(error),
+        'retry_after': error.retry_after
+    })
+    response.status_code = 503
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def stream_agent_response(endpoint, prompt, start_time, on_finish=None, usage=None):
+    """
+    Relay upstream deltas to the client as Server-Sent Events.
+    
+    Each delta is sent as ``{"delta": ...}``, followed by a final
+    ``{"done": true, "usage": ...}`` event and ``[DONE]``. Usage is logged
+    once the stream ends, including time to first token.
+    
+    ``on_finish(response)`` is called when the stream ends, with the
+    complete answer, or None if it did not complete. ``usage`` is a
+    TokenUsage already spent on this request and is added to its tokens.
+    """
+    agent = AutonomousAgent(deadline=request_deadline())
+    deltas, g.cache_status = stream_agent(agent, prompt)
+    
+    def generate():
+        status_code = 200
+        time_to_first_token = None
+        chunks = []
+        try:
+            for delta in deltas:
+                if time_to_first_token is None:
+                    time_to_first_token = time.time() - start_time
+                chunks.append(delta)
+                yield sse_event({'delta': delta})
+            
+            yield sse_event({
+                'done': True,
+                'usage': {
+                    'user': request.api_user.username,
+                    'plan': request.api_user.get_plan(),
+                    'response_time': time.time() - start_time,
+                    'time_to_first_token': time_to_first_token,
+                    'tokens': tokens_dict(TokenUsage.combine([usage, agent.last_usage]))
+                }
+            })
+            yield SSE_DONE
+        except GeneratorExit:
+            # Client disconnected mid-stream
+            status_code = 499
+            raise
+        except Exception as e:
+            status_code = 500
+            yield sse_event({
+                'error': 'Internal error',
+                'message': str(e)
+            })
+        finally:
+            log_api_usage(endpoint, 'POST', status_code, time.time() - start_time,
+                          time_to_first_token=time_to_first_token,
+                          tokens=TokenUsage.combine([usage, agent.last_usage]))
+            if on_finish is not None:
+                on_finish(''.join(chunks) if status_code == 200 else None)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
 @api_bp.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """
+    Health check endpoint
+    
+    Returns 503 with status ``degraded`` while the circuit breaker of every
+    upstream provider is open, so load balancers can steer traffic away
+    from this worker. ``pool`` and ``breaker`` are the primary provider's.
+    """
+    registry = get_provider_registry()
+    client = registry.primary.client
+    degraded = registry.is_open()
     return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.utcnow().isoformat()
-    }), 200
+        'status': 'degraded' if degraded else 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'upstream': {
+            'pool': client.stats(),
+            'breaker': client.breaker.stats(),
+            'routing': registry.stats()
+        },
+        'cache': response_cache.stats(),
+        'single_flight': single_flight.stats(),
+        'admission': admission.stats(),
+        'jobs': job_manager.stats(),
+        'sessions': session_store.stats(),
+        'usage': usage_compactor.stats()
+    }), 503 if degraded else 200
 
 @api_bp.route('/query', methods=['POST'])
 @require_api_key
@@ -95,15 +221,20 @@ def query():
     prompt = data['prompt']
     stream = data.get('stream', False)
     
+    if stream:
+        try:
+            return stream_agent_response('/api/v1/query', prompt, start_time)
+        except UpstreamUnavailable as e:
+            return unavailable_response('/api/v1/query', e, start_time)
+    
     try:
-        agent = AutonomousAgent()
+        agent = AutonomousAgent(deadline=request_deadline())
         
         # For API, we don't want streaming output to console
-        # We'll modify the query to not stream
-        response = agent.query(prompt, stream=False)
+        response, g.cache_status = query_agent(agent, prompt)
         
         response_time = time.time() - start_time
-        log_api_usage('/api/v1/query', 'POST', 200, response_time)
+        log_api_usage('/api/v1/query', 'POST', 200, response_time, tokens=agent.last_usage)
         
         return jsonify({
             'success': True,
@@ -111,10 +242,14 @@ def query():
             'usage': {
                 'user': request.api_user.username,
                 'plan': request.api_user.get_plan(),
-                'response_time': response_time
+                'response_time': response_time,
+                'tokens': tokens_dict(agent.last_usage)
             }
         }), 200
     
+    except UpstreamUnavailable as e:
+        return unavailable_response('/api/v1/query', e, start_time)
+    
     except Exception as e:
         response_time = time.time() - start_time
         log_api_usage('/api/v1/query', 'POST', 500, response_time)
@@ -140,14 +275,11 @@ def research():
         }), 400
     
     try:
-        agent = AutonomousAgent()
-        response = agent.query(
-            f"Research and provide comprehensive information about: {data['topic']}",
-            stream=False
-        )
+        agent = AutonomousAgent(deadline=request_deadline())
+        response, g.cache_status = query_agent(agent, build_task_prompt('research', data))
         
         response_time = time.time() - start_time
-        log_api_usage('/api/v1/research', 'POST', 200, response_time)
+        log_api_usage('/api/v1/research', 'POST', 200, response_time, tokens=agent.last_usage)
         
         return jsonify({
             'success': True,
@@ -156,6 +288,9 @@ def research():
             'response_time': response_time
         }), 200
     
+    except UpstreamUnavailable as e:
+        return unavailable_response('/api/v1/research', e, start_time)
+    
     except Exception as e:
         response_time = time.time() - start_time
         log_api_usage('/api/v1/research', 'POST', 500, response_time)
@@ -181,14 +316,11 @@ def generate_code():
         }), 400
     
     try:
-        agent = AutonomousAgent()
-        response = agent.query(
-            f"Generate code for the following requirements: {data['requirements']}",
-            stream=False
-        )
+        agent = AutonomousAgent(deadline=request_deadline())
+        response, g.cache_status = query_agent(agent, build_task_prompt('code', data))
         
         response_time = time.time() - start_time
-        log_api_usage('/api/v1/code', 'POST', 200, response_time)
+        log_api_usage('/api/v1/code', 'POST', 200, response_time, tokens=agent.last_usage)
         
         return jsonify({
             'success': True,
@@ -197,6 +329,9 @@ def generate_code():
             'response_time': response_time
         }), 200
     
+    except UpstreamUnavailable as e:
+        return unavailable_response('/api/v1/code', e, start_time)
+    
     except Exception as e:
         response_time = time.time() - start_time
         log_api_usage('/api/v1/code', 'POST', 500, response_time)
@@ -222,14 +357,11 @@ def analyze():
         }), 400
     
     try:
-        agent = AutonomousAgent()
-        response = agent.query(
-            f"Analyze the following content:\n\n{data['content']}",
-            stream=False
-        )
+        agent = AutonomousAgent(deadline=request_deadline())
+        response, g.cache_status = query_agent(agent, build_task_prompt('analyze', data))
         
         response_time = time.time() - start_time
-        log_api_usage('/api/v1/analyze', 'POST', 200, response_time)
+        log_api_usage('/api/v1/analyze', 'POST', 200, response_time, tokens=agent.last_usage)
         
         return jsonify({
             'success': True,
@@ -237,6 +369,9 @@ def analyze():
             'response_time': response_time
         }), 200
     
+    except UpstreamUnavailable as e:
+        return unavailable_response('/api/v1/analyze', e, start_time)
+    
     except Exception as e:
         response_time = time.time() - start_time
         log_api_usage('/api/v1/analyze', 'POST', 500, response_time)
@@ -245,6 +380,349 @@ def analyze():
             'message': str(e)
         }), 500
 
+@api_bp.route('/batch', methods=['POST'])
+@require_api_key
+def batch():
+    """Run many agent tasks in one request and stream results as NDJSON"""
+    start_time = time.time()
+    
+    data = request.get_json(silent=True)
+    items = (data or {}).get('items')
+    max_items = current_app.config['BATCH_MAX_ITEMS']
+    
+    if not isinstance(items, list) or not items:
+        log_api_usage('/api/v1/batch', 'POST', 400, time.time() - start_time)
+        return jsonify({
+            'error': 'Missing items',
+            'message': 'Please provide a non-empty items array in the request body'
+        }), 400
+    
+    if len(items) > max_items:
+        log_api_usage('/api/v1/batch', 'POST', 400, time.time() - start_time)
+        return jsonify({
+            'error': 'Too many items',
+            'message': f'A batch can contain at most {max_items} items'
+        }), 400
+    
+    # One quota check covers the whole batch
+    remaining = request.api_user.remaining_requests()
+    if remaining is not None and remaining < len(items):
+        plan = request.api_user.get_plan()
+        return jsonify({
+            'error': 'Rate limit exceeded',
+            'message': f'This batch needs {len(items)} requests but your {plan} plan has {remaining} left',
+            'limits': current_app.config['API_RATE_LIMITS'].get(plan, {})
+        }), 429
+    
+    max_concurrency = current_app.config['BATCH_MAX_CONCURRENCY']
+    concurrency = data.get('concurrency', max_concurrency)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        concurrency = max_concurrency
+    concurrency = min(concurrency, max_concurrency, len(items))
+    bypass_cache = cache_bypass_requested()
+    item_budget = request_deadline() - time.monotonic()  # each item gets the full request budget
+    usage_by_index = {}
+    
+    def run_item(index, item):
+        item_start = time.time()
+        task_type = item.get('type', 'query') if isinstance(item, dict) else None
+        result = {'index': index, 'type': task_type}
+        
+        if task_type not in TASK_TYPES:
+            result.update(status='error', status_code=400, error='Invalid item type')
+        elif (prompt := build_task_prompt(task_type, item)) is None:
+            result.update(status='error', status_code=400,
+                          error=f'Missing {TASK_TYPES[task_type][0]}')
+        else:
+            try:
+                agent = AutonomousAgent(deadline=time.monotonic() + item_budget)
+                response, _ = query_agent(agent, prompt, bypass_cache=bypass_cache)
+                result.update(status='ok', status_code=200, response=response,
+                              tokens=tokens_dict(agent.last_usage))
+                usage_by_index[index] = agent.last_usage
+            except UpstreamUnavailable as e:
+                result.update(status='error', status_code=503, error=str(e),
+                              retry_after=e.retry_after)
+            except Exception as e:
+                result.update(status='error', status_code=500, error=str(e))
+        
+        result['response_time'] = time.time() - item_start
+        return result
+    
+    def generate():
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch')
+        try:
+            futures = [executor.submit(run_item, index, item) for index, item in enumerate(items)]
+            for future in as_completed(futures):
+                result = future.result()
+                log_api_usage(f"/api/v1/batch/{result['type'] or 'invalid'}", 'POST',
+                              result['status_code'], result['response_time'],
+                              tokens=usage_by_index.get(result['index']))
+                yield fast_json.dumps(result) + '\n'
+        finally:
+            # Drop queued items if the client went away
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+@api_bp.route('/jobs', methods=['POST'])
+@require_api_key
+def create_job():
+    """Submit an agent task for background execution"""
+    start_time = time.time()
+    
+    data = request.get_json(silent=True)
+    task_type = (data or {}).get('type', 'query')
+    
+    if task_type not in TASK_TYPES:
+        log_api_usage('/api/v1/jobs', 'POST', 400, time.time() - start_time)
+        return jsonify({
+            'error': 'Invalid job type',
+            'message': f"Job type must be one of: {', '.join(TASK_TYPES)}"
+        }), 400
+    
+    prompt = build_task_prompt(task_type, data)
+    if prompt is None:
+        field = TASK_TYPES[task_type][0]
+        log_api_usage('/api/v1/jobs', 'POST', 400, time.time() - start_time)
+        return jsonify({
+            'error': f'Missing {field}',
+            'message': f'Please provide {field} in the request body'
+        }), 400
+    
+    job = Job(request.api_user.id, request.api_key.id, task_type, data)
+    bypass_cache = cache_bypass_requested()
+    
+    def run(job):
+        agent = AutonomousAgent()
+        deltas, _ = stream_agent(agent, prompt, bypass_cache=bypass_cache)
+        chunks = []
+        for delta in deltas:
+            job.check_cancelled()
+            chunks.append(delta)
+        job.usage = agent.last_usage
+        return ''.join(chunks)
+    
+    def on_finish(job, elapsed):
+        # Usage is metered once the job has run, like a synchronous call
+        status_codes = {'succeeded': 200, 'failed': 500, 'cancelled': 499}
+        APIUsage(
+            user_id=job.user_id,
+            api_key_id=job.api_key_id,
+            endpoint=f'/api/v1/jobs/{job.task_type}',
+            method='POST',
+            status_code=status_codes[job.status],
+            response_time=elapsed,
+            **token_fields(job.usage)
+        )
+    
+    try:
+        job_manager.submit(job, run, on_finish)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Too many jobs',
+            'message': str(e)
+        }), 429
+    
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = f'/api/v1/jobs/{job.id}'
+    return response
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@require_api_key(check_quota=False)
+def get_job(job_id):
+    """Get job status and result, optionally long-polling with ?wait=<seconds>"""
+    job = job_manager.get(job_id, user_id=request.api_user.id)
+    
+    if not job:
+        return jsonify({
+            'error': 'Job not found',
+            'message': 'The requested job does not exist or has expired'
+        }), 404
+    
+    wait = request.args.get('wait', 0, type=float)
+    if wait > 0 and not job.finished:
+        job.wait(min(wait, current_app.config['JOBS_MAX_WAIT']))
+    
+    return jsonify(job.to_dict()), 200
+
+@api_bp.route('/jobs/<job_id>', methods=['DELETE'])
+@require_api_key(check_quota=False)
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = job_manager.get(job_id, user_id=request.api_user.id)
+    
+    if not job:
+        return jsonify({
+            'error': 'Job not found',
+            'message': 'The requested job does not exist or has expired'
+        }), 404
+    
+    if not job.finished:
+        job_manager.cancel(job)
+    
+    return jsonify(job.to_dict()), 200
+
+def session_not_found():
+    return jsonify({
+        'error': 'Session not found',
+        'message': 'The requested session does not exist or has expired'
+    }), 404
+
+@api_bp.route('/sessions', methods=['POST'])
+@require_api_key
+def create_session():
+    """Start a conversation whose history is kept on the server"""
+    data = request.get_json(silent=True) or {}
+    system = data.get('system')
+    
+    if system is not None and not isinstance(system, str):
+        return jsonify({
+            'error': 'Invalid system prompt',
+            'message': 'system must be a string'
+        }), 400
+    
+    try:
+        session = session_store.create(request.api_user.id, system or None)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Too many sessions',
+            'message': str(e)
+        }), 429
+    
+    response = jsonify(session.to_dict())
+    response.status_code = 201
+    response.headers['Location'] = f'/api/v1/sessions/{session.id}'
+    return response
+
+@api_bp.route('/sessions/<session_id>', methods=['GET'])
+@require_api_key(check_quota=False)
+def get_session(session_id):
+    """Get the retained conversation of a session"""
+    session = session_store.get(session_id, user_id=request.api_user.id)
+    if not session:
+        return session_not_found()
+    return jsonify(session.to_dict()), 200
+
+@api_bp.route('/sessions/<session_id>', methods=['DELETE'])
+@require_api_key(check_quota=False)
+def delete_session(session_id):
+    """End a session and forget its history"""
+    session = session_store.get(session_id, user_id=request.api_user.id)
+    if not session:
+        return session_not_found()
+    session_store.delete(session)
+    return '', 204
+
+@api_bp.route('/sessions/<session_id>/messages', methods=['POST'])
+@require_api_key
+def session_message(session_id):
+    """
+    Send the next user message of a session.
+    
+    The conversation so far is added on the server, trimmed (or summarized)
+    to the session context budget. With ``"stream": true`` the answer is
+    relayed as Server-Sent Events, like /query.
+    """
+    start_time = time.time()
+    endpoint = '/api/v1/sessions/messages'
+    
+    session = session_store.get(session_id, user_id=request.api_user.id)
+    if not session:
+        return session_not_found()
+    
+    data = request.get_json(silent=True) or {}
+    content = data.get('content')
+    
+    if not isinstance(content, str) or not content:
+        log_api_usage(endpoint, 'POST', 400, time.time() - start_time)
+        return jsonify({
+            'error': 'Missing content',
+            'message': 'Please provide the message content in the request body'
+        }), 400
+    
+    if not session_store.fits(session, content):
+        log_api_usage(endpoint, 'POST', 400, time.time() - start_time)
+        return jsonify({
+            'error': 'Message too long',
+            'message': f'The message does not fit the {session_store.context_tokens} token context of a session'
+        }), 400
+    
+    try:
+        session.acquire()
+    except SessionBusy as e:
+        return jsonify({
+            'error': 'Session busy',
+            'message': str(e)
+        }), 409
+    
+    summary_usage = []
+    
+    def summarize(summary, turns):
+        agent = AutonomousAgent(deadline=request_deadline())
+        text, _ = query_agent(agent, summary_prompt(summary, turns))
+        summary_usage.append(agent.last_usage)
+        return text
+    
+    def finish(response):
+        if response is not None:
+            session.add_turn(content, response)
+    
+    streaming = False
+    try:
+        session_store.compact(session, content, summarize if session_store.summarize else None)
+        messages = session.messages(content)
+        usage = TokenUsage.combine(summary_usage)
+        
+        if data.get('stream', False):
+            response = stream_agent_response(endpoint, messages, start_time, on_finish=finish,
+                                             usage=usage)
+            response.call_on_close(session.release)
+            streaming = True
+            return response
+        
+        agent = AutonomousAgent(deadline=request_deadline())
+        answer, g.cache_status = query_agent(agent, messages)
+        finish(answer)
+        
+        tokens = TokenUsage.combine([usage, agent.last_usage])
+        response_time = time.time() - start_time
+        log_api_usage(endpoint, 'POST', 200, response_time, tokens=tokens)
+        
+        return jsonify({
+            'success': True,
+            'session_id': session.id,
+            'response': answer,
+            'context': {
+                'messages': len(session.turns),
+                'trimmed_messages': session.trimmed,
+                'tokens': session.context_tokens()
+            },
+            'usage': {
+                'user': request.api_user.username,
+                'plan': request.api_user.get_plan(),
+                'response_time': response_time,
+                'tokens': tokens_dict(tokens)
+            }
+        }), 200
+    
+    except UpstreamUnavailable as e:
+        return unavailable_response(endpoint, e, start_time)
+    
+    except Exception as e:
+        response_time = time.time() - start_time
+        log_api_usage(endpoint, 'POST', 500, response_time)
+        return jsonify({
+            'error': 'Internal error',
+            'message': str(e)
+        }), 500
+    
+    finally:
+        if not streaming:
+            session.release()
+
 @api_bp.route('/usage', methods=['GET'])
 @require_api_key
 def get_usage():
@@ -257,11 +735,17 @@ def get_usage():
     
     # Get monthly usage
     month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_usage = len(APIUsage.query_by_user_id(request.api_user.id, start_date=month_start))
+    monthly_usage = APIUsage.count_by_month(request.api_user.id, today)
     
     # Get plan limits
     plan = request.api_user.get_plan()
     limits = current_app.config['API_RATE_LIMITS'].get(plan, {})
+    token_limits = current_app.config['API_TOKEN_LIMITS'].get(plan, {})
+    
+    # Token usage
+    today_start = datetime.combine(today, datetime.min.time())
+    daily_tokens = APIUsage.token_totals(request.api_user.id, start_date=today_start)
+    monthly_tokens = APIUsage.token_totals(request.api_user.id, start_date=month_start)
     
     return jsonify({
         'user': request.api_user.username,
@@ -274,6 +758,17 @@ def get_usage():
         'remaining': {
             'daily': max(0, limits.get('daily', 0) - daily_usage) if limits.get('daily', 0) != -1 else 'unlimited',
             'monthly': max(0, limits.get('monthly', 0) - monthly_usage) if limits.get('monthly', 0) != -1 else 'unlimited'
+        },
+        'tokens': {
+            'usage': {
+                'daily': daily_tokens,
+                'monthly': monthly_tokens
+            },
+            'limits': token_limits,
+            'remaining': {
+                'daily': max(0, token_limits.get('daily', 0) - daily_tokens['total']) if token_limits.get('daily', 0) != -1 else 'unlimited',
+                'monthly': max(0, token_limits.get('monthly', 0) - monthly_tokens['total']) if token_limits.get('monthly', 0) != -1 else 'unlimited'
+            }
         }
     }), 200
 
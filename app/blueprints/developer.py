@@ -16,13 +16,7 @@ def portal():
     week_ago = datetime.utcnow() - timedelta(days=7)
     
     # Calculate daily stats
-    from collections import defaultdict
-    daily_counts = defaultdict(int)
-    for usage in APIUsage.query_by_user_id(current_user.id, start_date=week_ago):
-        date = usage.timestamp.date()
-        daily_counts[date] += 1
-    
-    daily_stats = [(date, count) for date, count in sorted(daily_counts.items())]
+    daily_stats = APIUsage.get_daily_stats(week_ago, user_id=current_user.id)
     
     return render_template('developer/portal.html',
                          api_keys=api_keys,
@@ -92,6 +86,22 @@ def toggle_api_key(key_id):
     flash(f'API key {status} successfully', 'success')
     return redirect(url_for('developer.portal'))
 
+@developer_bp.route('/api-keys/<int:key_id>/cache', methods=['POST'])
+@login_required
+def toggle_api_key_cache(key_id):
+    """Toggle response caching for an API key"""
+    api_key = APIKey.query_by_id(key_id)
+    
+    if not api_key or api_key.user_id != current_user.id:
+        flash('API key not found', 'error')
+        return redirect(url_for('developer.portal'))
+    
+    api_key.cache_enabled = not api_key.cache_enabled
+    
+    status = 'enabled' if api_key.cache_enabled else 'disabled'
+    flash(f'Response caching {status} for {api_key.name}', 'success')
+    return redirect(url_for('developer.portal'))
+
 @developer_bp.route('/usage')
 @login_required
 def usage():
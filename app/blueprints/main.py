@@ -1,8 +1,10 @@
-from flask import Blueprint, render_template, current_app, request, jsonify
+from flask import Blueprint, render_template, current_app, request, jsonify, Response, stream_with_context, g
 from flask_login import login_required, current_user
+from app.upstream import query_agent, stream_agent, request_deadline
 from app.models import APIUsage, APIKey
+from app.utils import sse_event, SSE_DONE, SSE_HEADERS, token_fields
 from datetime import datetime
-from autonomous_agent import AutonomousAgent
+from autonomous_agent import AutonomousAgent, UpstreamUnavailable
 import time
 
 main_bp = Blueprint('main', __name__)
@@ -19,10 +21,9 @@ def dashboard():
     """User dashboard"""
     # Get API usage statistics
     today = datetime.utcnow().date()
-    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
     daily_usage = APIUsage.count_by_date(current_user.id, today)
-    monthly_usage = len(APIUsage.query_by_user_id(current_user.id, start_date=month_start))
+    monthly_usage = APIUsage.count_by_month(current_user.id, today)
     
     # Get user's plan and limits
     plan = current_user.get_plan()
@@ -66,6 +67,31 @@ def playground():
     """AI Playground - Interactive AI interface"""
     return render_template('playground.html')
 
+def unavailable_response(error):
+    """Tell the playground to retry later when upstream capacity is exhausted"""
+    response = jsonify({
+        'success': False,
+        'error': str(error)
+    })
+    response.status_code = 503
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def build_playground_prompt(prompt, mode):
+    """Customize a playground prompt based on the selected mode"""
+    if mode == 'research':
+        return f"Research and provide comprehensive information about: {prompt}"
+    elif mode == 'code':
+        return f"Generate code for the following requirements: {prompt}"
+    elif mode == 'article':
+        return f"Write a detailed, well-structured article about: {prompt}"
+    elif mode == 'websearch':
+        return f"Perform a web search and summarize information about: {prompt}"
+    elif mode == 'agent':
+        return f"As an autonomous agent, analyze and execute this task: {prompt}"
+    return prompt
+
 @main_bp.route('/playground/query', methods=['POST'])
 @login_required
 def playground_query():
@@ -88,24 +114,11 @@ def playground_query():
     mode = data.get('mode', 'general')  # general, research, code, article, websearch, agent
     
     try:
-        agent = AutonomousAgent()
-        
-        # Customize prompt based on mode
-        if mode == 'research':
-            enhanced_prompt = f"Research and provide comprehensive information about: {prompt}"
-        elif mode == 'code':
-            enhanced_prompt = f"Generate code for the following requirements: {prompt}"
-        elif mode == 'article':
-            enhanced_prompt = f"Write a detailed, well-structured article about: {prompt}"
-        elif mode == 'websearch':
-            enhanced_prompt = f"Perform a web search and summarize information about: {prompt}"
-        elif mode == 'agent':
-            enhanced_prompt = f"As an autonomous agent, analyze and execute this task: {prompt}"
-        else:
-            enhanced_prompt = prompt
+        agent = AutonomousAgent(deadline=request_deadline())
+        enhanced_prompt = build_playground_prompt(prompt, mode)
         
         start_time = time.time()
-        response = agent.query(enhanced_prompt, stream=False)
+        response, g.cache_status = query_agent(agent, enhanced_prompt)
         response_time = time.time() - start_time
         
         # Log usage
@@ -115,7 +128,8 @@ def playground_query():
             endpoint='/playground/query',
             method='POST',
             status_code=200,
-            response_time=response_time
+            response_time=response_time,
+            **token_fields(agent.last_usage)
         )
         
         return jsonify({
@@ -125,8 +139,76 @@ def playground_query():
             'response_time': round(response_time, 2)
         }), 200
     
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+
+@main_bp.route('/playground/query/stream', methods=['POST'])
+@login_required
+def playground_query_stream():
+    """Stream AI responses to the playground as Server-Sent Events"""
+    # Check rate limits
+    if not current_user.can_make_request():
+        return jsonify({
+            'success': False,
+            'error': 'Rate limit exceeded. Please upgrade your plan.'
+        }), 429
+    
+    data = request.get_json()
+    if not data or 'prompt' not in data:
+        return jsonify({
+            'success': False,
+            'error': 'Missing prompt'
+        }), 400
+    
+    mode = data.get('mode', 'general')
+    enhanced_prompt = build_playground_prompt(data['prompt'], mode)
+    user_id = current_user.id
+    agent = AutonomousAgent(deadline=request_deadline())
+    try:
+        deltas, g.cache_status = stream_agent(agent, enhanced_prompt)
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    
+    def generate():
+        start_time = time.time()
+        time_to_first_token = None
+        status_code = 200
+        try:
+            for delta in deltas:
+                if time_to_first_token is None:
+                    time_to_first_token = time.time() - start_time
+                yield sse_event({'delta': delta})
+            
+            yield sse_event({
+                'done': True,
+                'mode': mode,
+                'response_time': round(time.time() - start_time, 2)
+            })
+            yield SSE_DONE
+        except GeneratorExit:
+            # Browser navigated away or cancelled the request
+            status_code = 499
+            raise
+        except Exception as e:
+            status_code = 500
+            yield sse_event({'error': str(e)})
+        finally:
+            APIUsage(
+                user_id=user_id,
+                api_key_id=None,
+                endpoint='/playground/query/stream',
+                method='POST',
+                status_code=status_code,
+                response_time=time.time() - start_time,
+                time_to_first_token=time_to_first_token,
+                **token_fields(agent.last_usage)
+            )
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
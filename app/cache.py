@@ -0,0 +1,169 @@
+"""
+Exact-match response cache for agent queries
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from flask import request
+
+
+class ResponseCache:
+    """
+    Two-tier cache for complete model answers.
+
+    The memory tier is an LRU bounded by a byte budget, with a TTL on every
+    entry. The optional disk tier stores one JSON file per key under
+    ``cache_dir`` so all workers on a host share answers. Both tiers are
+    keyed on the model, the final prompt and the generation parameters.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.ttl = 3600
+        self.max_bytes = 64 * 1024 * 1024
+        self.cache_dir = None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: (expires_at, value, size)}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the cache from application config"""
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', False)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        self.max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', self.max_bytes)
+        self.cache_dir = app.config.get('RESPONSE_CACHE_DIR') or None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self.clear()
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        """Build a cache key from the model, final prompt and generation params"""
+        material = json.dumps([model, prompt, params or {}], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached answer for a key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[1]
+                self._remove(key)
+
+        value, expires_at = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._store(key, value, expires_at)
+        return value
+
+    def set(self, key, value):
+        """Store an answer in every enabled tier"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        self._disk_set(key, value, expires_at)
+
+    def clear(self):
+        """Drop all in-memory entries and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = self._misses = self._evictions = 0
+
+    def stats(self):
+        """Return cache counters for monitoring"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'disk': bool(self.cache_dir)
+            }
+
+    def _store(self, key, value, expires_at):
+        """Insert into the memory tier and evict down to the byte budget (lock held)"""
+        size = len(value.encode())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def _remove(self, key):
+        """Remove a memory entry (lock held)"""
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _disk_get(self, key, now):
+        """Read an entry from the shared disk tier"""
+        if not self.cache_dir:
+            return None, None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if entry.get('expires_at', 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, None
+        return entry.get('value'), entry['expires_at']
+
+    def _disk_set(self, key, value, expires_at):
+        """Write an entry to the disk tier atomically so readers never see partial files"""
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+def cache_bypass_requested():
+    """Check whether the current request opted out of the response cache"""
+    cache_control = request.headers.get('Cache-Control', '').lower()
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return True
+    api_key = getattr(request, 'api_key', None)
+    return api_key is not None and not api_key.cache_enabled
+
@@ -0,0 +1,133 @@
+"""
+Negotiated Content-Encoding for API, page and streaming responses
+"""
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional: pip install zstandard
+    zstandard = None
+
+
+class _Encoder:
+    """Incremental compressor for one response body in a given encoding"""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        elif encoding == 'br':
+            self._obj = brotli.Compressor(quality=level)
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)  # gzip container
+
+    def compress(self, data):
+        """Compress a chunk, buffering output until the next flush"""
+        if self.encoding == 'br':
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self):
+        """Emit everything compressed so far so the client can decode it now"""
+        if self.encoding == 'zstd':
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == 'br':
+            return self._obj.flush()
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """End the compressed stream"""
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+class ResponseCompressor:
+    """
+    Compresses responses with the best encoding the client accepts.
+
+    zstd and brotli are offered when their packages are installed, gzip
+    always. Buffered responses are compressed once they reach ``min_size``
+    bytes. Streamed responses (Server-Sent Events, NDJSON) are compressed
+    incrementally and flushed after every chunk the view yields; each
+    chunk is one whole event, so clients decode events as they arrive.
+    """
+
+    # Server preference, best first, and levels that favour speed
+    ENCODINGS = ('zstd', 'br', 'gzip')
+    LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+    MIMETYPES = frozenset({
+        'application/json', 'application/x-ndjson', 'text/event-stream',
+        'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript'
+    })
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.min_size = 500
+        self.encodings = tuple(e for e in self.ENCODINGS
+                               if e == 'gzip' or (e == 'br' and brotli) or (e == 'zstd' and zstandard))
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure compression from application config and hook it into every response"""
+        self.enabled = app.config.get('COMPRESSION_ENABLED', True)
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', self.min_size)
+        app.after_request(self.compress_response)
+
+    def select_encoding(self, accept_encodings):
+        """Return the accepted encoding with the highest quality, ties going to server preference"""
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress_response(self, response):
+        """after_request hook: compress the body if the client and content allow it"""
+        if (not self.enabled or response.direct_passthrough
+                or response.mimetype not in self.MIMETYPES
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers or request.method == 'HEAD'):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.select_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            encoder = _Encoder(encoding, self.LEVELS[encoding])
+            response.set_data(encoder.compress(data) + encoder.finish())
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _stream(self, chunks, encoding):
+        """Compress a streamed body, flushing after every chunk"""
+        encoder = _Encoder(encoding, self.LEVELS[encoding])
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                data = encoder.compress(chunk) + encoder.flush()
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            # Ends the view's generator too, so its cleanup runs on disconnect
+            if hasattr(chunks, 'close'):
+                chunks.close()
@@ -0,0 +1,190 @@
+"""
+Background job execution for long-running agent tasks
+"""
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.utils import tokens_dict
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when it has been cancelled"""
+
+
+class Job:
+    """A task submitted for background execution"""
+
+    def __init__(self, user_id, api_key_id, task_type, payload):
+        self.id = 'job_' + secrets.token_hex(12)
+        self.user_id = user_id
+        self.api_key_id = api_key_id
+        self.task_type = task_type
+        self.payload = payload
+        self.status = 'queued'  # queued, running, succeeded, failed, cancelled
+        self.result = None
+        self.usage = None  # TokenUsage reported by upstream, if any
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.expires_at = None  # monotonic deadline, set once finished
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._future = None
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or the timeout expires"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        """Serialize job state for API responses"""
+        data = {
+            'id': self.id,
+            'type': self.task_type,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.status == 'succeeded':
+            data['response'] = self.result
+        if self.usage:
+            data['tokens'] = tokens_dict(self.usage)
+        if self.error:
+            data['error'] = self.error
+        return data
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.status}>'
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool and keeps finished results for a TTL.
+
+    Jobs live in this worker process; finished jobs are purged lazily once
+    their result TTL has passed.
+    """
+
+    def __init__(self, app=None):
+        self.max_workers = 4
+        self.result_ttl = 3600
+        self.max_active_per_user = 10
+        self._lock = threading.Lock()
+        self._jobs = {}  # {job_id: Job}
+        self._executor = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the pool from application config"""
+        self.max_workers = app.config.get('JOBS_MAX_WORKERS', self.max_workers)
+        self.result_ttl = app.config.get('JOBS_RESULT_TTL', self.result_ttl)
+        self.max_active_per_user = app.config.get('JOBS_MAX_ACTIVE_PER_USER', self.max_active_per_user)
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='agent-job')
+
+    def submit(self, job, run, on_finish=None):
+        """
+        Queue a job for execution.
+
+        ``run(job)`` returns the result and should call
+        ``job.check_cancelled()`` regularly. ``on_finish(job, elapsed)`` is
+        called once the job reaches a final state.
+
+        Raises:
+            ValueError: If the user already has too many unfinished jobs
+        """
+        with self._lock:
+            self._purge_expired()
+            active = sum(1 for j in self._jobs.values()
+                         if j.user_id == job.user_id and not j.finished)
+            if active >= self.max_active_per_user:
+                raise ValueError(f'You can only have up to {self.max_active_per_user} unfinished jobs')
+            self._jobs[job.id] = job
+            job._future = self._executor.submit(self._execute, job, run, on_finish)
+        return job
+
+    def get(self, job_id, user_id=None):
+        """Return a job by ID, optionally restricted to its owner"""
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job
+
+    def cancel(self, job):
+        """Request cancellation; queued jobs never start, running jobs stop at the next check"""
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            # Never started, so _execute will not finalize it
+            self._finalize(job, 'cancelled', None, None, 0)
+        return job
+
+    def _execute(self, job, run, on_finish):
+        """Run a job on a pool thread and record its outcome"""
+        if job.cancel_requested:
+            self._finalize(job, 'cancelled', None, None, 0, on_finish)
+            return
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        start_time = time.time()
+        try:
+            result = run(job)
+            job.check_cancelled()
+        except JobCancelled:
+            self._finalize(job, 'cancelled', None, None, time.time() - start_time, on_finish)
+        except Exception as e:
+            self._finalize(job, 'failed', None, str(e), time.time() - start_time, on_finish)
+        else:
+            self._finalize(job, 'succeeded', result, None, time.time() - start_time, on_finish)
+
+    def _finalize(self, job, status, result, error, elapsed, on_finish=None):
+        """Move a job into a final state and wake any long-pollers"""
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        job.expires_at = time.monotonic() + self.result_ttl
+        job._done.set()
+        if on_finish is not None:
+            on_finish(job, elapsed)
+
+    def _purge_expired(self):
+        """Drop finished jobs past their result TTL (lock held)"""
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.expires_at is not None and job.expires_at <= now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        """Return job counters for monitoring"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                'workers': self.max_workers,
+                'jobs': counts
+            }
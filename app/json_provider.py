@@ -0,0 +1,69 @@
+"""
+Flask JSON provider backed by orjson
+"""
+from flask.json.provider import DefaultJSONProvider
+from fast_json import orjson
+
+# Arguments of json.dumps the orjson path can honour; anything else uses json
+_SUPPORTED = frozenset({'default', 'indent', 'separators', 'sort_keys', 'ensure_ascii'})
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Drop-in replacement for Flask's provider that encodes and decodes with orjson.
+
+    Datetimes, dates, dataclasses, Decimals and other values orjson does not
+    encode the way Flask does are passed to the same ``default`` as the
+    standard provider, so responses carry the same values. Output is UTF-8
+    rather than ASCII-escaped. Values either backend rejects raise the same
+    TypeError, and malformed request bodies the same ValueError.
+    """
+
+    ensure_ascii = False
+    _OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+                | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+    def _option(self, kwargs):
+        """orjson options for json.dumps-style arguments, or None if only json can honour them"""
+        if not _SUPPORTED.issuperset(kwargs) or kwargs.get('indent') not in (None, 2):
+            return None
+        separators = kwargs.get('separators')
+        if separators is not None and tuple(separators) != (',', ':'):
+            return None
+        option = self._OPTIONS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        """Serialize data as JSON text, with orjson unless the arguments need json"""
+        option = self._option(kwargs)
+        if option is not None:
+            try:
+                return orjson.dumps(obj, default=kwargs.get('default', self.default),
+                                    option=option).decode()
+            except TypeError:
+                pass  # Let json encode it, or raise its usual error
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        """Deserialize JSON from text or UTF-8 bytes"""
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Build a JSON response, encoding straight to bytes"""
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._OPTIONS | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            data = orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(data, mimetype=self.mimetype)
@@ -4,6 +4,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import string
 import threading
+from app.usage_store import DAY_US, EPOCH, UsageLog, to_micros
 
 # Thread lock for all storage operations
 _storage_lock = threading.RLock()
@@ -15,7 +16,8 @@ users_by_username = {}  # {username: user_id}
 subscriptions_storage = {}  # {user_id: Subscription}
 api_keys_storage = {}  # {key_id: APIKey}
 api_keys_by_key = {}  # {key: key_id}
-api_usage_storage = []  # [APIUsage]
+api_usage_storage = UsageLog()  # columnar rows of every APIUsage
+usage_counters = {}  # {user_id: UsageCounters}
 email_verifications_storage = {}  # {token: EmailVerification}
 
 # Auto-increment IDs (thread-safe using lock)
@@ -91,8 +93,8 @@ class User(UserMixin):
         """Get user's subscription"""
         return subscriptions_storage.get(self.id)
     
-    def can_make_request(self):
-        """Check if user can make API request based on their plan limits"""
+    def remaining_requests(self):
+        """Number of API requests left under the plan limits, or None if unlimited"""
         plan = self.get_plan()
         from flask import current_app
         limits = current_app.config['API_RATE_LIMITS'].get(plan, {})
@@ -101,22 +103,51 @@ class User(UserMixin):
         monthly_limit = limits.get('monthly', 0)
         
         if daily_limit == -1:  # Unlimited
-            return True
+            return None
         
-        # Check daily usage
+        # Running counters make both checks constant time
         today = datetime.utcnow().date()
-        daily_usage = sum(1 for usage in api_usage_storage 
-                         if usage.user_id == self.id and usage.timestamp.date() == today)
+        daily_usage = APIUsage.count_by_date(self.id, today)
         
         if daily_usage >= daily_limit:
-            return False
+            return 0
         
-        # Check monthly usage
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_usage = sum(1 for usage in api_usage_storage 
-                           if usage.user_id == self.id and usage.timestamp >= month_start)
+        monthly_usage = APIUsage.count_by_month(self.id, today)
         
-        return monthly_usage < monthly_limit
+        return max(0, min(daily_limit - daily_usage, monthly_limit - monthly_usage))
+    
+    def remaining_tokens(self):
+        """Number of tokens left under the plan token quotas, or None if unlimited"""
+        plan = self.get_plan()
+        from flask import current_app
+        limits = current_app.config['API_TOKEN_LIMITS'].get(plan, {})
+        
+        daily_limit = limits.get('daily', 0)
+        monthly_limit = limits.get('monthly', 0)
+        
+        if daily_limit == -1:  # Unlimited
+            return None
+        
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        daily_tokens = APIUsage.token_totals(self.id, start_date=today)['total']
+        
+        if daily_tokens >= daily_limit:
+            return 0
+        
+        month_start = today.replace(day=1)
+        monthly_tokens = APIUsage.token_totals(self.id, start_date=month_start)['total']
+        
+        return max(0, min(daily_limit - daily_tokens, monthly_limit - monthly_tokens))
+    
+    def can_make_request(self):
+        """Check if user can make API request based on their plan limits"""
+        remaining = self.remaining_requests()
+        if remaining is not None and remaining <= 0:
+            return False
+        # A request is only refused once the token quota is used up; its own
+        # cost is not known until upstream has answered
+        remaining_tokens = self.remaining_tokens()
+        return remaining_tokens is None or remaining_tokens > 0
     
     @staticmethod
     def query_by_email(email):
@@ -251,7 +282,8 @@ class Subscription:
 class APIKey:
     """API Key model for developer portal"""
     
-    def __init__(self, user_id, key, name, is_active=True, created_at=None, last_used=None, id=None):
+    def __init__(self, user_id, key, name, is_active=True, created_at=None, last_used=None,
+                 cache_enabled=True, id=None):
         with _storage_lock:
             # Check if key already exists
             if key in api_keys_by_key:
@@ -271,6 +303,7 @@ class APIKey:
             self.is_active = is_active
             self.created_at = created_at or datetime.utcnow()
             self.last_used = last_used
+            self.cache_enabled = cache_enabled
             
             # Store in memory
             api_keys_storage[self.id] = self
@@ -324,11 +357,69 @@ class APIKey:
         return f'<APIKey {self.name}>'
 
 
+class UsageCounters:
+    """
+    Running request and token totals of one user for the latest day and month.
+    
+    Updated as usage is recorded, and reset when a record from a later
+    period arrives, so quota checks never scan the usage log. Totals are
+    ``[requests, prompt, completion, reasoning]``.
+    """
+    
+    __slots__ = ('day', 'month', 'daily', 'monthly')
+    
+    def __init__(self):
+        self.day = None  # date of the latest record
+        self.month = None  # (year, month) of the latest record
+        self.daily = [0, 0, 0, 0]
+        self.monthly = [0, 0, 0, 0]
+    
+    def add(self, usage):
+        """Count a new usage record (lock held)"""
+        day = usage.timestamp.date()
+        month = (day.year, day.month)
+        if self.month is None or month > self.month:
+            self.month, self.monthly = month, [0, 0, 0, 0]
+        if self.day is None or day > self.day:
+            self.day, self.daily = day, [0, 0, 0, 0]
+        amounts = (1, usage.prompt_tokens, usage.completion_tokens, usage.reasoning_tokens)
+        for totals, current in ((self.monthly, month == self.month), (self.daily, day == self.day)):
+            if current:
+                for i, amount in enumerate(amounts):
+                    totals[i] += amount
+    
+    def for_day(self, day):
+        """Totals for a day, or None if it is older than the counters"""
+        if day == self.day:
+            return self.daily
+        # Counters only move forward, so a later day has no records yet
+        return [0, 0, 0, 0] if day > self.day else None
+    
+    def for_month(self, day):
+        """Totals for the month containing a day, or None if it is older than the counters"""
+        month = (day.year, day.month)
+        if month == self.month:
+            return self.monthly
+        return [0, 0, 0, 0] if month > self.month else None
+
+
 class APIUsage:
-    """API Usage tracking model"""
+    """
+    API Usage tracking model
+    
+    Records are stored as rows of the columnar ``api_usage_storage`` log;
+    the objects returned by queries are materialized from those rows.
+    Once compacted, old records only remain in the statistics and counts.
+    """
+    
+    __slots__ = ('id', 'user_id', 'api_key_id', 'endpoint', 'method', 'status_code',
+                 'timestamp', 'response_time', 'time_to_first_token',
+                 'prompt_tokens', 'completion_tokens', 'reasoning_tokens')
     
     def __init__(self, user_id, api_key_id=None, endpoint=None, method=None, 
-                 status_code=None, timestamp=None, response_time=None, id=None):
+                 status_code=None, timestamp=None, response_time=None,
+                 time_to_first_token=None, prompt_tokens=0, completion_tokens=0,
+                 reasoning_tokens=0, id=None):
         with _storage_lock:
             if id is None:
                 self.id = _api_usage_id_counter[0]
@@ -345,96 +436,162 @@ class APIUsage:
             self.status_code = status_code
             self.timestamp = timestamp or datetime.utcnow()
             self.response_time = response_time
+            self.time_to_first_token = time_to_first_token
+            self.prompt_tokens = prompt_tokens
+            self.completion_tokens = completion_tokens
+            self.reasoning_tokens = reasoning_tokens
             
             # Store in memory
             api_usage_storage.append(self)
+            counters = usage_counters.get(user_id)
+            if counters is None:
+                counters = usage_counters[user_id] = UsageCounters()
+            counters.add(self)
+    
+    @classmethod
+    def _from_row(cls, position):
+        """Materialize the record stored at a log position (lock held)"""
+        usage = object.__new__(cls)
+        for name, value in api_usage_storage.row(position).items():
+            setattr(usage, name, value)
+        return usage
     
     @property
     def user(self):
         """Get user associated with usage"""
         return users_storage.get(self.user_id)
     
+    @property
+    def total_tokens(self):
+        """Tokens counted against plan quotas (reasoning is part of completion)"""
+        return self.prompt_tokens + self.completion_tokens
+    
+    @staticmethod
+    def _micros(start_date):
+        """Log timestamp for a query bound, or None for no bound"""
+        return to_micros(start_date) if start_date else None
+    
     @staticmethod
     def query_by_user_id(user_id, start_date=None, limit=None):
         """Query API usage by user ID"""
         with _storage_lock:
-            usage = [u for u in api_usage_storage if u.user_id == user_id]
-            if start_date:
-                usage = [u for u in usage if u.timestamp >= start_date]
-            usage.sort(key=lambda x: x.timestamp, reverse=True)
-            if limit:
-                usage = usage[:limit]
-            return usage
+            positions = api_usage_storage.latest(user_id, APIUsage._micros(start_date), limit)
+            return [APIUsage._from_row(i) for i in positions]
+    
+    @staticmethod
+    def _counted(user_id, start_date):
+        """
+        Running totals since ``start_date`` if it starts the current day or month (lock held).
+        
+        Returns None when the counters cannot answer and the log must be scanned.
+        """
+        if start_date is None or start_date.time() != datetime.min.time():
+            return None
+        counters = usage_counters.get(user_id)
+        if counters is None:
+            return [0, 0, 0, 0]
+        # Nothing is logged after the counters' day, so a window from the
+        # start of that day or month holds exactly what they counted
+        day = start_date.date()
+        return counters.for_month(day) if day.day == 1 else counters.for_day(day)
+    
+    @staticmethod
+    def _day_bounds(date):
+        """Log timestamps bounding a calendar day"""
+        start = to_micros(datetime.combine(date, datetime.min.time()))
+        return start, start + DAY_US
+    
+    @staticmethod
+    def _month_bounds(date):
+        """Log timestamps bounding the calendar month containing a date"""
+        first = date.replace(day=1)
+        following = (first + timedelta(days=32)).replace(day=1)
+        return (to_micros(datetime.combine(first, datetime.min.time())),
+                to_micros(datetime.combine(following, datetime.min.time())))
     
     @staticmethod
     def count_by_date(user_id, date):
         """Count API usage for a specific date"""
         with _storage_lock:
-            return sum(1 for u in api_usage_storage 
-                      if u.user_id == user_id and u.timestamp.date() == date)
+            counters = usage_counters.get(user_id)
+            if counters is None:
+                return 0
+            totals = counters.for_day(date)
+            if totals is not None:
+                return totals[0]
+            return api_usage_storage.count(user_id, *APIUsage._day_bounds(date))
+    
+    @staticmethod
+    def count_by_month(user_id, date):
+        """Count API usage in the calendar month containing a date"""
+        with _storage_lock:
+            counters = usage_counters.get(user_id)
+            if counters is None:
+                return 0
+            totals = counters.for_month(date)
+            if totals is not None:
+                return totals[0]
+            return api_usage_storage.count(user_id, *APIUsage._month_bounds(date))
+    
+    @staticmethod
+    def token_totals(user_id, start_date=None):
+        """Sum token usage for a user, optionally since a date"""
+        with _storage_lock:
+            counted = APIUsage._counted(user_id, start_date)
+            if counted is not None:
+                _, prompt, completion, reasoning = counted
+            else:
+                prompt, completion, reasoning = api_usage_storage.token_sums(
+                    user_id, APIUsage._micros(start_date))
+            return {'prompt': prompt, 'completion': completion, 'reasoning': reasoning,
+                    'total': prompt + completion}
     
     @staticmethod
     def count_today():
         """Count total API usage today"""
         with _storage_lock:
             today = datetime.utcnow().date()
-            return sum(1 for u in api_usage_storage if u.timestamp.date() == today)
+            return api_usage_storage.count(None, *APIUsage._day_bounds(today))
     
     @staticmethod
-    def get_daily_stats(start_date=None):
-        """Get daily API usage statistics"""
+    def get_daily_stats(start_date=None, user_id=None):
+        """Get daily API usage statistics, optionally for one user"""
         with _storage_lock:
-            from collections import defaultdict
-            stats = defaultdict(int)
-            for usage in api_usage_storage:
-                if start_date and usage.timestamp < start_date:
-                    continue
-                date = usage.timestamp.date()
-                stats[date] += 1
-            return [(date, count) for date, count in sorted(stats.items())]
+            epoch = EPOCH.date()
+            daily_counts = api_usage_storage.daily_counts(APIUsage._micros(start_date), user_id)
+            return [(epoch + timedelta(days=day), count) for day, count in daily_counts]
     
     @staticmethod
     def get_endpoint_stats(user_id, start_date=None):
         """Get endpoint statistics for a user"""
         with _storage_lock:
-            from collections import defaultdict
-            endpoint_counts = defaultdict(int)
-            endpoint_times = defaultdict(list)
-            
-            for usage in api_usage_storage:
-                if usage.user_id != user_id:
-                    continue
-                if start_date and usage.timestamp < start_date:
-                    continue
-                endpoint_counts[usage.endpoint] += 1
-                if usage.response_time:
-                    endpoint_times[usage.endpoint].append(usage.response_time)
-            
-            stats = []
-            for endpoint, count in endpoint_counts.items():
-                avg_time = sum(endpoint_times[endpoint]) / len(endpoint_times[endpoint]) if endpoint_times[endpoint] else 0
-                stats.append((endpoint, count, avg_time))
-            return stats
+            return api_usage_storage.endpoint_stats(user_id, APIUsage._micros(start_date))
     
     @staticmethod
     def get_top_users(start_date=None, limit=10):
         """Get top users by API usage"""
         with _storage_lock:
-            from collections import defaultdict
-            user_counts = defaultdict(int)
-            
-            for usage in api_usage_storage:
-                if start_date and usage.timestamp < start_date:
-                    continue
-                user_counts[usage.user_id] += 1
+            user_counts = api_usage_storage.user_counts(APIUsage._micros(start_date))
             
             top_users = []
-            for user_id, count in sorted(user_counts.items(), key=lambda x: x[1], reverse=True)[:limit]:
+            for user_id, count in sorted(user_counts.items(), key=lambda x: (-x[1], x[0]))[:limit]:
                 user = users_storage.get(user_id)
                 if user:
                     top_users.append((user.username, user.email, count))
             return top_users
     
+    @staticmethod
+    def compact(before, hourly_before=None):
+        """Fold API usage older than a date into hourly and daily rollups and free it"""
+        with _storage_lock:
+            return api_usage_storage.compact(to_micros(before), APIUsage._micros(hourly_before))
+    
+    @staticmethod
+    def storage_stats():
+        """Get raw row and rollup counts of the usage log"""
+        with _storage_lock:
+            return api_usage_storage.stats()
+    
     def __repr__(self):
         return f'<APIUsage {self.endpoint} at {self.timestamp}>'
 
@@ -0,0 +1,83 @@
+"""
+Background compaction of old API usage into rollups
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from app.models import APIUsage
+
+logger = logging.getLogger(__name__)
+
+
+class UsageCompactor:
+    """
+    Periodically folds raw API usage older than ``raw_days`` into rollups.
+
+    Hourly and daily rollups per user, API key and endpoint keep request
+    and error counts, response time sums and histograms, and tokens, so
+    usage statistics and quota counts stay complete while the raw rows are
+    freed. Hourly rollups are kept for ``hourly_days``, daily ones for
+    good. Runs on a daemon thread in each worker process.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.raw_days = 7
+        self.hourly_days = 30
+        self.interval = 3600
+        self.runs = 0
+        self.folded = 0
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure retention from application config and start the compactor thread"""
+        self.enabled = app.config.get('USAGE_COMPACTION_ENABLED', True)
+        self.raw_days = app.config.get('USAGE_RAW_RETENTION_DAYS', self.raw_days)
+        self.hourly_days = max(app.config.get('USAGE_HOURLY_RETENTION_DAYS', self.hourly_days), self.raw_days)
+        self.interval = app.config.get('USAGE_COMPACTION_INTERVAL', self.interval)
+        if self.enabled:
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='usage-compactor', daemon=True)
+                    self._thread.start()
+
+    def compact(self, now=None):
+        """Run one compaction pass and return the number of rows folded"""
+        now = now or datetime.utcnow()
+        folded = APIUsage.compact(now - timedelta(days=self.raw_days),
+                                  now - timedelta(days=self.hourly_days))
+        with self._lock:
+            self.runs += 1
+            self.folded += folded
+            self.last_run = now
+        return folded
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.enabled:
+                continue
+            try:
+                self.compact()
+            except Exception:
+                logger.exception('Usage compaction failed')
+
+    def stats(self):
+        """Return compaction counters and the size of the usage log for monitoring"""
+        with self._lock:
+            stats = {
+                'enabled': self.enabled,
+                'raw_days': self.raw_days,
+                'hourly_days': self.hourly_days,
+                'runs': self.runs,
+                'folded': self.folded,
+                'last_run': self.last_run.isoformat() if self.last_run else None
+            }
+        stats.update(APIUsage.storage_stats())
+        return stats
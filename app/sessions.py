@@ -0,0 +1,240 @@
+"""
+Server-side conversation sessions for multi-turn API clients
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+def estimate_tokens(text):
+    """Rough token count of one message: about four characters per token plus framing"""
+    return len(text) // 4 + 4 if text else 0
+
+
+def summary_prompt(summary, turns):
+    """Prompt asking the model to fold trimmed turns into the running summary"""
+    parts = ["Summarize the conversation below so it can continue without the full transcript. "
+             "Keep facts, decisions, names, numbers and open questions; drop pleasantries. "
+             "Reply with the summary only, in at most 200 words."]
+    if summary:
+        parts.append(f"Summary so far:\n{summary}")
+    parts.append('\n\n'.join(f"{role}: {content}" for role, content, _ in turns))
+    return '\n\n'.join(parts)
+
+
+class SessionBusy(Exception):
+    """Raised when a session already has a turn in progress"""
+
+
+class Session:
+    """
+    A conversation kept on the server.
+
+    Messages sent upstream always start with the same system prompt, then
+    the summary of trimmed turns, then the retained turns, so consecutive
+    requests share a long prefix that upstream prompt caches can reuse.
+    """
+
+    def __init__(self, user_id, system=None):
+        self.id = 'sess_' + secrets.token_hex(12)
+        self.user_id = user_id
+        self.system = system
+        self.summary = None  # summary of trimmed turns, if summarizing
+        self.turns = []  # [(role, content, estimated_tokens)]
+        self.trimmed = 0  # turns dropped from the context so far
+        self.created_at = datetime.utcnow()
+        self.last_active = time.monotonic()
+        self._busy = threading.Lock()
+
+    def acquire(self):
+        """
+        Start a turn; a session answers one message at a time.
+
+        Raises:
+            SessionBusy: If another turn is still in progress
+        """
+        if not self._busy.acquire(blocking=False):
+            raise SessionBusy('A message is already being answered in this session')
+
+    def release(self):
+        """End the turn started by acquire()"""
+        self._busy.release()
+
+    def context_tokens(self):
+        """Estimated prompt tokens of the system prompt, summary and retained turns"""
+        return (estimate_tokens(self.system) + estimate_tokens(self.summary)
+                + sum(tokens for _, _, tokens in self.turns))
+
+    def messages(self, content):
+        """Chat messages for the next upstream call, ending with the new user message"""
+        messages = []
+        if self.system:
+            messages.append({'role': 'system', 'content': self.system})
+        if self.summary:
+            messages.append({'role': 'system',
+                             'content': f"Summary of the earlier conversation:\n{self.summary}"})
+        messages.extend({'role': role, 'content': text} for role, text, _ in self.turns)
+        messages.append({'role': 'user', 'content': content})
+        return messages
+
+    def add_turn(self, content, response):
+        """Record a completed exchange"""
+        self.turns.append(('user', content, estimate_tokens(content)))
+        self.turns.append(('assistant', response, estimate_tokens(response)))
+
+    def to_dict(self):
+        """Serialize session state for API responses"""
+        return {
+            'id': self.id,
+            'system': self.system,
+            'summary': self.summary,
+            'messages': [{'role': role, 'content': text} for role, text, _ in self.turns],
+            'trimmed_messages': self.trimmed,
+            'context_tokens': self.context_tokens(),
+            'created_at': self.created_at.isoformat()
+        }
+
+    def __repr__(self):
+        return f'<Session {self.id} {len(self.turns)} turns>'
+
+
+class SessionStore:
+    """
+    Keeps conversations in this worker process, bounded in count and idle time.
+
+    Sessions live in an LRU: the least recently used one is evicted once
+    ``max_sessions`` is reached, and idle sessions expire after ``ttl``
+    seconds. Each session's context is kept within ``context_tokens`` by
+    compact(), so memory stays bounded as well.
+    """
+
+    def __init__(self, app=None):
+        self.max_sessions = 10000
+        self.max_per_user = 100
+        self.ttl = 3600
+        self.context_tokens = 8000
+        self.compact_ratio = 0.5
+        self.summarize = False
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # {session_id: Session}, least recently used first
+        self._per_user = {}  # {user_id: session count}
+        self._evictions = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure limits from application config"""
+        self.max_sessions = app.config.get('SESSIONS_MAX', self.max_sessions)
+        self.max_per_user = app.config.get('SESSIONS_MAX_PER_USER', self.max_per_user)
+        self.ttl = app.config.get('SESSIONS_TTL', self.ttl)
+        self.context_tokens = app.config.get('SESSIONS_CONTEXT_TOKENS', self.context_tokens)
+        self.compact_ratio = app.config.get('SESSIONS_COMPACT_RATIO', self.compact_ratio)
+        self.summarize = app.config.get('SESSIONS_SUMMARIZE', self.summarize)
+        with self._lock:
+            self._sessions.clear()
+            self._per_user.clear()
+            self._evictions = 0
+
+    def create(self, user_id, system=None):
+        """
+        Start a new session, evicting the least recently used one if full.
+
+        Raises:
+            ValueError: If the user already has too many sessions
+        """
+        session = Session(user_id, system)
+        with self._lock:
+            self._purge_expired()
+            if self._per_user.get(user_id, 0) >= self.max_per_user:
+                raise ValueError(f'You can only have up to {self.max_per_user} sessions')
+            while self._sessions and len(self._sessions) >= self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self._evictions += 1
+            self._sessions[session.id] = session
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return session
+
+    def get(self, session_id, user_id=None):
+        """Return a session by ID, optionally restricted to its owner, and mark it used"""
+        with self._lock:
+            self._purge_expired()
+            session = self._sessions.get(session_id)
+            if session is None or (user_id is not None and session.user_id != user_id):
+                return None
+            session.last_active = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session):
+        """Forget a session"""
+        with self._lock:
+            if session.id in self._sessions:
+                self._remove(session.id)
+
+    def fits(self, session, content):
+        """Check that the system prompt and one message fit the context budget at all"""
+        return estimate_tokens(session.system) + estimate_tokens(content) <= self.context_tokens
+
+    def compact(self, session, content, summarize=None):
+        """
+        Drop the oldest turns so the next call fits the context budget.
+
+        Once the budget would be exceeded, whole exchanges are trimmed until
+        the context is down to ``compact_ratio`` of it. Trimming in large
+        steps keeps the prefix unchanged for the following turns. When
+        ``summarize(summary, turns)`` is given, it returns the new summary
+        of the trimmed turns; if it raises, the turns are trimmed unsummarized.
+
+        Returns the number of turns dropped.
+        """
+        needed = session.context_tokens() + estimate_tokens(content)
+        if needed <= self.context_tokens:
+            return 0
+        target = self.context_tokens * self.compact_ratio
+        dropped = 0
+        while dropped < len(session.turns) and needed > target:
+            # An exchange is a user turn and the assistant reply that follows
+            for _ in range(2):
+                if dropped < len(session.turns):
+                    needed -= session.turns[dropped][2]
+                    dropped += 1
+        trimmed, session.turns = session.turns[:dropped], session.turns[dropped:]
+        session.trimmed += dropped
+        if summarize is not None and trimmed:
+            try:
+                session.summary = summarize(session.summary, trimmed) or session.summary
+            except Exception:
+                pass
+        return dropped
+
+    def _remove(self, session_id):
+        """Remove a session (lock held)"""
+        session = self._sessions.pop(session_id)
+        count = self._per_user[session.user_id] - 1
+        if count:
+            self._per_user[session.user_id] = count
+        else:
+            del self._per_user[session.user_id]
+
+    def _purge_expired(self):
+        """Drop idle sessions past the TTL, oldest first (lock held)"""
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_active > cutoff:
+                break
+            self._remove(session.id)
+
+    def stats(self):
+        """Return session counters for monitoring"""
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'evictions': self._evictions,
+                'context_tokens': self.context_tokens,
+                'summarize': self.summarize
+            }
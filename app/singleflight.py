@@ -0,0 +1,154 @@
+"""
+Single-flight coalescing of identical in-flight upstream requests
+"""
+import threading
+
+
+class Flight:
+    """
+    One upstream generation shared by every caller that asked for it.
+
+    Deltas are kept in arrival order so late joiners replay what they
+    missed before following the live stream. ``usage`` holds the token
+    usage of the generation once it has finished, if upstream reported it.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._done = False
+        self._error = None
+        self.waiters = 1
+        self.usage = None
+
+    def publish(self, delta):
+        """Append a delta and wake all waiters"""
+        with self._cond:
+            self._chunks.append(delta)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        """Mark the generation complete, optionally with an error"""
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def iter_deltas(self):
+        """Yield every delta of the generation, blocking until each arrives"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._chunks) and not self._done:
+                    self._cond.wait()
+                new_chunks = self._chunks[index:]
+                done, error = self._done, self._error
+            index += len(new_chunks)
+            yield from new_chunks
+            if done and index >= len(self._chunks):
+                if error is not None:
+                    raise error
+                return
+
+    def result(self, timeout=None):
+        """Wait for the generation to finish and return the full text"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._done, timeout):
+                raise TimeoutError('Timed out waiting for shared upstream request')
+            if self._error is not None:
+                raise self._error
+            return ''.join(self._chunks)
+
+
+class SingleFlight:
+    """
+    Group of in-flight upstream generations keyed like agent queries.
+
+    The first caller for a key starts the generation on a background
+    thread; concurrent callers with the same key join that flight instead
+    of starting their own. Running the producer off the request thread
+    means a disconnecting client never cancels the answer for the others.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._flights = {}  # {key: Flight}
+        self._leaders = 0
+        self._coalesced = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure coalescing from application config"""
+        self.enabled = app.config.get('SINGLE_FLIGHT_ENABLED', True)
+
+    def join(self, key, produce, admit=None):
+        """
+        Return the flight for a key, starting ``produce`` if none is running.
+
+        ``produce`` is a callable returning an iterable of deltas; if it is a
+        generator, its return value is kept as the flight's ``usage``. ``admit``
+        is called on the request thread before a new flight starts; if it
+        raises, the flight fails with that error and the error is re-raised.
+        When coalescing is disabled every call starts its own flight.
+        """
+        with self._lock:
+            if self.enabled:
+                flight = self._flights.get(key)
+                if flight is not None:
+                    flight.waiters += 1
+                    self._coalesced += 1
+                    return flight
+            flight = Flight()
+            if self.enabled:
+                self._flights[key] = flight
+            self._leaders += 1
+
+        if admit is not None:
+            try:
+                admit()
+            except Exception as e:
+                self._unregister(key, flight)
+                flight.finish(e)
+                raise
+
+        thread = threading.Thread(target=self._run, args=(key, flight, produce), daemon=True)
+        thread.start()
+        return flight
+
+    def _unregister(self, key, flight):
+        """Stop routing new callers to a flight"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _run(self, key, flight, produce):
+        """Drive a producer to completion and publish its deltas"""
+        error = None
+        try:
+            deltas = iter(produce())
+            while True:
+                try:
+                    delta = next(deltas)
+                except StopIteration as stop:
+                    flight.usage = stop.value
+                    break
+                flight.publish(delta)
+        except Exception as e:
+            error = e
+        finally:
+            # Unregister before finishing so new callers start a fresh flight
+            self._unregister(key, flight)
+            flight.finish(error)
+
+    def stats(self):
+        """Return coalescing counters for monitoring"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_flight': len(self._flights),
+                'leaders': self._leaders,
+                'coalesced': self._coalesced
+            }
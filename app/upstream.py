@@ -0,0 +1,124 @@
+"""
+Shared access to the upstream model for request handlers
+"""
+import time
+from flask import current_app, request
+from app import response_cache, single_flight, admission
+from app.cache import cache_bypass_requested
+
+
+def request_deadline():
+    """
+    Deadline, as a ``time.monotonic()`` value, for upstream calls made by the current request.
+
+    The budget is ``API_REQUEST_TIMEOUT``, shortened when the client sends
+    a smaller ``X-Request-Timeout`` in seconds.
+    """
+    budget = current_app.config['API_REQUEST_TIMEOUT']
+    requested = request.headers.get('X-Request-Timeout', type=float)
+    if requested is not None and requested > 0:
+        budget = min(budget, requested)
+    return time.monotonic() + budget
+
+
+def _producer(agent, prompt, cache_key=None):
+    """
+    Build a callable that streams one upstream generation.
+
+    The generation holds an admission slot, released with its latency and
+    outcome when it ends; a complete answer is cached under ``cache_key``.
+    The generator returns the upstream token usage.
+    """
+    def produce():
+        start_time = time.monotonic()
+        failed = True
+        try:
+            chunks = []
+            for delta in agent.stream(prompt):
+                chunks.append(delta)
+                yield delta
+            failed = False
+        finally:
+            admission.release(time.monotonic() - start_time, failed)
+        if cache_key is not None:
+            response_cache.set(cache_key, ''.join(chunks))
+        return agent.last_usage
+    return produce
+
+
+def _follow(flight, agent):
+    """Yield a flight's deltas, then hand its token usage to the caller's agent"""
+    yield from flight.iter_deltas()
+    agent.last_usage = flight.usage
+
+
+def _prepare(agent, prompt, bypass_cache=None):
+    """
+    Look the prompt up in the response cache.
+
+    ``bypass_cache`` defaults to the current request's opt-out; pass it
+    explicitly when running outside a request context.
+
+    Returns ``(key, cached, cache_key, status)``: the request key, a cached
+    answer or None, the key to store a fresh answer under (None if it must
+    not be stored) and the ``X-Cache`` status.
+    """
+    key = response_cache.make_key(agent.model, prompt)
+    if not response_cache.enabled:
+        return key, None, None, None
+    if bypass_cache is None:
+        bypass_cache = cache_bypass_requested()
+    if bypass_cache:
+        return key, None, None, 'BYPASS'
+    cached = response_cache.get(key)
+    if cached is not None:
+        return key, cached, None, 'HIT'
+    return key, None, key, 'MISS'
+
+
+def stream_agent(agent, prompt, bypass_cache=None):
+    """
+    Stream an answer from cache, a shared in-flight generation or upstream.
+
+    Returns ``(deltas, cache_status)``. Identical concurrent requests share
+    one upstream generation; each caller still receives every delta, and
+    ``agent.last_usage`` is set to the generation's token usage once the
+    deltas are exhausted. Cache hits use no upstream tokens and leave it None.
+
+    Raises:
+        UpstreamUnavailable: If admission control sheds the request or the
+            circuit breaker of every provider is open
+    """
+    agent.last_usage = None
+    key, cached, cache_key, status = _prepare(agent, prompt, bypass_cache)
+    if cached is not None:
+        return iter([cached]), status
+
+    agent.providers.check()
+
+    flight = single_flight.join(key, _producer(agent, prompt, cache_key), admit=admission.acquire)
+    return _follow(flight, agent), status
+
+
+def query_agent(agent, prompt, bypass_cache=None):
+    """
+    Return a complete answer from cache, a shared in-flight generation or upstream.
+
+    Returns ``(response, cache_status)`` and sets ``agent.last_usage`` as
+    stream_agent does. Upstream failures are raised.
+
+    Raises:
+        UpstreamUnavailable: If admission control sheds the request or the
+            circuit breaker of every provider is open
+    """
+    agent.last_usage = None
+    key, cached, cache_key, status = _prepare(agent, prompt, bypass_cache)
+    if cached is not None:
+        return cached, status
+
+    agent.providers.check()
+
+    flight = single_flight.join(key, _producer(agent, prompt, cache_key), admit=admission.acquire)
+    response = flight.result()
+    agent.last_usage = flight.usage
+    return response, status
@@ -0,0 +1,626 @@
+"""
+Columnar, append-only storage for API usage records
+"""
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import datetime, timedelta
+
+try:
+    import numpy
+except ImportError:  # Optional: pip install numpy for vectorized aggregation
+    numpy = None
+
+EPOCH = datetime(1970, 1, 1)
+HOUR_US = 3600 * 1000000
+DAY_US = 24 * HOUR_US
+# Upper bounds (seconds) of the response time histogram buckets; one more bucket holds the rest
+LATENCY_BOUNDS = (0.25, 0.5, 1, 2, 5, 10, 30, 60)
+_NAN = float('nan')
+_NO_POSITIONS = array('I')
+
+
+def to_micros(timestamp):
+    """Microseconds since the epoch of a naive UTC datetime"""
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_micros(micros):
+    """Naive UTC datetime of microseconds since the epoch"""
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class Rollup:
+    """
+    Aggregate of the usage rows of one user, API key and endpoint over an hour or a day.
+
+    ``timed`` rows had a response time, which ``latency_sum`` and the
+    ``histogram`` (bucketed by LATENCY_BOUNDS) cover; errors are rows
+    with a 4xx or 5xx status.
+    """
+
+    __slots__ = ('count', 'errors', 'timed', 'latency_sum', 'histogram',
+                 'prompt_tokens', 'completion_tokens', 'reasoning_tokens')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timed = 0
+        self.latency_sum = 0.0
+        self.histogram = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reasoning_tokens = 0
+
+    def add_row(self, status_code, response_time, prompt_tokens, completion_tokens, reasoning_tokens):
+        """Count one raw row (response_time NaN or 0 when there was none)"""
+        self.count += 1
+        if status_code >= 400:
+            self.errors += 1
+        if response_time and response_time == response_time:
+            self.timed += 1
+            self.latency_sum += response_time
+            self.histogram[bisect_left(LATENCY_BOUNDS, response_time)] += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.reasoning_tokens += reasoning_tokens
+
+    def merge(self, other):
+        """Add another rollup's totals to this one"""
+        self.count += other.count
+        self.errors += other.errors
+        self.timed += other.timed
+        self.latency_sum += other.latency_sum
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.reasoning_tokens += other.reasoning_tokens
+        return self
+
+
+class _RollupTier:
+    """Rollups bucketed by a fixed period: {bucket start: {user_id: {(api_key_id, endpoint code): Rollup}}}"""
+
+    def __init__(self, size):
+        self.size = size
+        self.buckets = {}
+        self.starts = array('q')  # bucket starts, ascending
+        self.entries = 0
+
+    def add(self, bucket, user_id, group, rollup):
+        """Merge a rollup into its bucket, taking ownership of it if it is the first of its group"""
+        users = self.buckets.get(bucket)
+        if users is None:
+            users = self.buckets[bucket] = {}
+            insort(self.starts, bucket)
+        groups = users.setdefault(user_id, {})
+        existing = groups.get(group)
+        if existing is None:
+            groups[group] = rollup
+            self.entries += 1
+        else:
+            existing.merge(rollup)
+
+    def select(self, user_id, start, end):
+        """(bucket start, user_id, group, Rollup) for buckets overlapping start/end"""
+        starts = self.starts
+        lo = 0 if start is None else bisect_right(starts, start - self.size)
+        hi = len(starts) if end is None else bisect_left(starts, end)
+        for bucket in starts[lo:hi]:
+            users = self.buckets[bucket]
+            if user_id is not None:
+                users = {user_id: users[user_id]} if user_id in users else {}
+            for uid, groups in users.items():
+                for group, rollup in groups.items():
+                    yield bucket, uid, group, rollup
+
+    def prune(self, before):
+        """Drop the buckets starting before ``before``"""
+        i = bisect_left(self.starts, before)
+        for bucket in self.starts[:i]:
+            self.entries -= sum(len(groups) for groups in self.buckets.pop(bucket).values())
+        del self.starts[:i]
+
+
+class UsageLog:
+    """
+    Struct-of-arrays store for usage records.
+
+    Every field lives in its own typed array, so a row costs about 45 bytes
+    instead of a Python object with a datetime and several strings.
+    Timestamps are epoch microseconds; endpoint and method strings are
+    interned to small integer codes. Missing ids and status codes are
+    stored as 0, missing times as NaN. Aggregations run on NumPy views of
+    the arrays when NumPy is installed, and on plain loops otherwise.
+
+    Each user also has an index of their row positions in time order, so
+    a date range is two binary searches and the latest rows a reverse
+    slice, whatever the size of the log. Across users, the time rank of
+    the first row of every day is kept; a window starts at its first row,
+    rows per day are differences of offsets, and counting a day is a
+    subtraction.
+
+    ``compact`` folds old rows into hourly and daily rollups and frees
+    them. Counts, token sums and statistics add the rollups overlapping a
+    window to the raw rows in it, so they resolve rolled-up periods to the
+    hour (to the day once hourly rollups are pruned); listings only see
+    the raw rows.
+
+    Not thread-safe; callers hold the storage lock.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Drop every row and rollup"""
+        self.ids = array('I')
+        self.timestamps = array('q')
+        self.user_ids = array('I')
+        self.api_key_ids = array('I')
+        self.endpoints = array('H')
+        self.methods = array('B')
+        self.status_codes = array('H')
+        self.response_times = array('f')
+        self.time_to_first_tokens = array('f')
+        self.prompt_tokens = array('I')
+        self.completion_tokens = array('I')
+        self.reasoning_tokens = array('I')
+        self._endpoint_names = [None]  # code 0 is None
+        self._endpoint_codes = {None: 0}
+        self._method_names = [None]
+        self._method_codes = {None: 0}
+        self._hourly = _RollupTier(HOUR_US)
+        self._daily = _RollupTier(DAY_US)
+        self._hourly_floor = None  # hourly rollups before this were pruned
+        self._reset_indexes()
+
+    def _reset_indexes(self):
+        self._by_user = {}  # {user_id: array of logical positions in time order}
+        # Compaction frees rows from the front; the user index stores
+        # positions plus the number of rows freed so it need not be rewritten
+        self._base = 0
+        # Rows are appended in time order, so positions are time ranks until a
+        # backfilled row arrives; from then on this maps ranks to positions
+        self._time_order = None
+        self._days = array('q')  # every day with rows, ascending
+        self._day_offsets = array('q')  # time rank of each day's first row
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def nbytes(self):
+        """Bytes held by the column arrays and the indexes"""
+        columns = self._columns() + tuple(self._by_user.values()) + (self._days, self._day_offsets)
+        if self._time_order is not None:
+            columns += (self._time_order,)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def stats(self):
+        """Raw row and rollup counts for monitoring"""
+        return {
+            'rows': len(self),
+            'bytes': self.nbytes(),
+            'hourly_rollups': self._hourly.entries,
+            'daily_rollups': self._daily.entries
+        }
+
+    def _columns(self):
+        return (self.ids, self.timestamps, self.user_ids, self.api_key_ids, self.endpoints,
+                self.methods, self.status_codes, self.response_times, self.time_to_first_tokens,
+                self.prompt_tokens, self.completion_tokens, self.reasoning_tokens)
+
+    @staticmethod
+    def _intern(value, codes, names):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def append(self, usage):
+        """Store the fields of an APIUsage and return its position"""
+        self.ids.append(usage.id)
+        self.timestamps.append(to_micros(usage.timestamp))
+        self.user_ids.append(usage.user_id)
+        self.api_key_ids.append(usage.api_key_id or 0)
+        self.endpoints.append(self._intern(usage.endpoint, self._endpoint_codes, self._endpoint_names))
+        self.methods.append(self._intern(usage.method, self._method_codes, self._method_names))
+        self.status_codes.append(usage.status_code or 0)
+        self.response_times.append(_NAN if usage.response_time is None else usage.response_time)
+        self.time_to_first_tokens.append(_NAN if usage.time_to_first_token is None
+                                         else usage.time_to_first_token)
+        self.prompt_tokens.append(usage.prompt_tokens or 0)
+        self.completion_tokens.append(usage.completion_tokens or 0)
+        self.reasoning_tokens.append(usage.reasoning_tokens or 0)
+        position = len(self.timestamps) - 1
+        self._index(position)
+        return position
+
+    def _index(self, position):
+        self._index_time(position)
+        self._index_user(self.user_ids[position], position)
+
+    def _index_time(self, position):
+        micros = self.timestamps[position]
+        day = micros // DAY_US
+        if self._time_order is None and (position == 0 or self.timestamps[position - 1] <= micros):
+            if not self._days or self._days[-1] < day:
+                self._days.append(day)
+                self._day_offsets.append(position)
+            return
+        if self._time_order is None:
+            self._time_order = array('I', range(position))
+        # Rank the row after every row not later than it, and move the
+        # offsets of the days after it along by one
+        rank = self._rank(micros, right=True)
+        self._time_order.insert(rank, position)
+        i = bisect_left(self._days, day)
+        if i == len(self._days) or self._days[i] != day:
+            self._days.insert(i, day)
+            self._day_offsets.insert(i, rank)
+        for j in range(i + 1, len(self._days)):
+            self._day_offsets[j] += 1
+
+    def _index_user(self, user_id, position):
+        index = self._by_user.get(user_id)
+        if index is None:
+            index = self._by_user[user_id] = array('I')
+        micros = self.timestamps[position]
+        if not index or self.timestamps[index[-1] - self._base] <= micros:
+            index.append(position + self._base)
+        else:
+            # Backfilled record: insert it where it belongs in time
+            index.insert(self._bisect(index, micros, right=True), position + self._base)
+
+    def row(self, position):
+        """Decoded fields of one row, as APIUsage keyword arguments"""
+        response_time = self.response_times[position]
+        time_to_first_token = self.time_to_first_tokens[position]
+        return {
+            'id': self.ids[position],
+            'user_id': self.user_ids[position],
+            'api_key_id': self.api_key_ids[position] or None,
+            'endpoint': self._endpoint_names[self.endpoints[position]],
+            'method': self._method_names[self.methods[position]],
+            'status_code': self.status_codes[position] or None,
+            'timestamp': from_micros(self.timestamps[position]),
+            'response_time': None if response_time != response_time else response_time,
+            'time_to_first_token': None if time_to_first_token != time_to_first_token else time_to_first_token,
+            'prompt_tokens': self.prompt_tokens[position],
+            'completion_tokens': self.completion_tokens[position],
+            'reasoning_tokens': self.reasoning_tokens[position]
+        }
+
+    # Compaction
+
+    def compact(self, before, hourly_before=None):
+        """
+        Fold the rows older than ``before`` into hourly and daily rollups and free them.
+
+        Hourly rollups of days before ``hourly_before`` are dropped; the
+        daily ones keep those days. Returns the number of rows folded.
+        """
+        folded = self._rank(before)
+        if folded:
+            if self._time_order is None:
+                self._fold(slice(0, folded) if numpy is not None else range(folded))
+                self._drop_front(folded)
+            else:
+                old = self._time_order[:folded]
+                self._fold(self._view(old) if numpy is not None else old)
+                self._rewrite(self._time_order[folded:])
+        if hourly_before is not None:
+            floor = hourly_before // DAY_US * DAY_US
+            if self._hourly_floor is None or floor > self._hourly_floor:
+                self._hourly.prune(floor)
+                self._hourly_floor = floor
+        return folded
+
+    def _fold(self, selected):
+        """Add the selected rows to the rollups"""
+        for tier, size in ((self._hourly, HOUR_US), (self._daily, DAY_US)):
+            groups = self._group(selected, size) if numpy is not None else self._group_loop(selected, size)
+            for (bucket, user_id, api_key_id, endpoint), rollup in groups.items():
+                if tier is self._hourly and self._hourly_floor is not None and bucket < self._hourly_floor:
+                    continue
+                tier.add(bucket, user_id, (api_key_id, endpoint), rollup)
+
+    def _group_loop(self, positions, size):
+        """{(bucket start, user_id, api_key_id, endpoint code): Rollup} of the rows at ``positions``"""
+        groups = {}
+        for i in positions:
+            key = (self.timestamps[i] // size * size, self.user_ids[i], self.api_key_ids[i], self.endpoints[i])
+            rollup = groups.get(key)
+            if rollup is None:
+                rollup = groups[key] = Rollup()
+            rollup.add_row(self.status_codes[i], self.response_times[i], self.prompt_tokens[i],
+                           self.completion_tokens[i], self.reasoning_tokens[i])
+        return groups
+
+    def _group(self, selector, size):
+        """Vectorized ``_group_loop`` over a NumPy selector"""
+        column = lambda c: self._view(c)[selector]
+        # Pack (bucket, user, key, endpoint) into one integer per row, so
+        # grouping is a one-dimensional unique
+        pairs, pair_codes = numpy.unique((column(self.user_ids).astype(numpy.int64) << 32)
+                                         | column(self.api_key_ids), return_inverse=True)
+        endpoints = len(self._endpoint_names)
+        buckets = column(self.timestamps) // size
+        first = int(buckets.min())
+        packed = ((buckets - first) * len(pairs) + pair_codes.reshape(-1)) * endpoints + column(self.endpoints)
+        keys, inverse = numpy.unique(packed, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        count = len(keys)
+
+        times = column(self.response_times).astype(numpy.float64)
+        timed = ~numpy.isnan(times) & (times != 0)
+        slots = len(LATENCY_BOUNDS) + 1
+        histograms = numpy.bincount(inverse[timed] * slots + numpy.searchsorted(LATENCY_BOUNDS, times[timed]),
+                                    minlength=count * slots).reshape(count, slots)
+        pair_of = (keys // endpoints) % len(pairs)
+        key_columns = zip(((keys // endpoints // len(pairs) + first) * size).tolist(),
+                          (pairs[pair_of] >> 32).tolist(), (pairs[pair_of] & 0xFFFFFFFF).tolist(),
+                          (keys % endpoints).tolist())
+        totals = zip(
+            numpy.bincount(inverse, minlength=count).tolist(),
+            numpy.bincount(inverse, weights=column(self.status_codes) >= 400, minlength=count).tolist(),
+            numpy.bincount(inverse[timed], minlength=count).tolist(),
+            numpy.bincount(inverse[timed], weights=times[timed], minlength=count).tolist(),
+            histograms.tolist(),
+            *(numpy.bincount(inverse, weights=column(c), minlength=count).tolist()
+              for c in (self.prompt_tokens, self.completion_tokens, self.reasoning_tokens)))
+        groups = {}
+        for key, (rows, errors, timed_rows, latency_sum, histogram, prompt, completion, reasoning) \
+                in zip(key_columns, totals):
+            rollup = groups[key] = Rollup()
+            rollup.count, rollup.errors, rollup.timed = rows, int(errors), timed_rows
+            rollup.latency_sum, rollup.histogram = latency_sum, histogram
+            rollup.prompt_tokens, rollup.completion_tokens = int(prompt), int(completion)
+            rollup.reasoning_tokens = int(reasoning)
+        return groups
+
+    def _drop_front(self, count):
+        """Free the first ``count`` rows of a log in time order"""
+        for column in self._columns():
+            del column[:count]
+        if not len(self):
+            self._reset_indexes()
+            return
+        # Keep the days from the one holding the first remaining row
+        i = bisect_right(self._day_offsets, count) - 1
+        del self._days[:i]
+        del self._day_offsets[:i]
+        for j in range(len(self._day_offsets)):
+            self._day_offsets[j] = max(self._day_offsets[j] - count, 0)
+        self._base += count
+        for user_id, index in list(self._by_user.items()):
+            # In a log in time order, each user's positions ascend
+            del index[:bisect_left(index, self._base)]
+            if not index:
+                del self._by_user[user_id]
+        if self._base > 2 ** 31:
+            self._rebase()
+
+    def _rebase(self):
+        """Store plain positions in the user index again before they outgrow it"""
+        for user_id, index in self._by_user.items():
+            if numpy is not None:
+                self._view(index)[:] -= self._base
+            else:
+                self._by_user[user_id] = array('I', (p - self._base for p in index))
+        self._base = 0
+
+    def _rewrite(self, kept):
+        """Keep only the rows at ``kept`` positions, in that order, and index them again"""
+        for column in self._columns():
+            if numpy is not None:
+                column[:] = array(column.typecode, self._view(column)[self._view(kept)].tobytes())
+            else:
+                column[:] = array(column.typecode, (column[i] for i in kept))
+        self._reset_indexes()
+        for position in range(len(self)):
+            self._index(position)
+
+    # Selection: ``user_id`` None means every user, ``start``/``end`` are
+    # epoch microseconds (inclusive/exclusive) or None for no bound
+
+    def _ranked(self):
+        return len(self._time_order) if self._time_order is not None else len(self.timestamps)
+
+    def _rank(self, micros, right=False):
+        """Number of rows earlier than a timestamp (or not later, if right)"""
+        days = self._days
+        day = micros // DAY_US
+        i = bisect_left(days, day)
+        if i == len(days):
+            return self._ranked()
+        lo = self._day_offsets[i]
+        if days[i] > day or (micros == day * DAY_US and not right):
+            return lo  # a day boundary
+        hi = self._day_offsets[i + 1] if i + 1 < len(days) else self._ranked()
+        timestamps, order = self.timestamps, self._time_order
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = timestamps[mid if order is None else order[mid]]
+            if t < micros or (right and t == micros):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _time_span(self, start, end):
+        """[lo, hi) time ranks of the rows within start/end"""
+        lo = 0 if start is None else self._rank(start)
+        hi = self._ranked() if end is None else self._rank(end)
+        return lo, max(lo, hi)
+
+    def _bisect(self, index, micros, right=False):
+        """Place of a timestamp in a user index (first >=, or first > if right)"""
+        timestamps, base = self.timestamps, self._base
+        lo, hi = 0, len(index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = timestamps[index[mid] - base]
+            if t < micros or (right and t == micros):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _user_span(self, user_id, start, end):
+        """A user's index of logical positions and the [lo, hi) slice of it within start/end"""
+        index = self._by_user.get(user_id, _NO_POSITIONS)
+        lo = 0 if start is None else self._bisect(index, start)
+        hi = len(index) if end is None else self._bisect(index, end)
+        return index, lo, max(lo, hi)
+
+    def _selector(self, user_id, start, end):
+        """
+        NumPy selector of rows: a slice of positions while the log is in time
+        order, otherwise the positions from the time or user index
+        """
+        if user_id is not None:
+            index, lo, hi = self._user_span(user_id, start, end)
+            if not index:
+                return numpy.empty(0, dtype=numpy.intp)
+            positions = self._view(index)[lo:hi]
+            return positions - self._base if self._base else positions
+        lo, hi = self._time_span(start, end)
+        if self._time_order is None:
+            return slice(lo, hi)
+        return self._view(self._time_order)[lo:hi]
+
+    @staticmethod
+    def _view(column):
+        return numpy.frombuffer(column, dtype=column.typecode)
+
+    def _rollups(self, user_id=None, start=None, end=None):
+        """(bucket start, user_id, (api_key_id, endpoint code), Rollup) overlapping start/end"""
+        # Whole days come from the daily rollups, the partial days at the
+        # edges of the window from the hourly ones where they are kept
+        first_day = None if start is None else -(-start // DAY_US) * DAY_US
+        last_day = None if end is None else end // DAY_US * DAY_US
+        if first_day is not None and last_day is not None and first_day >= last_day:
+            edges = ((start, end),)
+        else:
+            yield from self._daily.select(user_id, first_day, last_day)
+            edges = ((start, first_day), (last_day, end))
+        floor = self._hourly_floor
+        for edge_start, edge_end in edges:
+            if edge_start is None or edge_end is None or edge_start >= edge_end:
+                continue
+            if floor is not None and edge_start < floor:
+                yield from self._daily.select(user_id, edge_start, min(edge_end, floor))
+                edge_start = max(edge_start, floor)
+            if edge_start < edge_end:
+                yield from self._hourly.select(user_id, edge_start, edge_end)
+
+    def positions(self, user_id=None, start=None, end=None):
+        """Positions of the selected raw rows, in time order"""
+        if user_id is not None:
+            index, lo, hi = self._user_span(user_id, start, end)
+            base = self._base
+            return [p - base for p in index[lo:hi]]
+        lo, hi = self._time_span(start, end)
+        if self._time_order is None:
+            return list(range(lo, hi))
+        return self._time_order[lo:hi].tolist()
+
+    def latest(self, user_id, start=None, limit=None):
+        """Positions of a user's raw rows since ``start``, newest first, at most ``limit``"""
+        index, lo, hi = self._user_span(user_id, start, None)
+        if limit:
+            lo = max(lo, hi - limit)
+        base = self._base
+        return [p - base for p in reversed(index[lo:hi])]
+
+    def count(self, user_id=None, start=None, end=None):
+        """Number of selected rows"""
+        if user_id is not None:
+            _, lo, hi = self._user_span(user_id, start, end)
+        else:
+            lo, hi = self._time_span(start, end)
+        return hi - lo + sum(r.count for _, _, _, r in self._rollups(user_id, start, end))
+
+    def token_sums(self, user_id=None, start=None, end=None):
+        """(prompt, completion, reasoning) token sums of the selected rows"""
+        columns = (self.prompt_tokens, self.completion_tokens, self.reasoning_tokens)
+        if numpy is not None and len(self):
+            selector = self._selector(user_id, start, end)
+            sums = [int(self._view(c)[selector].sum(dtype=numpy.int64)) for c in columns]
+        else:
+            selected = self.positions(user_id, start, end)
+            sums = [sum(column[i] for i in selected) for column in columns]
+        for _, _, _, rollup in self._rollups(user_id, start, end):
+            sums[0] += rollup.prompt_tokens
+            sums[1] += rollup.completion_tokens
+            sums[2] += rollup.reasoning_tokens
+        return tuple(sums)
+
+    def daily_counts(self, start=None, user_id=None):
+        """[(day number since the epoch, rows)] for rows since ``start``, by day"""
+        if user_id is None:
+            # Differences of the day offsets; rows are never visited
+            lo = 0 if start is None else self._rank(start)
+            days, offsets, ranked = self._days, self._day_offsets, self._ranked()
+            counts = Counter()
+            for i in range(max(bisect_left(offsets, lo + 1) - 1, 0), len(days)):
+                end = offsets[i + 1] if i + 1 < len(days) else ranked
+                if end > lo:
+                    counts[days[i]] = end - max(offsets[i], lo)
+        elif numpy is not None and len(self):
+            timestamps = self._view(self.timestamps)[self._selector(user_id, start, None)]
+            days, day_counts = numpy.unique(timestamps // DAY_US, return_counts=True)
+            counts = Counter(dict(zip(days.tolist(), day_counts.tolist())))
+        else:
+            timestamps = self.timestamps
+            counts = Counter(timestamps[i] // DAY_US for i in self.positions(user_id, start))
+        for bucket, _, _, rollup in self._rollups(user_id, start):
+            counts[bucket // DAY_US] += rollup.count
+        return sorted(counts.items())
+
+    def endpoint_stats(self, user_id, start=None):
+        """[(endpoint, rows, average response time)] for a user's rows since ``start``"""
+        counts, time_counts, time_sums = Counter(), Counter(), Counter()
+        if numpy is not None and len(self):
+            selector = self._selector(user_id, start, None)
+            endpoints = self._view(self.endpoints)[selector]
+            times = self._view(self.response_times)[selector].astype(numpy.float64)
+            timed = ~numpy.isnan(times) & (times != 0)  # like a truthiness test
+            size = len(self._endpoint_names)
+            raw_counts = numpy.bincount(endpoints, minlength=size)
+            raw_time_counts = numpy.bincount(endpoints[timed], minlength=size)
+            raw_time_sums = numpy.bincount(endpoints[timed], weights=times[timed], minlength=size)
+            for code in numpy.flatnonzero(raw_counts).tolist():
+                counts[code] = int(raw_counts[code])
+                time_counts[code] = int(raw_time_counts[code])
+                time_sums[code] = float(raw_time_sums[code])
+        else:
+            for i in self.positions(user_id, start):
+                code = self.endpoints[i]
+                counts[code] += 1
+                response_time = self.response_times[i]
+                if response_time and response_time == response_time:
+                    time_counts[code] += 1
+                    time_sums[code] += response_time
+        for _, _, (_, code), rollup in self._rollups(user_id, start):
+            counts[code] += rollup.count
+            time_counts[code] += rollup.timed
+            time_sums[code] += rollup.latency_sum
+        return [(self._endpoint_names[code], count,
+                 time_sums[code] / time_counts[code] if time_counts[code] else 0)
+                for code, count in counts.items()]
+
+    def user_counts(self, start=None):
+        """{user_id: rows} for rows since ``start``"""
+        if numpy is not None and len(self):
+            users = numpy.bincount(self._view(self.user_ids)[self._selector(None, start, None)])
+            counts = Counter({user_id: int(users[user_id]) for user_id in numpy.flatnonzero(users).tolist()})
+        else:
+            users = self.user_ids
+            counts = Counter(users[i] for i in self.positions(None, start))
+        for _, user_id, _, rollup in self._rollups(None, start):
+            counts[user_id] += rollup.count
+        return counts
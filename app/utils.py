@@ -1,6 +1,7 @@
 """
 Utility classes and functions for the application
 """
+import fast_json
 
 
 class Pagination:
@@ -16,3 +17,26 @@ class Pagination:
         self.has_next = page < self.pages
         self.prev_num = page - 1 if self.has_prev else None
         self.next_num = page + 1 if self.has_next else None
+
+
+def sse_event(data):
+    """Format a JSON-serializable payload as one Server-Sent Events message"""
+    return f"data: {fast_json.dumps(data)}\n\n"
+
+
+SSE_DONE = "data: [DONE]\n\n"
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # Disable proxy buffering so deltas flush immediately
+}
+
+
+def token_fields(tokens):
+    """APIUsage keyword arguments for a TokenUsage, or none if unknown"""
+    return tokens._asdict() if tokens else {}
+
+
+def tokens_dict(tokens):
+    """Token counts of a TokenUsage for API responses, or None if unknown"""
+    return tokens.to_dict() if tokens else None
@@ -5,96 +5,1295 @@ Uses DeepSeek-R1 for intelligent task parsing and execution
 """
 
 import requests as r
+import argparse
+import asyncio
+import itertools
 import json
+import os
+import queue
+import random
 import sys
-from typing import Optional, Dict, Any
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
+from requests.adapters import HTTPAdapter
+from sse import CONTENT, ConsoleSink, aiter_deltas, drain, iter_deltas
 
+try:
+    import httpx
+except ImportError:  # Only needed by AsyncAutonomousAgent
+    httpx = None
 
-class AutonomousAgent:
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised when the upstream model cannot take a request right now.
+    
+    ``retry_after`` is a hint, in seconds, for when to try again.
+    """
+    
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Raised when an upstream call cannot finish before its deadline."""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that is failing or too slow.
+    
+    While closed, the outcomes of the last ``window`` calls are kept; once
+    at least ``min_calls`` are in and either the failure ratio reaches
+    ``failure_ratio`` or the share of calls slower than
+    ``slow_call_duration`` reaches ``slow_call_ratio``, the breaker opens.
+    Open, it rejects every call for ``open_duration`` seconds, then goes
+    half-open and lets ``half_open_calls`` probes through: a good probe
+    closes it again, a bad one reopens it.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, enabled: bool = True, window: int = 20, min_calls: int = 10,
+                 failure_ratio: float = 0.5, slow_call_duration: float = 30.0,
+                 slow_call_ratio: float = 0.8, open_duration: float = 30.0,
+                 half_open_calls: int = 1):
+        self.enabled = enabled
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_ratio = slow_call_ratio
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+        
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per call
+        self.state = self.CLOSED
+        self._open_until = 0.0
+        self._probes = 0
+        self._opened = 0
+        self._rejected = 0
+    
+    def _reject(self):
+        self._rejected += 1
+        retry_after = max(1, int(self._open_until - time.monotonic() + 0.999))
+        return CircuitOpen('Upstream model is unavailable, please retry later',
+                           retry_after=retry_after)
+    
+    def is_open(self) -> bool:
+        """Whether calls are being rejected right now."""
+        return self.state == self.OPEN and time.monotonic() < self._open_until
+    
+    def check(self) -> None:
+        """
+        Fail fast while open, without taking a probe slot.
+        
+        Raises:
+            CircuitOpen: If the breaker is open
+        """
+        if self.is_open():
+            raise self._reject()
+    
+    def acquire(self) -> None:
+        """
+        Ask to make a call; must be followed by ``record``.
+        
+        Raises:
+            CircuitOpen: If the breaker is open or out of half-open probes
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() < self._open_until:
+                    raise self._reject()
+                self.state = self.HALF_OPEN
+                self._probes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    raise self._reject()
+                self._probes += 1
+    
+    def record(self, failed: Optional[bool], latency: float) -> None:
+        """
+        Report the outcome of a call allowed by ``acquire``.
+        
+        ``failed`` is None when the call ended without saying anything
+        about upstream health, e.g. it was cancelled.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            slow = latency > self.slow_call_duration
+            if self.state == self.HALF_OPEN:
+                self._probes -= 1
+                if failed is None:
+                    return
+                if failed or slow:
+                    self._trip()
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+            elif self.state == self.CLOSED and failed is not None:
+                self._outcomes.append((failed, slow))
+                calls = len(self._outcomes)
+                if calls >= self.min_calls:
+                    failures = sum(1 for f, _ in self._outcomes if f)
+                    slow_calls = sum(1 for _, sl in self._outcomes if sl)
+                    if (failures / calls >= self.failure_ratio
+                            or slow_calls / calls >= self.slow_call_ratio):
+                        self._trip()
+    
+    def _trip(self):
+        """Open the breaker (lock held)."""
+        self.state = self.OPEN
+        self._open_until = time.monotonic() + self.open_duration
+        self._outcomes.clear()
+        self._opened += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return breaker state and counters for monitoring."""
+        with self._lock:
+            calls = len(self._outcomes)
+            state = self.state
+            if state == self.OPEN and time.monotonic() >= self._open_until:
+                state = self.HALF_OPEN  # the next call will probe
+            return {
+                'enabled': self.enabled,
+                'state': state,
+                'window_calls': calls,
+                'failure_ratio': round(sum(1 for f, _ in self._outcomes if f) / calls, 3) if calls else 0.0,
+                'times_opened': self._opened,
+                'rejected': self._rejected,
+                'retry_after': max(0, round(self._open_until - time.monotonic(), 1)) if state == self.OPEN else 0
+            }
+
+
+class RetryPolicy:
+    """
+    Which upstream failures to retry, and how long to wait in between.
+    
+    Only failures that happened before any output was received are
+    retried: connection errors (including connect timeouts) and responses
+    with a status in ``RETRY_STATUSES``. Read timeouts are not retried,
+    since a stalled generation would only be paid for twice. Waits use
+    full jitter and honour a ``Retry-After`` of up to ``backoff_max``.
+    """
+    
+    RETRY_STATUSES = frozenset({429, 502, 503, 504})
+    
+    def __init__(self, max_retries: int = 2, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+    
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether a failed attempt may safely be sent again."""
+        if isinstance(error, r.HTTPError):
+            return error.response is not None and error.response.status_code in self.RETRY_STATUSES
+        return isinstance(error, r.ConnectionError)
+    
+    def next_delay(self, retry: int, error: Exception) -> Optional[float]:
+        """
+        Seconds to wait before retry number ``retry`` (from 0), or None to give up.
+        """
+        if retry >= self.max_retries or not self.is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                retry_after = None
+            if retry_after is not None:
+                if retry_after > self.backoff_max:
+                    return None
+                delay = max(delay, retry_after)
+        return delay
+
+
+def _race(first, second, delay: float, deadline: Optional[float] = None,
+          start_second=None, failover=None):
+    """
+    Run ``first()``, racing ``second()`` against it if it is slow.
+    
+    ``second`` starts once ``first`` has not returned within ``delay``
+    seconds and ``start_second()``, if given, agrees; it also starts at once
+    if ``first`` fails with an error for which ``failover(error)`` is true.
+    Both return a tuple whose first item is an ExitStack; the attempt that
+    loses has its stack closed, which hands its connection back.
+    
+    Returns ``(result, second_won)`` for the first success.
+    
+    Raises:
+        DeadlineExceeded: If nothing succeeded before ``deadline``
+        Exception: The last error, once every started attempt failed
+    """
+    results = queue.Queue()
+    decided_lock = threading.Lock()
+    decided = []
+    
+    def run(attempt, is_second):
+        try:
+            outcome = (attempt(), None, is_second)
+        except Exception as e:
+            outcome = (None, e, is_second)
+        with decided_lock:
+            if not decided:
+                results.put(outcome)
+                return
+        # Lost the race: hand the connection straight back
+        if outcome[0] is not None:
+            outcome[0][0].close()
+    
+    def launch(attempt, is_second):
+        threading.Thread(target=run, args=(attempt, is_second), daemon=True).start()
+    
+    launch(first, False)
+    started, failed = 1, 0
+    second_at = time.monotonic() + delay  # None once second has started or been refused
+    try:
+        while True:
+            timeout = None if second_at is None else max(0, second_at - time.monotonic())
+            if deadline is not None:
+                left = max(0, deadline - time.monotonic())
+                timeout = left if timeout is None else min(timeout, left)
+            try:
+                opened, error, second_won = results.get(timeout=timeout)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DeadlineExceeded('Upstream call deadline exceeded')
+                if start_second is None or start_second():
+                    launch(second, True)
+                    started += 1
+                second_at = None
+                continue
+            if opened is not None:
+                break
+            failed += 1
+            if second_at is not None and failover is not None and failover(error):
+                launch(second, True)
+                started += 1
+                second_at = None
+                continue
+            # Use the last failure once every started attempt failed
+            if failed == started:
+                break
+    finally:
+        with decided_lock:
+            decided.append(True)
+            while not results.empty():
+                extra = results.get_nowait()[0]
+                if extra is not None:
+                    extra[0].close()
+    
+    if opened is None:
+        raise error
+    return opened, second_won
+
+
+class StreamedResponse:
+    """
+    Body of a streaming upstream response whose first chunk has arrived.
+    
+    ``iter_content`` yields raw body chunks, raising DeadlineExceeded if
+    the stream is still going when the deadline passes.
+    """
+    
+    def __init__(self, response, chunks, deadline: Optional[float] = None):
+        self.response = response
+        self._chunks = chunks
+        self.deadline = deadline
+    
+    def iter_content(self, chunk_size=None):
+        if self.deadline is None:
+            return self._chunks
+        return self._until_deadline()
+    
+    def _until_deadline(self):
+        deadline = self.deadline
+        for chunk in self._chunks:
+            yield chunk
+            if time.monotonic() > deadline:
+                raise DeadlineExceeded('Upstream response did not finish before the deadline')
+
+
+class TokenUsage(NamedTuple):
+    """
+    Token counts reported by upstream for one completion.
+    
+    ``completion_tokens`` includes ``reasoning_tokens`` when the provider
+    reports them separately.
+    """
+    
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reasoning_tokens: int = 0
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+    
+    @classmethod
+    def from_dict(cls, usage: Optional[Dict[str, Any]]) -> Optional['TokenUsage']:
+        """Build from an OpenAI-style ``usage`` block, or None if there is none."""
+        if not usage:
+            return None
+        details = usage.get('completion_tokens_details') or {}
+        return cls(
+            int(usage.get('prompt_tokens') or 0),
+            int(usage.get('completion_tokens') or 0),
+            int(details.get('reasoning_tokens') or 0)
+        )
+    
+    def to_dict(self) -> Dict[str, int]:
+        """Counts keyed as in API responses."""
+        return {
+            'prompt': self.prompt_tokens,
+            'completion': self.completion_tokens,
+            'reasoning': self.reasoning_tokens,
+            'total': self.total_tokens
+        }
+    
+    @classmethod
+    def combine(cls, usages) -> Optional['TokenUsage']:
+        """Sum several usages, skipping None; None if there are none."""
+        usages = [usage for usage in usages if usage is not None]
+        if not usages:
+            return None
+        return cls(*(sum(column) for column in zip(*usages)))
+
+
+class UpstreamClient:
+    """
+    Keep-alive HTTP connection pool shared by every agent in a process.
+
+    Wraps a ``requests.Session`` whose adapter keeps up to ``pool_size``
+    connections per upstream host open, so consecutive queries skip DNS,
+    TCP connect and TLS handshake. When all connections are busy, callers
+    block until one is returned instead of opening extra sockets.
+    
+    ``stream`` and ``post_json`` retry safe failures per ``retry_policy``,
+    bound every attempt by an optional deadline and, with ``hedge`` on,
+    send a second request when the first has not answered within the
+    ``hedge_quantile`` of recent times to first byte. Every attempt goes
+    through ``breaker``, which fails calls fast while upstream is down.
+    """
+    
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0,
+                 read_timeout: float = 300.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95,
+                 hedge_min_samples: int = 20, breaker_enabled: bool = True,
+                 breaker_window: int = 20, breaker_min_calls: int = 10,
+                 breaker_failure_ratio: float = 0.5, breaker_slow_call: float = 30.0,
+                 breaker_slow_ratio: float = 0.8, breaker_open_seconds: float = 30.0):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry_policy = RetryPolicy(max_retries, backoff_base, backoff_max)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = CircuitBreaker(
+            enabled=breaker_enabled,
+            window=breaker_window,
+            min_calls=breaker_min_calls,
+            failure_ratio=breaker_failure_ratio,
+            slow_call_duration=breaker_slow_call,
+            slow_call_ratio=breaker_slow_ratio,
+            open_duration=breaker_open_seconds
+        )
+        
+        self.session = r.Session()
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=True
+        )
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._requests = 0
+        self._pool_waits = 0
+        self._errors = 0
+        self._retries = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._first_byte_times = deque(maxlen=256)
+    
+    @contextmanager
+    def post(self, url: str, **kwargs):
+        """
+        POST through the pool and release the connection on exit.
+        
+        The response is closed when the block exits, which hands its
+        connection back to the pool even if a stream was not fully read.
+        """
+        with self._lock:
+            if self._in_flight >= self.pool_size:
+                self._pool_waits += 1
+            self._in_flight += 1
+            self._requests += 1
+        
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        try:
+            try:
+                response = self.session.post(url, **kwargs)
+            except r.RequestException:
+                with self._lock:
+                    self._errors += 1
+                raise
+            try:
+                yield response
+            finally:
+                response.close()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+    
+    def _timeout(self, deadline: Optional[float]):
+        """Connect/read timeouts for one attempt, clipped to the time left."""
+        if deadline is None:
+            return (self.connect_timeout, self.read_timeout)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded('Upstream call deadline exceeded')
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+    
+    @contextmanager
+    def _guarded(self):
+        """Run one upstream attempt through the circuit breaker."""
+        self.breaker.acquire()
+        start = time.monotonic()
+        failed = None
+        try:
+            yield
+            failed = False
+        except r.HTTPError as e:
+            # Client errors say nothing about upstream health
+            status = e.response.status_code if e.response is not None else 500
+            failed = status >= 500 or status == 429
+            raise
+        except r.RequestException:
+            failed = True
+            raise
+        finally:
+            self.breaker.record(failed, time.monotonic() - start)
+    
+    def _with_retries(self, attempt, deadline: Optional[float]):
+        """Run ``attempt()`` until it succeeds, fails for good or runs out of time."""
+        retry = 0
+        while True:
+            try:
+                return attempt()
+            except r.RequestException as e:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DeadlineExceeded('Upstream call deadline exceeded') from e
+                delay = self.retry_policy.next_delay(retry, e)
+                if delay is None or (deadline is not None and time.monotonic() + delay >= deadline):
+                    raise
+            with self._lock:
+                self._retries += 1
+            time.sleep(delay)
+            retry += 1
+    
+    def post_json(self, url: str, deadline: Optional[float] = None, **kwargs) -> Any:
+        """
+        POST a request and return the decoded JSON body, retrying safe failures.
+        
+        Raises:
+            DeadlineExceeded: If no attempt succeeded before ``deadline``
+            requests.RequestException: If the last attempt failed
+        """
+        def attempt():
+            timeout = self._timeout(deadline)
+            with self._guarded(), self.post(url, timeout=timeout, **kwargs) as response:
+                response.raise_for_status()
+                return response.json()
+        return self._with_retries(attempt, deadline)
+    
+    @contextmanager
+    def stream(self, url: str, deadline: Optional[float] = None, **kwargs):
+        """
+        POST a streaming request and yield a StreamedResponse.
+        
+        Attempts are retried and hedged only until a first body chunk has
+        arrived; after that the caller owns the stream, which is closed
+        when the block exits.
+        
+        Raises:
+            DeadlineExceeded: If no attempt answered before ``deadline``
+            requests.RequestException: If the last attempt failed
+        """
+        stack, response, chunks = self._with_retries(
+            lambda: self._open_stream(url, deadline, kwargs), deadline)
+        try:
+            yield StreamedResponse(response, chunks, deadline)
+        finally:
+            stack.close()
+    
+    def _attempt_stream(self, url: str, deadline: Optional[float], kwargs):
+        """Send one streaming request and wait for its first chunk."""
+        timeout = self._timeout(deadline)
+        stack = ExitStack()
+        try:
+            with self._guarded():
+                start = time.monotonic()
+                response = stack.enter_context(
+                    self.post(url, stream=True, timeout=timeout, **kwargs))
+                response.raise_for_status()
+                chunks = iter(response.iter_content(chunk_size=None))
+                first = next(chunks, b'')
+            with self._lock:
+                self._first_byte_times.append(time.monotonic() - start)
+        except BaseException:
+            stack.close()
+            raise
+        return stack, response, itertools.chain((first,), chunks)
+    
+    def _open_stream(self, url: str, deadline: Optional[float], kwargs):
+        """Open a stream, hedging with a second request if the first is slow."""
+        delay = self.hedge_delay()
+        
+        def attempt():
+            return self._attempt_stream(url, deadline, kwargs)
+        
+        if delay is None:
+            return attempt()
+        
+        def may_hedge():
+            if not self._has_spare_connection():
+                return False
+            with self._lock:
+                self._hedges += 1
+            return True
+        
+        opened, hedged = _race(attempt, attempt, delay, deadline, start_second=may_hedge)
+        if hedged:
+            with self._lock:
+                self._hedge_wins += 1
+        return opened
+    
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait before hedging, or None if hedging is off.
+        
+        This is the ``hedge_quantile`` of recent times to first byte, and
+        stays None until ``hedge_min_samples`` have been seen.
+        """
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._first_byte_times) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._first_byte_times)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+    
+    def _has_spare_connection(self) -> bool:
+        """Hedge only when it will not queue behind other calls."""
+        with self._lock:
+            return self._in_flight < self.pool_size
+    
+    def _connections_opened(self) -> int:
+        """Total number of sockets opened by the underlying urllib3 pools."""
+        pools = self._adapter.poolmanager.pools
+        opened = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        return opened
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters for monitoring."""
+        with self._lock:
+            requests_sent = self._requests
+            stats = {
+                'pool_size': self.pool_size,
+                'connect_timeout': self.connect_timeout,
+                'read_timeout': self.read_timeout,
+                'in_flight': self._in_flight,
+                'requests': requests_sent,
+                'pool_waits': self._pool_waits,
+                'errors': self._errors,
+                'retries': self._retries,
+                'hedges': self._hedges,
+                'hedge_wins': self._hedge_wins,
+            }
+        hedge_delay = self.hedge_delay()
+        stats['hedge_delay'] = round(hedge_delay, 3) if hedge_delay is not None else None
+        opened = self._connections_opened()
+        stats['connections_opened'] = opened
+        stats['reuse_ratio'] = round(max(0, requests_sent - opened) / requests_sent, 4) if requests_sent else 0.0
+        return stats
+    
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+
+# Process-wide client; rebuilt after fork so workers never share sockets
+_upstream_client = None
+_upstream_client_pid = None
+_upstream_client_lock = threading.Lock()
+_upstream_client_options = {
+    'pool_size': int(os.environ.get('UPSTREAM_POOL_SIZE', 10)),
+    'connect_timeout': float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5.0)),
+    'read_timeout': float(os.environ.get('UPSTREAM_READ_TIMEOUT', 300.0)),
+    'max_retries': int(os.environ.get('UPSTREAM_MAX_RETRIES', 2)),
+    'backoff_base': float(os.environ.get('UPSTREAM_RETRY_BACKOFF', 0.5)),
+    'backoff_max': float(os.environ.get('UPSTREAM_RETRY_BACKOFF_MAX', 8.0)),
+    'hedge': os.environ.get('UPSTREAM_HEDGE', 'false').lower() == 'true',
+    'hedge_quantile': float(os.environ.get('UPSTREAM_HEDGE_QUANTILE', 0.95)),
+    'hedge_min_samples': int(os.environ.get('UPSTREAM_HEDGE_MIN_SAMPLES', 20)),
+    'breaker_enabled': os.environ.get('UPSTREAM_BREAKER_ENABLED', 'true').lower() == 'true',
+    'breaker_window': int(os.environ.get('UPSTREAM_BREAKER_WINDOW', 20)),
+    'breaker_min_calls': int(os.environ.get('UPSTREAM_BREAKER_MIN_CALLS', 10)),
+    'breaker_failure_ratio': float(os.environ.get('UPSTREAM_BREAKER_FAILURE_RATIO', 0.5)),
+    'breaker_slow_call': float(os.environ.get('UPSTREAM_BREAKER_SLOW_CALL', 30.0)),
+    'breaker_slow_ratio': float(os.environ.get('UPSTREAM_BREAKER_SLOW_RATIO', 0.8)),
+    'breaker_open_seconds': float(os.environ.get('UPSTREAM_BREAKER_OPEN_SECONDS', 30.0)),
+}
+
+
+def configure_upstream_client(**options) -> None:
+    """
+    Set pool options for the shared upstream client.
+    
+    Accepts the UpstreamClient constructor arguments. An existing client
+    is replaced on next use so the new options take effect.
+    """
+    global _upstream_client, _provider_registry
+    with _upstream_client_lock:
+        _upstream_client_options.update(options)
+        if _provider_registry is not None:
+            _provider_registry.close(keep=_upstream_client)
+            _provider_registry = None
+        if _upstream_client is not None:
+            _upstream_client.close()
+            _upstream_client = None
+
+
+def get_upstream_client() -> UpstreamClient:
+    """Return the process-wide upstream client, creating it on first use."""
+    global _upstream_client, _upstream_client_pid
+    pid = os.getpid()
+    with _upstream_client_lock:
+        if _upstream_client is None or _upstream_client_pid != pid:
+            _upstream_client = UpstreamClient(**_upstream_client_options)
+            _upstream_client_pid = pid
+        return _upstream_client
+
+
+def _fails_over(error: Exception) -> bool:
+    """Whether another provider should be tried after ``error``."""
+    if isinstance(error, DeadlineExceeded):
+        return False  # no time left for anyone else either
+    if isinstance(error, r.HTTPError):
+        # A bad request is bad everywhere
+        status = error.response.status_code if error.response is not None else 500
+        return status >= 500 or status == 429
+    return isinstance(error, (UpstreamUnavailable, r.RequestException))
+
+
+class Provider:
+    """
+    One OpenAI-compatible chat-completions endpoint of a ProviderRegistry.
+    
+    ``model`` is the name this provider knows the model by, or None for
+    the agent's own model; ``headers`` likewise default to the agent's.
+    Each provider has its own UpstreamClient, and so its own connection
+    pool, retries and circuit breaker. ``ttft`` and ``error_rate`` are
+    moving averages of observed time to first token and of failed calls,
+    each new observation weighted by ``alpha``.
+    """
+    
+    def __init__(self, name: str, api_url: str, model: Optional[str] = None,
+                 weight: float = 1.0, headers: Optional[Dict[str, str]] = None,
+                 client: Optional[UpstreamClient] = None, alpha: float = 0.2):
+        self.name = name
+        self.api_url = api_url
+        self.model = model
+        self.weight = weight
+        self.headers = headers
+        self.client = client or UpstreamClient(**_upstream_client_options)
+        self.alpha = alpha
+        self.ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._failures = 0
+    
+    def record(self, ttft: Optional[float], failed: bool) -> None:
+        """Fold the outcome of one call into the moving averages."""
+        with self._lock:
+            self._calls += 1
+            if failed:
+                self._failures += 1
+            self.error_rate += self.alpha * (failed - self.error_rate)
+            if ttft is not None:
+                self.ttft = ttft if self.ttft is None else self.ttft + self.alpha * (ttft - self.ttft)
+    
+    def score(self, default_ttft: float) -> float:
+        """
+        Routing score: higher for heavier, faster and more reliable providers.
+        
+        Providers without a TTFT sample yet are scored with ``default_ttft``.
+        """
+        ttft = self.ttft if self.ttft is not None else default_ttft
+        # Failures cost more than their TTFT, so they are penalised
+        # quadratically; a trickle of traffic still lets a provider recover
+        return self.weight * max((1.0 - self.error_rate) ** 2, 0.01) / max(ttft, 0.001)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return routing state and counters for monitoring."""
+        with self._lock:
+            return {
+                'name': self.name,
+                'model': self.model,
+                'weight': self.weight,
+                'ttft': round(self.ttft, 3) if self.ttft is not None else None,
+                'error_rate': round(self.error_rate, 3),
+                'calls': self._calls,
+                'failures': self._failures,
+                'breaker': self.client.breaker.stats()['state']
+            }
+
+
+class ProviderRegistry:
+    """
+    Routes calls across providers serving the same logical model.
+    
+    Each call goes first to a provider picked at random in proportion to
+    its score, ``weight * (1 - error_rate)**2 / ttft``, so traffic drains away
+    from providers that get slow or start failing and comes back as they
+    recover. A provider with weight 0 is only a fallback. If the call fails
+    with a server-side error, the other providers are tried in score order,
+    those with an open breaker last. With ``failover_after`` set, a
+    streaming call that has no first token after that many seconds is also
+    sent to the next provider, and whichever answers first is used.
+    """
+    
+    def __init__(self, providers, failover_after: Optional[float] = None):
+        if not providers:
+            raise ValueError('A provider registry needs at least one provider')
+        self.providers = list(providers)
+        self.failover_after = failover_after
+        self._lock = threading.Lock()
+        self._failovers = 0
+    
+    @classmethod
+    def from_config(cls, spec, client: Optional[UpstreamClient] = None,
+                    failover_after: Optional[float] = None) -> 'ProviderRegistry':
+        """
+        Build a registry from a list of provider dicts or its JSON form.
+        
+        Each entry has ``url`` and optional ``name``, ``model``, ``weight``,
+        ``headers`` and ``api_key_env``, the environment variable holding a
+        bearer token. The first provider uses ``client``; an empty spec gives
+        the default endpoint alone.
+        """
+        if isinstance(spec, str):
+            spec = json.loads(spec) if spec.strip() else []
+        if not spec:
+            spec = [{'name': 'default', 'url': _AgentBase.API_URL}]
+        providers = []
+        for i, entry in enumerate(spec):
+            headers = entry.get('headers')
+            if entry.get('api_key_env'):
+                headers = dict(headers or {})
+                headers['Authorization'] = f"Bearer {os.environ.get(entry['api_key_env'], '')}"
+            providers.append(Provider(
+                entry.get('name') or f'provider{i}',
+                entry['url'],
+                model=entry.get('model'),
+                weight=float(entry.get('weight', 1.0)),
+                headers=headers,
+                client=client if i == 0 else None
+            ))
+        return cls(providers, failover_after)
+    
+    @property
+    def primary(self) -> Provider:
+        """The first configured provider."""
+        return self.providers[0]
+    
+    def ranked(self) -> list:
+        """Providers in the order to try them for one call."""
+        available = [p for p in self.providers if not p.client.breaker.is_open()]
+        tripped = [p for p in self.providers if p.client.breaker.is_open()]
+        if len(available) < 2:
+            return available + tripped
+        
+        known = [p.ttft for p in available if p.ttft is not None]
+        default_ttft = min(known) if known else 1.0
+        scores = {p: p.score(default_ttft) for p in available}
+        by_score = sorted(available, key=scores.get, reverse=True)
+        if sum(scores.values()) <= 0:
+            return by_score + tripped
+        first = random.choices(available, weights=[scores[p] for p in available])[0]
+        return [first] + [p for p in by_score if p is not first] + tripped
+    
+    def check(self) -> None:
+        """
+        Fail fast when every provider's breaker is open.
+        
+        Raises:
+            CircuitOpen: From the provider that will reopen first
+        """
+        rejections = []
+        for provider in self.providers:
+            try:
+                provider.client.breaker.check()
+            except CircuitOpen as e:
+                rejections.append(e)
+            else:
+                return
+        raise min(rejections, key=lambda e: e.retry_after)
+    
+    def is_open(self) -> bool:
+        """Whether every provider is rejecting calls right now."""
+        return all(p.client.breaker.is_open() for p in self.providers)
+    
+    @staticmethod
+    def _request(provider: Provider, payload: Dict[str, Any], headers: Dict[str, str]):
+        """The URL and request arguments for ``payload`` sent to ``provider``."""
+        if provider.model is not None:
+            payload = dict(payload, model=provider.model)
+        return provider.api_url, {
+            'headers': provider.headers if provider.headers is not None else headers,
+            'json': payload
+        }
+    
+    def _each(self, call):
+        """Try ``call(provider)`` on ranked providers until one succeeds."""
+        error = None
+        for i, provider in enumerate(self.ranked()):
+            if i:
+                with self._lock:
+                    self._failovers += 1
+            try:
+                return call(provider)
+            except Exception as e:
+                if not _fails_over(e):
+                    raise
+                error = e
+        raise error
+    
+    def post_json(self, payload: Dict[str, Any], headers: Dict[str, str],
+                  deadline: Optional[float] = None) -> Any:
+        """
+        Send a non-streaming request, failing over between providers.
+        
+        Raises:
+            DeadlineExceeded: If no provider answered before ``deadline``
+            requests.RequestException: If the last provider failed
+        """
+        def call(provider):
+            url, kwargs = self._request(provider, payload, headers)
+            try:
+                data = provider.client.post_json(url, deadline=deadline, **kwargs)
+            except Exception as e:
+                provider.record(None, _fails_over(e))
+                raise
+            # A whole answer says nothing about time to first token
+            provider.record(None, False)
+            return data
+        return self._each(call)
+    
+    @contextmanager
+    def stream(self, payload: Dict[str, Any], headers: Dict[str, str],
+               deadline: Optional[float] = None):
+        """
+        Open a streaming request on the best provider and yield its StreamedResponse.
+        
+        Providers are only switched before the first chunk has arrived.
+        
+        Raises:
+            DeadlineExceeded: If no provider answered before ``deadline``
+            requests.RequestException: If the last provider failed
+        """
+        stack, response = self._open(payload, headers, deadline)
+        try:
+            yield response
+        finally:
+            stack.close()
+    
+    def _attempt(self, provider: Provider, payload, headers, deadline):
+        """Open a stream on one provider, recording its time to first token."""
+        url, kwargs = self._request(provider, payload, headers)
+        stack = ExitStack()
+        start = time.monotonic()
+        try:
+            response = stack.enter_context(provider.client.stream(url, deadline=deadline, **kwargs))
+        except Exception as e:
+            provider.record(None, _fails_over(e))
+            raise
+        provider.record(time.monotonic() - start, False)
+        return stack, response
+    
+    def _open(self, payload, headers, deadline):
+        """Open a stream, failing over on errors and, optionally, on slowness."""
+        providers = self.ranked()
+        if self.failover_after is None or len(providers) < 2:
+            return self._each(lambda provider: self._attempt(provider, payload, headers, deadline))
+        
+        def attempt(provider, switching=False):
+            if switching:
+                with self._lock:
+                    self._failovers += 1
+            return self._attempt(provider, payload, headers, deadline)
+        
+        # Race providers in pairs: the second joins once the first is slow or fails
+        error = None
+        for first, second in itertools.zip_longest(providers[::2], providers[1::2]):
+            try:
+                if second is None:
+                    return attempt(first, switching=True)
+                opened, _ = _race(lambda p=first, switching=error is not None: attempt(p, switching),
+                                  lambda p=second: attempt(p, switching=True),
+                                  self.failover_after, deadline, failover=_fails_over)
+                return opened
+            except Exception as e:
+                if not _fails_over(e):
+                    raise
+                error = e
+        raise error
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return per-provider routing state for monitoring."""
+        with self._lock:
+            failovers = self._failovers
+        return {
+            'failover_after': self.failover_after,
+            'failovers': failovers,
+            'providers': [p.stats() for p in self.providers]
+        }
+    
+    def close(self, keep: Optional[UpstreamClient] = None):
+        """Close every provider's connections, except those of ``keep``."""
+        for provider in self.providers:
+            if provider.client is not keep:
+                provider.client.close()
+
+
+# Process-wide registry over the shared client; rebuilt along with it
+_provider_registry = None
+_provider_options = {
+    'providers': os.environ.get('UPSTREAM_PROVIDERS', ''),
+    'failover_after': float(os.environ['UPSTREAM_FAILOVER_AFTER']) if os.environ.get('UPSTREAM_FAILOVER_AFTER') else None,
+}
+
+
+def configure_providers(**options) -> None:
+    """
+    Set the upstream providers used by default.
+    
+    ``providers`` is a ProviderRegistry.from_config spec and
+    ``failover_after`` the slow-provider failover delay, or None.
+    """
+    global _provider_registry
+    with _upstream_client_lock:
+        _provider_options.update(options)
+        if _provider_registry is not None:
+            _provider_registry.close(keep=_upstream_client)
+            _provider_registry = None
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """
+    Return the process-wide provider registry, creating it on first use.
+    
+    Its first provider uses the shared upstream client, so the registry is
+    rebuilt whenever that client is (after a fork or reconfiguration).
+    """
+    global _provider_registry
+    client = get_upstream_client()
+    with _upstream_client_lock:
+        if _provider_registry is None or _provider_registry.primary.client is not client:
+            _provider_registry = ProviderRegistry.from_config(
+                _provider_options['providers'], client,
+                failover_after=_provider_options['failover_after'])
+        return _provider_registry
+
+
+class Subtask(NamedTuple):
+    """One step of a task plan; ``depends_on`` holds the ids of steps it needs."""
+    
+    id: str
+    task: str
+    depends_on: Tuple[str, ...] = ()
+
+
+class _AgentBase:
+    """
+    Request building and response parsing shared by the sync and async agents.
+    """
+    
+    DEFAULT_MODEL = "deepseek-ai/DeepSeek-R1-0528-Turbo"
+    API_URL = "https://api.deepinfra.com/v1/openai/chat/completions"
+    HEADERS = {"X-Deepinfra-Source": "web-page"}
+    
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+        self.api_url = self.API_URL
+        self.headers = dict(self.HEADERS)
+        self.last_usage: Optional[TokenUsage] = None  # usage of the latest completed call
+    
+    def _build_payload(self, prompt, stream: bool) -> Dict[str, Any]:
+        """Build the chat-completions request body for a prompt or a list of chat messages."""
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}] if isinstance(prompt, str) else list(prompt),
+            "stream": 1 if stream else 0
+        }
+        if stream:
+            # Ask for a final chunk carrying the usage block
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+    
+    def _record_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Keep the upstream usage block of the call that just finished."""
+        self.last_usage = TokenUsage.from_dict(usage)
+    
+    def _extract_message(self, data: Dict[str, Any]) -> str:
+        """Extract the answer from a non-streaming response body."""
+        self._record_usage(data.get('usage'))
+        return data['choices'][0]['message']['content']
+    
+    @staticmethod
+    def _enhance_task(task: str) -> str:
+        """Wrap a task description in the autonomous-agent instructions."""
+        return f"""You are an autonomous AI agent. Analyze and execute the following task:
+
+Task: {task}
+
+Please:
+1. Parse and understand what is being asked
+2. Determine if this requires web research, code generation, writing, or analysis
+3. Execute the task thoroughly
+4. Provide a clear, actionable response
+
+Execute the task now:"""
+    
+    @staticmethod
+    def _plan_prompt(task: str, max_subtasks: int) -> str:
+        """Ask for a task to be split into a dependency graph of subtasks."""
+        return f"""Break the following task into at most {max_subtasks} subtasks that can be worked on separately.
+
+Task: {task}
+
+Reply with JSON only, in this form:
+{{"subtasks": [{{"id": "s1", "task": "...", "depends_on": []}}, {{"id": "s2", "task": "...", "depends_on": ["s1"]}}]}}
+
+List a dependency only when a subtask needs the result of another; subtasks without dependencies are worked on at the same time. Do not add a final subtask that combines the results. If the task cannot be split, return a single subtask."""
+    
+    @staticmethod
+    def _parse_plan(text: Optional[str], max_subtasks: int) -> Optional[List[Subtask]]:
+        """
+        Read subtasks from a planning answer.
+        
+        Dependencies on unknown subtasks are dropped. Returns None if the
+        answer holds no usable plan or its dependencies form a cycle.
+        """
+        if not text:
+            return None
+        start, end = text.find('{'), text.rfind('}')
+        if start < 0 or end < start:
+            return None
+        try:
+            items = json.loads(text[start:end + 1]).get('subtasks')
+        except (ValueError, AttributeError):
+            return None
+        if not isinstance(items, list) or not items:
+            return None
+        
+        subtasks = []
+        for i, item in enumerate(items[:max_subtasks]):
+            if not isinstance(item, dict) or not isinstance(item.get('depends_on') or [], list):
+                return None
+            task = str(item.get('task') or '').strip()
+            if not task:
+                return None
+            subtasks.append(Subtask(str(item.get('id') or f's{i + 1}'), task,
+                                    tuple(str(d) for d in item.get('depends_on') or [])))
+        ids = {subtask.id for subtask in subtasks}
+        if len(ids) < len(subtasks):
+            return None
+        subtasks = [subtask._replace(depends_on=tuple(
+            d for d in dict.fromkeys(subtask.depends_on) if d in ids and d != subtask.id))
+            for subtask in subtasks]
+        
+        # Every subtask must become ready once those before it are done
+        done = set()
+        remaining = subtasks
+        while remaining:
+            ready = {s.id for s in remaining if all(d in done for d in s.depends_on)}
+            if not ready:
+                return None
+            done |= ready
+            remaining = [s for s in remaining if s.id not in done]
+        return subtasks
+    
+    @staticmethod
+    def _subtask_prompt(task: str, subtask: Subtask, context: Dict[str, Optional[str]]) -> str:
+        """Prompt for one subtask, with the results of the subtasks it depends on."""
+        parts = [f"You are an autonomous AI agent working on one part of a larger task.\n\n"
+                 f"Overall task: {task}\n\nYour subtask: {subtask.task}"]
+        if context:
+            parts.append("Results of earlier subtasks to build on:")
+            for subtask_id, result in context.items():
+                parts.append(f"[{subtask_id}]\n{result if result is not None else '(this subtask failed)'}")
+        parts.append("Complete your subtask thoroughly and reply with its result only.")
+        return '\n\n'.join(parts)
+    
+    @staticmethod
+    def _synthesis_prompt(task: str, subtasks: List[Subtask], results: Dict[str, Optional[str]]) -> str:
+        """Prompt merging subtask results into the final answer."""
+        parts = [f"You are an autonomous AI agent. The task below was split into subtasks, "
+                 f"which have been completed.\n\nTask: {task}\n\nSubtask results:"]
+        for subtask in subtasks:
+            result = results.get(subtask.id)
+            parts.append(f"[{subtask.id}] {subtask.task}\n{result if result is not None else '(this subtask failed)'}")
+        parts.append("Combine these results into one clear, complete and actionable response to the task. "
+                     "Resolve overlaps and contradictions, and cover any failed subtask yourself.")
+        return '\n\n'.join(parts)
+
+
+class AutonomousAgent(_AgentBase):
     """
     Autonomous AI agent that can parse tasks and execute various operations:
     - Web research
     - Code generation
     - Writing and analysis
     - Task decomposition
-    """
     
-    # SSE (Server-Sent Events) prefix length for streaming responses
-    # Each line starts with "data: " which we need to skip
-    SSE_DATA_PREFIX_LEN = 6  # len("data: ")
+    Upstream calls are routed by ``providers``, the process-wide
+    ProviderRegistry unless a registry, or a single ``client`` for the
+    default endpoint, is given.
+    """
     
-    def __init__(self, model: str = "deepseek-ai/DeepSeek-R1-0528-Turbo"):
-        self.model = model
-        self.api_url = "https://api.deepinfra.com/v1/openai/chat/completions"
-        self.headers = {"X-Deepinfra-Source": "web-page"}
+    def __init__(self, model: str = _AgentBase.DEFAULT_MODEL,
+                 client: Optional[UpstreamClient] = None, echo: bool = True,
+                 deadline: Optional[float] = None,
+                 providers: Optional[ProviderRegistry] = None):
+        super().__init__(model)
+        if providers is None:
+            # An explicit client means a single provider: the default endpoint
+            providers = (ProviderRegistry([Provider('default', self.api_url, client=client)])
+                         if client is not None else get_provider_registry())
+        self.providers = providers
+        self.client = providers.primary.client
+        self.echo = echo  # print streamed answers from query()
+        self.deadline = deadline  # time.monotonic() by which calls must finish
         
-    def query(self, prompt: str, stream: bool = True) -> Optional[str]:
+    def query(self, prompt: str, stream: bool = True, sink=None) -> Optional[str]:
         """
         Send a query to the AI model and get a response.
         
         Args:
-            prompt: The user's prompt/task
+            prompt: The user's prompt/task, or a list of chat messages
             stream: Whether to stream the response
+            sink: Callback ``sink(kind, text)`` for streamed deltas; by
+                default content is echoed to stdout when ``echo`` is set
             
         Returns:
             Complete response text or None on error
         """
-        payload = {
-            "model": self.model,
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": 1 if stream else 0
-        }
+        payload = self._build_payload(prompt, stream)
+        self.last_usage = None
         
         try:
-            response = r.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                stream=stream
-            )
-            response.raise_for_status()
-            
-            if stream:
-                return self._handle_stream(response)
-            else:
-                return response.json()['choices'][0]['message']['content']
+            if not stream:
+                return self._extract_message(self.providers.post_json(
+                    payload,
+                    self.headers,
+                    deadline=self.deadline
+                ))
+            with self.providers.stream(
+                payload,
+                self.headers,
+                deadline=self.deadline
+            ) as response:
+                return self._handle_stream(response, sink)
                 
-        except (r.RequestException, ValueError, KeyError) as e:
+        except (r.RequestException, UpstreamUnavailable, ValueError, KeyError) as e:
             print(f"\nError querying AI: {e}", file=sys.stderr)
             return None
         except Exception as e:
             print(f"\nUnexpected error: {e}", file=sys.stderr)
             return None
     
-    def _handle_stream(self, response) -> str:
+    def stream(self, prompt: str):
+        """
+        Stream the response to a prompt without printing it.
+        
+        Args:
+            prompt: The user's prompt/task, or a list of chat messages
+            
+        Yields:
+            Content deltas as they arrive from upstream; ``last_usage`` is
+            set once the stream is exhausted
+            
+        Raises:
+            DeadlineExceeded: If the answer is not complete by ``deadline``
+            requests.RequestException: If the request fails after retries
+        """
+        self.last_usage = None
+        with self.providers.stream(
+            self._build_payload(prompt, stream=True),
+            self.headers,
+            deadline=self.deadline
+        ) as response:
+            yield from iter_deltas(response.iter_content(chunk_size=None),
+                                   on_usage=self._record_usage)
+    
+    def _handle_stream(self, response, sink=None) -> str:
         """
         Handle streaming response from the API.
         
         Args:
             response: The streaming response object
+            sink: Callback ``sink(kind, text)`` for each delta
             
         Returns:
             Complete response text
         """
         full_response = []
+        append = full_response.append
+        console = ConsoleSink() if sink is None and self.echo else None
+        target = sink or console
+        
+        def collect(kind, text):
+            if kind == CONTENT:
+                append(text)
+            if target is not None:
+                target(kind, text)
         
-        for line in response.iter_lines():
-            # Skip "data: " prefix from SSE (Server-Sent Events) format
-            if line and (chunk := line.decode()[self.SSE_DATA_PREFIX_LEN:]) != "[DONE]":
-                try:
-                    data = json.loads(chunk)
-                    content = data['choices'][0]['delta'].get('content', '')
-                    if content:
-                        print(content, end='', flush=True)
-                        full_response.append(content)
-                except (json.JSONDecodeError, KeyError, IndexError):
-                    # Ignore malformed chunks or incomplete data during streaming
-                    pass
-        
-        print()  # New line after streaming
+        self._record_usage(drain(response.iter_content(chunk_size=None), collect))
+        
+        if console is not None:
+            console.close()  # New line after streaming
         return ''.join(full_response)
     
-    def parse_and_execute(self, task: str) -> Optional[str]:
+    def parse_and_execute(self, task: str, parallel: bool = False,
+                          max_parallel: int = 4) -> Optional[str]:
         """
         Parse a task description and execute it.
         
@@ -104,36 +1303,121 @@ class AutonomousAgent:
         3. Execute the task
         4. Deliver the results
         
+        With ``parallel``, the model first splits the task into a small
+        dependency graph of subtasks. Independent subtasks run concurrently,
+        up to ``max_parallel`` at a time, and a final call merges their
+        results, so a compound task takes about as long as its longest
+        chain. Tasks that do not split are run as a single prompt.
+        
         Args:
             task: The task description from the user
+            parallel: Whether to plan and run subtasks concurrently
+            max_parallel: Most subtasks in flight at once
             
         Returns:
             Task execution results
         """
-        # Enhance the prompt to guide the AI in task execution
-        enhanced_prompt = f"""You are an autonomous AI agent. Analyze and execute the following task:
-
-Task: {task}
-
-Please:
-1. Parse and understand what is being asked
-2. Determine if this requires web research, code generation, writing, or analysis
-3. Execute the task thoroughly
-4. Provide a clear, actionable response
-
-Execute the task now:"""
-        
         print(f"[AGENT] Processing Task...\n")
         print(f"[TASK] {task}\n")
+        
+        subtasks = None
+        plan_usage = None
+        if parallel:
+            subtasks = self.plan(task)
+            plan_usage = self.last_usage
+            if subtasks is not None and len(subtasks) > 1:
+                print("[PLAN]")
+                for subtask in subtasks:
+                    after = f" (after {', '.join(subtask.depends_on)})" if subtask.depends_on else ""
+                    print(f"  {subtask.id}: {subtask.task}{after}")
+                print()
+        
         print("=" * 60)
         print("[RESPONSE]\n")
         
-        result = self.query(enhanced_prompt, stream=True)
+        if subtasks is not None and len(subtasks) > 1:
+            result = self.execute_plan(task, subtasks, max_parallel)
+        else:
+            # Enhance the prompt to guide the AI in task execution
+            result = self.query(self._enhance_task(task), stream=True)
+        self.last_usage = TokenUsage.combine([plan_usage, self.last_usage])
         print("\n" + "=" * 60)
         print("[COMPLETE] Task Complete\n")
         
         return result
     
+    def plan(self, task: str, max_subtasks: int = 6) -> Optional[List[Subtask]]:
+        """
+        Ask the model to split a task into a dependency graph of subtasks.
+        
+        Args:
+            task: The task description
+            max_subtasks: Most subtasks to accept
+            
+        Returns:
+            The subtasks, or None if the model did not return a valid plan
+        """
+        return self._parse_plan(self.query(self._plan_prompt(task, max_subtasks), stream=False),
+                                max_subtasks)
+    
+    def execute_plan(self, task: str, subtasks: List[Subtask], max_parallel: int = 4,
+                     sink=None) -> Optional[str]:
+        """
+        Run subtasks as soon as their dependencies finish, then merge the results.
+        
+        Each subtask sees the results of those it depends on. A failed
+        subtask does not stop the others; the final answer covers it.
+        ``last_usage`` is set to the total of every call made.
+        
+        Args:
+            task: The original task description
+            subtasks: A plan from ``plan``
+            max_parallel: Most subtasks in flight at once
+            sink: Callback ``sink(kind, text)`` for the streamed final answer
+            
+        Returns:
+            The merged answer, or None if the final call failed
+            
+        Raises:
+            ValueError: If some dependencies are unknown or circular
+        """
+        results, usages = self._run_subtasks(task, subtasks, max_parallel)
+        answer = self.query(self._synthesis_prompt(task, subtasks, results), sink=sink)
+        self.last_usage = TokenUsage.combine(usages + [self.last_usage])
+        return answer
+    
+    def _run_subtasks(self, task: str, subtasks: List[Subtask], max_parallel: int):
+        """Run subtasks on a thread pool in dependency order; return (results, usages)."""
+        results = {}
+        usages = []
+        pending = list(subtasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='subtask') as pool:
+            while pending or running:
+                for subtask in [s for s in pending if all(d in results for d in s.depends_on)]:
+                    pending.remove(subtask)
+                    context = {d: results[d] for d in subtask.depends_on}
+                    running[pool.submit(self._run_subtask, task, subtask, context)] = subtask
+                if not running:
+                    raise ValueError('Subtask dependencies cannot be met')
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    subtask = running.pop(future)
+                    results[subtask.id], usage, elapsed = future.result()
+                    usages.append(usage)
+                    if self.echo:
+                        status = 'done' if results[subtask.id] is not None else 'failed'
+                        print(f"[SUBTASK {subtask.id}] {status} in {elapsed:.1f}s")
+        return results, usages
+    
+    def _run_subtask(self, task: str, subtask: Subtask, context: Dict[str, Optional[str]]):
+        """Run one subtask on its own quiet agent; return (answer, usage, seconds)."""
+        worker = AutonomousAgent(self.model, echo=False, deadline=self.deadline,
+                                 providers=self.providers)
+        start = time.monotonic()
+        answer = worker.query(self._subtask_prompt(task, subtask, context))
+        return answer, worker.last_usage, time.monotonic() - start
+    
     def research(self, topic: str) -> Optional[str]:
         """Execute web research on a topic."""
         prompt = f"Research and provide comprehensive information about: {topic}"
@@ -155,24 +1439,369 @@ Execute the task now:"""
         return self.parse_and_execute(prompt)
 
 
+# One async client per event loop; httpx clients cannot be shared across loops
+_async_upstream_clients = {}
+_async_upstream_clients_lock = threading.Lock()
+
+
+def get_async_upstream_client():
+    """
+    Return the shared ``httpx.AsyncClient`` for the running event loop.
+    
+    Uses the same pool size and timeouts as the sync upstream client.
+    """
+    if httpx is None:
+        raise RuntimeError("AsyncAutonomousAgent requires the 'httpx' package")
+    loop = asyncio.get_running_loop()
+    with _async_upstream_clients_lock:
+        # Drop clients whose loop has gone away
+        for stale in [l for l in _async_upstream_clients if l.is_closed()]:
+            del _async_upstream_clients[stale]
+        client = _async_upstream_clients.get(loop)
+        if client is None:
+            options = _upstream_client_options
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=options['pool_size'],
+                    max_keepalive_connections=options['pool_size']
+                ),
+                timeout=httpx.Timeout(options['read_timeout'],
+                                      connect=options['connect_timeout'])
+            )
+            _async_upstream_clients[loop] = client
+        return client
+
+
+class AsyncAutonomousAgent(_AgentBase):
+    """
+    Asyncio-native sibling of AutonomousAgent.
+    
+    ``await query(...)`` and ``async for chunk in stream(...)`` let one event
+    loop keep many upstream generations in flight at once. Nothing is
+    printed; callers decide what to do with the output.
+    """
+    
+    def __init__(self, model: str = _AgentBase.DEFAULT_MODEL, client=None):
+        if httpx is None:
+            raise RuntimeError("AsyncAutonomousAgent requires the 'httpx' package")
+        super().__init__(model)
+        self._client = client
+    
+    @property
+    def client(self):
+        """The httpx client used for upstream calls."""
+        if self._client is None:
+            self._client = get_async_upstream_client()
+        return self._client
+    
+    async def query(self, prompt: str, stream: bool = False) -> Optional[str]:
+        """
+        Send a query to the AI model and get a response.
+        
+        Args:
+            prompt: The user's prompt/task
+            stream: Whether to stream the response upstream
+            
+        Returns:
+            Complete response text or None on error
+        """
+        self.last_usage = None
+        try:
+            if stream:
+                return ''.join([chunk async for chunk in self.stream(prompt)])
+            response = await self.client.post(
+                self.api_url,
+                headers=self.headers,
+                json=self._build_payload(prompt, stream=False)
+            )
+            response.raise_for_status()
+            return self._extract_message(response.json())
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            print(f"\nError querying AI: {e}", file=sys.stderr)
+            return None
+    
+    async def stream(self, prompt: str):
+        """
+        Stream the response to a prompt.
+        
+        Args:
+            prompt: The user's prompt/task
+            
+        Yields:
+            Content deltas as they arrive from upstream; ``last_usage`` is
+            set once the stream is exhausted
+            
+        Raises:
+            httpx.HTTPError: If the request fails
+        """
+        self.last_usage = None
+        async with self.client.stream(
+            "POST",
+            self.api_url,
+            headers=self.headers,
+            json=self._build_payload(prompt, stream=True)
+        ) as response:
+            response.raise_for_status()
+            async for content in aiter_deltas(response.aiter_bytes(),
+                                              on_usage=self._record_usage):
+                yield content
+    
+    async def parse_and_execute(self, task: str) -> Optional[str]:
+        """
+        Parse a task description and execute it.
+        
+        Args:
+            task: The task description from the user
+            
+        Returns:
+            Task execution results
+        """
+        return await self.query(self._enhance_task(task))
+
+
+# Batch task types: input field, and prompt template filled with its value
+BATCH_TASK_TYPES = {
+    'task': ('task', "{}"),
+    'query': ('prompt', "{}"),
+    'research': ('topic', "Research and provide comprehensive information about: {}"),
+    'code': ('requirements', "Generate code for the following requirements: {}"),
+    'analyze': ('content', "Analyze the following content:\n\n{}")
+}
+
+
+def read_batch(lines):
+    """
+    Parse JSONL batch input.
+    
+    Each line is a JSON object with an optional ``id`` (the line number by
+    default), a ``type`` from BATCH_TASK_TYPES (``task`` by default) and its
+    input field, or simply a JSON string holding a task. Blank lines are
+    skipped.
+    
+    Yields:
+        ``(id, item, error)``, where ``item`` is None for invalid lines
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield str(number), None, 'Invalid JSON'
+            continue
+        if isinstance(item, str):
+            item = {'task': item}
+        if not isinstance(item, dict):
+            yield str(number), None, 'Each line must be a JSON object or string'
+            continue
+        yield str(item.get('id', number)), item, None
+
+
+def run_batch_task(item: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run one batch item on a quiet agent and return its result record.
+    
+    Every type but ``query`` is wrapped in the agent instructions, as on
+    the command line. Failures are reported in the record, not raised.
+    """
+    start = time.monotonic()
+    task_type = item.get('type', 'task')
+    record = {'status': 'error'}
+    if task_type not in BATCH_TASK_TYPES:
+        record['error'] = f"Type must be one of: {', '.join(BATCH_TASK_TYPES)}"
+    elif not isinstance(item.get(BATCH_TASK_TYPES[task_type][0]), str):
+        record['error'] = f"Missing {BATCH_TASK_TYPES[task_type][0]}"
+    else:
+        field, template = BATCH_TASK_TYPES[task_type]
+        prompt = template.format(item[field])
+        agent = AutonomousAgent(echo=False,
+                                deadline=time.monotonic() + timeout if timeout else None)
+        if task_type != 'query':
+            prompt = agent._enhance_task(prompt)
+        try:
+            record['response'] = ''.join(agent.stream(prompt))
+            record['status'] = 'ok'
+        except Exception as e:
+            record['error'] = str(e) or type(e).__name__
+        record['tokens'] = agent.last_usage.to_dict() if agent.last_usage else None
+    record['elapsed'] = round(time.monotonic() - start, 3)
+    return record
+
+
+def load_checkpoint(path: str) -> set:
+    """
+    Return the ids already answered in a batch output file.
+    
+    A last line cut short by an interrupted run is truncated so appended
+    records start on a line of their own. Failed tasks are not counted, so
+    a resumed run retries them.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get('status') == 'ok':
+            done.add(str(record.get('id')))
+    return done
+
+
+def run_batch(lines, out, concurrency: int = 4, skip=frozenset(),
+              timeout: Optional[float] = None, progress=None,
+              progress_interval: float = 10.0) -> Dict[str, int]:
+    """
+    Run JSONL tasks concurrently, writing a JSONL record as each one finishes.
+    
+    Input is read lazily with at most ``2 * concurrency`` tasks queued, so
+    batches of any size run in constant memory. Each record is written and
+    flushed in one piece, which makes ``out`` the checkpoint for
+    ``load_checkpoint``; ids in ``skip`` are not run again. A
+    KeyboardInterrupt stops reading input, then waits for tasks already
+    running before it is re-raised.
+    
+    Args:
+        lines: Iterable of JSONL input lines
+        out: Text stream receiving result records
+        concurrency: Tasks in flight at once
+        skip: Ids of tasks already done
+        timeout: Seconds each task may take, or None
+        progress: Text stream for progress lines, or None
+        progress_interval: Seconds between progress lines
+        
+    Returns:
+        Counts of ``ok``, ``failed`` and ``skipped`` tasks
+    """
+    counts = {'ok': 0, 'failed': 0, 'skipped': 0}
+    start = last_report = time.monotonic()
+    
+    def write(task_id, record):
+        nonlocal last_report
+        record = dict(id=task_id, **record)
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+        counts['ok' if record['status'] == 'ok' else 'failed'] += 1
+        now = time.monotonic()
+        if progress is not None and now - last_report >= progress_interval:
+            last_report = now
+            finished = counts['ok'] + counts['failed']
+            print(f"[BATCH] {finished} done ({counts['failed']} failed), "
+                  f"{finished / (now - start):.1f} tasks/s", file=progress, flush=True)
+    
+    def collect(futures):
+        for future in futures:
+            write(running.pop(future), future.result())
+    
+    running = {}
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch')
+    try:
+        for task_id, item, error in read_batch(lines):
+            if task_id in skip:
+                counts['skipped'] += 1
+                continue
+            if item is None:
+                write(task_id, {'status': 'error', 'error': error, 'elapsed': 0.0})
+                continue
+            if len(running) >= 2 * concurrency:
+                collect(wait(running, return_when=FIRST_COMPLETED)[0])
+            running[pool.submit(run_batch_task, item, timeout)] = task_id
+        while running:
+            collect(wait(running, return_when=FIRST_COMPLETED)[0])
+    except KeyboardInterrupt:
+        for future in list(running):
+            if future.cancel():
+                running.pop(future)
+        if progress is not None and running:
+            print(f"[BATCH] Interrupted, finishing {len(running)} running tasks "
+                  f"(interrupt again to abandon them)", file=progress, flush=True)
+        while running:
+            collect(wait(running, return_when=FIRST_COMPLETED)[0])
+        raise
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return counts
+
+
+def batch_main(args) -> int:
+    """Run ``--batch`` mode; returns the exit status."""
+    if args.resume and not args.output:
+        print("--resume needs --output, the file holding finished results", file=sys.stderr)
+        return 2
+    if args.output and os.path.exists(args.output) and not args.resume:
+        print(f"{args.output} already exists; pass --resume to continue that run", file=sys.stderr)
+        return 2
+    
+    # Give every concurrent task a pooled connection
+    if args.concurrency > _upstream_client_options['pool_size']:
+        configure_upstream_client(pool_size=args.concurrency)
+    
+    skip = load_checkpoint(args.output) if args.resume else frozenset()
+    source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    start = time.monotonic()
+    try:
+        counts = run_batch(source, out, args.concurrency, skip, args.timeout, progress=sys.stderr)
+    except KeyboardInterrupt:
+        print("[BATCH] Stopped; run again with --resume to continue", file=sys.stderr)
+        return 130
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"[BATCH] {counts['ok']} ok, {counts['failed']} failed, {counts['skipped']} skipped "
+          f"in {time.monotonic() - start:.1f}s", file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+
 def main():
     """Command-line interface for the autonomous agent."""
+    parser = argparse.ArgumentParser(
+        description="SixFinger Autonomous AI Agent",
+        epilog='examples:\n'
+               '  python autonomous_agent.py "Research quantum computing"\n'
+               '  python autonomous_agent.py --parallel "Research Rust and Go, then compare them"\n'
+               '  python autonomous_agent.py --batch tasks.jsonl -o results.jsonl -c 16 --resume',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('task', nargs='*', help='task to execute')
+    parser.add_argument('--parallel', action='store_true',
+                        help='split the task into subtasks and run independent ones concurrently')
+    parser.add_argument('--batch', metavar='FILE',
+                        help="run JSONL tasks from FILE ('-' for stdin) instead of one task")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='batch: write JSONL results to FILE instead of stdout')
+    parser.add_argument('-c', '--concurrency', type=int, default=4,
+                        help='batch: tasks run at once (default: 4)')
+    parser.add_argument('--resume', action='store_true',
+                        help='batch: skip tasks already answered in --output')
+    parser.add_argument('--timeout', type=float, help='batch: seconds allowed per task')
+    args = parser.parse_args()
+    
+    if args.batch:
+        if args.concurrency < 1:
+            parser.error('--concurrency must be at least 1')
+        sys.exit(batch_main(args))
+    
     print("=" * 60)
     print("SixFinger Autonomous AI Agent")
     print("=" * 60)
     print()
     
-    if len(sys.argv) < 2:
-        print("Usage: python autonomous_agent.py <task>")
-        print("\nExamples:")
-        print('  python autonomous_agent.py "Research quantum computing"')
-        print('  python autonomous_agent.py "Write a Python function to sort a list"')
-        print('  python autonomous_agent.py "Analyze the benefits of AI"')
+    if not args.task:
+        parser.print_help()
         sys.exit(1)
     
-    task = ' '.join(sys.argv[1:])
+    task = ' '.join(args.task)
     agent = AutonomousAgent()
-    agent.parse_and_execute(task)
+    agent.parse_and_execute(task, parallel=args.parallel)
 
 
 if __name__ == "__main__":
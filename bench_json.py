@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the JSON backends used by the app and the stream parser.
+
+Compares the standard library against fast_json (orjson when installed)
+on the two hot paths: per request, decoding a request body and rendering
+a JSON response through the Flask provider; per token, decoding one
+upstream chat-completions chunk and encoding one SSE delta event.
+
+Usage:
+    python bench_json.py [--iterations N] [--repeat N] [--answer-bytes N] [--json]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+import fast_json
+from app import create_app
+from app.json_provider import OrjsonProvider
+
+_raw_decode = json.JSONDecoder().raw_decode
+
+
+def request_body() -> bytes:
+    return json.dumps({'prompt': 'Explain how neural networks learn', 'stream': False}).encode()
+
+
+def response_payload(answer_bytes: int) -> dict:
+    """A /query response carrying an answer of about ``answer_bytes``."""
+    return {
+        'success': True,
+        'response': ('Neural networks learn by adjusting weights. ' * (answer_bytes // 44 + 1))[:answer_bytes],
+        'usage': {
+            'user': 'bench', 'plan': 'pro', 'response_time': 4.2,
+            'tokens': {'prompt': 12, 'completion': 230, 'reasoning': 180, 'total': 242}
+        }
+    }
+
+
+def upstream_chunk() -> bytes:
+    return json.dumps({"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                       "choices": [{"index": 0, "delta": {"content": " token"}, "finish_reason": None}]},
+                      separators=(',', ':')).encode()
+
+
+def measure(fn, iterations: int, repeat: int) -> float:
+    """Best seconds per call over ``repeat`` runs of ``iterations`` calls."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = (time.perf_counter() - start) / iterations
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--answer-bytes', type=int, default=4000, help='size of the answer in the response')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    standard = DefaultJSONProvider(app)
+    fast = OrjsonProvider(app) if fast_json.orjson is not None else standard
+    body = request_body()
+    payload = response_payload(args.answer_bytes)
+    chunk = upstream_chunk()
+    delta = {'delta': ' token'}
+
+    cases = {
+        'request': {
+            'json': lambda: (standard.loads(body), standard.response(payload).get_data()),
+            fast_json.BACKEND: lambda: (fast.loads(body), fast.response(payload).get_data())
+        },
+        'token': {
+            'json': lambda: (_raw_decode(chunk.decode())[0], f"data: {json.dumps(delta)}\n\n"),
+            fast_json.BACKEND: lambda: (fast_json.decode_object(chunk), f"data: {fast_json.dumps(delta)}\n\n")
+        }
+    }
+
+    results = {}
+    with app.app_context():
+        for path, backends in cases.items():
+            results[path] = {name: round(measure(fn, args.iterations, args.repeat) * 1e6, 3)
+                             for name, fn in backends.items()}
+
+    if args.json:
+        print(json.dumps({'backend': fast_json.BACKEND, 'answer_bytes': args.answer_bytes,
+                          'microseconds': results}))
+        return 0
+
+    print(f"Fast backend: {fast_json.BACKEND}")
+    for path, label in (('request', 'per request'), ('token', 'per token')):
+        baseline = results[path]['json']
+        for name, micros in results[path].items():
+            print(f"  {label:<12} {name:<7} {micros:>9.3f} us  {baseline / micros:>5.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for parsing upstream chat-completions streams.
+
+Builds a synthetic SSE body and measures tokens parsed per second by the
+incremental parser in sse.py, against the previous line-based approach
+(decode each line, slice off "data: ", json.loads).
+
+Usage:
+    python bench_sse.py [--tokens N] [--chunk-size BYTES] [--repeat N] [--json]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import fast_json
+from sse import iter_deltas
+
+
+def build_body(tokens: int, reasoning_every: int = 0) -> bytes:
+    """Build an SSE body with one delta event per token."""
+    events = [b'data: {"choices":[{"index":0,"delta":{"role":"assistant"}}]}\n\n']
+    for i in range(tokens):
+        field = 'reasoning_content' if reasoning_every and i % reasoning_every == 0 else 'content'
+        chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": {field: f" tok{i}"}, "finish_reason": None}]}
+        events.append(b'data: ' + json.dumps(chunk).encode() + b'\n\n')
+    events.append(b'data: [DONE]\n\n')
+    return b''.join(events)
+
+
+def split(body: bytes, chunk_size: int):
+    """Cut a body into socket-sized chunks."""
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+def legacy_parse(chunks):
+    """The previous approach: reassemble lines, then decode and slice each one."""
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            line = line.decode()
+            if line and (data := line[6:]) != "[DONE]":
+                try:
+                    content = json.loads(data)['choices'][0]['delta'].get('content') or ''
+                except (json.JSONDecodeError, KeyError, IndexError):
+                    continue
+                if content:
+                    yield content
+
+
+def incremental_parse(chunks):
+    return iter_deltas(chunks)
+
+
+def measure(parse, chunks, repeat: int):
+    """Return (best seconds, deltas) over ``repeat`` runs."""
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in parse(chunks))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=1400, help='bytes per read, about one TCP segment')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    body = build_body(args.tokens)
+    chunks = split(body, args.chunk_size)
+
+    results = {}
+    for name, parse in (('legacy', legacy_parse), ('incremental', incremental_parse)):
+        seconds, deltas = measure(parse, chunks, args.repeat)
+        results[name] = {
+            'deltas': deltas,
+            'seconds': round(seconds, 4),
+            'tokens_per_sec': round(deltas / seconds),
+            'mb_per_sec': round(len(body) / seconds / 1e6, 1)
+        }
+
+    if args.json:
+        print(json.dumps({'tokens': args.tokens, 'chunk_size': args.chunk_size,
+                          'bytes': len(body), 'json_backend': fast_json.BACKEND, 'results': results}))
+        return 0
+
+    print(f"{args.tokens} tokens, {len(body)} bytes in {len(chunks)} chunks of {args.chunk_size} bytes"
+          f" (JSON backend: {fast_json.BACKEND})")
+    for name, res in results.items():
+        print(f"  {name:<12} {res['tokens_per_sec']:>10,} tokens/s  {res['mb_per_sec']:>6} MB/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
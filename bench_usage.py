@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the columnar API usage log.
+
+Fills a UsageLog with synthetic rows spread over users, endpoints and
+days, then reports the bytes held per row (compared with one slotted
+object per record, as the log used to store) and the time taken by the
+aggregations behind the admin and developer dashboards and by a user's
+latest rows from the per-user index, before and after a compaction pass
+folds rows past the retention window into rollups.
+
+Usage:
+    python bench_usage.py [--rows N] [--users N] [--days N] [--retention-days N] [--json]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app import usage_store
+from app.usage_store import UsageLog, to_micros
+
+ENDPOINTS = ('/api/v1/query', '/api/v1/stream', '/api/v1/batch', '/api/v1/sessions/messages')
+
+
+class _Record:
+    """The per-record object layout the log replaces."""
+
+    __slots__ = ('id', 'user_id', 'api_key_id', 'endpoint', 'method', 'status_code',
+                 'timestamp', 'response_time', 'time_to_first_token',
+                 'prompt_tokens', 'completion_tokens', 'reasoning_tokens')
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+def synthetic_rows(rows: int, users: int, days: int):
+    rng = random.Random(42)
+    end = datetime.utcnow()
+    start = end - timedelta(days=days)
+    step = (end - start) / rows
+    for i in range(rows):
+        user_id = rng.randint(1, users)
+        yield dict(
+            id=i + 1, user_id=user_id, api_key_id=user_id, endpoint=rng.choice(ENDPOINTS),
+            method='POST', status_code=200 if rng.random() > 0.02 else 500, timestamp=start + step * i,
+            response_time=rng.uniform(0.2, 8.0), time_to_first_token=rng.uniform(0.05, 1.0),
+            prompt_tokens=rng.randint(5, 500), completion_tokens=rng.randint(20, 2000), reasoning_tokens=0)
+
+
+def object_bytes(rows: int, users: int, days: int, sample: int = 20000) -> float:
+    """Bytes per record of a list of slotted objects, measured on a sample."""
+    tracemalloc.start()
+    records = [_Record(**row) for row in synthetic_rows(min(rows, sample), users, days)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(records)
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--retention-days', type=int, default=7, help='raw rows kept by the compaction pass')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    log = UsageLog()
+    for row in synthetic_rows(args.rows, args.users, args.days):
+        log.append(SimpleNamespace(**row))
+
+    now = datetime.utcnow()
+    week_ago = to_micros(now - timedelta(days=7))
+    today = to_micros(datetime.combine(now.date(), datetime.min.time()))
+    month_ago = to_micros(now - timedelta(days=args.days))
+    queries = {
+        'count_today': lambda: log.count(None, today),
+        'daily_stats': lambda: log.daily_counts(week_ago),
+        'endpoint_stats': lambda: log.endpoint_stats(1, month_ago),
+        'top_users': lambda: log.user_counts(month_ago),
+        'user_latest': lambda: log.latest(1, week_ago, limit=1000)
+    }
+    milliseconds = {name: round(timed(fn) * 1000, 2) for name, fn in queries.items()}
+    results = {
+        'backend': 'numpy' if usage_store.numpy is not None else 'python',
+        'rows': len(log),
+        'bytes_per_row': round(log.nbytes() / len(log), 1),
+        'object_bytes_per_row': round(object_bytes(args.rows, args.users, args.days), 1),
+        'milliseconds': milliseconds
+    }
+
+    # Fold everything past the retention window into rollups, then query again
+    compact = timed(lambda: log.compact(to_micros(now - timedelta(days=args.retention_days))))
+    results['compacted'] = dict(log.stats(), milliseconds=round(compact * 1000, 2), queries={
+        name: round(timed(fn) * 1000, 2) for name, fn in queries.items()})
+
+    if args.json:
+        print(json.dumps(results))
+        return 0
+
+    print(f"Aggregation backend: {results['backend']}")
+    print(f"  {results['rows']} rows, {results['bytes_per_row']} bytes/row columnar, "
+          f"{results['object_bytes_per_row']} bytes/row as objects")
+    print(f"  10M rows: ~{results['bytes_per_row'] * 1e7 / 2**20:.0f} MB columnar, "
+          f"~{results['object_bytes_per_row'] * 1e7 / 2**20:.0f} MB as objects")
+    compacted = results['compacted']
+    print(f"  compaction to {args.retention_days} days: {compacted['milliseconds']:.2f} ms, "
+          f"{compacted['rows']} rows and {compacted['hourly_rollups']} hourly / "
+          f"{compacted['daily_rollups']} daily rollups left")
+    print(f"  {'':<15} {'raw':>12} {'compacted':>12}")
+    for name, ms in milliseconds.items():
+        print(f"  {name:<15} {ms:>9.2f} ms {compacted['queries'][name]:>9.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -38,6 +38,82 @@ class Config:
     RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL', 'memory://')
     RATELIMIT_DEFAULT = "200 per day, 50 per hour"
     
+    # Upstream model connection pool (per worker process)
+    UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5.0))
+    UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 300.0))
+    
+    # Upstream retries and hedging
+    UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+    UPSTREAM_RETRY_BACKOFF = float(os.environ.get('UPSTREAM_RETRY_BACKOFF', 0.5))
+    UPSTREAM_RETRY_BACKOFF_MAX = float(os.environ.get('UPSTREAM_RETRY_BACKOFF_MAX', 8.0))
+    UPSTREAM_HEDGE = os.environ.get('UPSTREAM_HEDGE', 'false').lower() == 'true'
+    UPSTREAM_HEDGE_QUANTILE = float(os.environ.get('UPSTREAM_HEDGE_QUANTILE', 0.95))
+    UPSTREAM_HEDGE_MIN_SAMPLES = int(os.environ.get('UPSTREAM_HEDGE_MIN_SAMPLES', 20))
+    
+    # Upstream circuit breaker (per worker process)
+    UPSTREAM_BREAKER_ENABLED = os.environ.get('UPSTREAM_BREAKER_ENABLED', 'true').lower() == 'true'
+    UPSTREAM_BREAKER_WINDOW = int(os.environ.get('UPSTREAM_BREAKER_WINDOW', 20))
+    UPSTREAM_BREAKER_MIN_CALLS = int(os.environ.get('UPSTREAM_BREAKER_MIN_CALLS', 10))
+    UPSTREAM_BREAKER_FAILURE_RATIO = float(os.environ.get('UPSTREAM_BREAKER_FAILURE_RATIO', 0.5))
+    UPSTREAM_BREAKER_SLOW_CALL = float(os.environ.get('UPSTREAM_BREAKER_SLOW_CALL', 30.0))
+    UPSTREAM_BREAKER_SLOW_RATIO = float(os.environ.get('UPSTREAM_BREAKER_SLOW_RATIO', 0.8))
+    UPSTREAM_BREAKER_OPEN_SECONDS = float(os.environ.get('UPSTREAM_BREAKER_OPEN_SECONDS', 30.0))
+    
+    # Upstream providers: JSON list of OpenAI-compatible endpoints, empty for DeepInfra only
+    UPSTREAM_PROVIDERS = os.environ.get('UPSTREAM_PROVIDERS', '')
+    UPSTREAM_FAILOVER_AFTER = float(os.environ['UPSTREAM_FAILOVER_AFTER']) if os.environ.get('UPSTREAM_FAILOVER_AFTER') else None
+    
+    # Time budget for one API request; clients may ask for less with X-Request-Timeout
+    API_REQUEST_TIMEOUT = float(os.environ.get('API_REQUEST_TIMEOUT', 300.0))
+    
+    # Exact-match response cache (opt-in)
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR')  # Shared by all workers when set
+    
+    # Share one upstream call between identical concurrent requests
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+    
+    # Admission control for upstream calls (per worker process)
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+    ADMISSION_ADAPTIVE = True  # Adjust the concurrency limit with AIMD
+    ADMISSION_INITIAL_CONCURRENCY = int(os.environ.get('ADMISSION_INITIAL_CONCURRENCY', 8))
+    ADMISSION_MIN_CONCURRENCY = 1
+    ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', 32))
+    ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 16))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10.0))
+    ADMISSION_TARGET_LATENCY = float(os.environ.get('ADMISSION_TARGET_LATENCY', 60.0))
+    
+    # Background jobs for long-running agent tasks
+    JOBS_MAX_WORKERS = int(os.environ.get('JOBS_MAX_WORKERS', 4))
+    JOBS_RESULT_TTL = int(os.environ.get('JOBS_RESULT_TTL', 3600))
+    JOBS_MAX_ACTIVE_PER_USER = int(os.environ.get('JOBS_MAX_ACTIVE_PER_USER', 10))
+    JOBS_MAX_WAIT = 25  # Long-poll cap, kept below the gunicorn worker timeout
+    
+    # Response compression: zstd and brotli when installed, gzip always
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))  # Bytes; streams are always compressed
+    
+    # Server-side conversation sessions (per worker process)
+    SESSIONS_MAX = int(os.environ.get('SESSIONS_MAX', 10000))
+    SESSIONS_MAX_PER_USER = int(os.environ.get('SESSIONS_MAX_PER_USER', 100))
+    SESSIONS_TTL = int(os.environ.get('SESSIONS_TTL', 3600))  # Idle seconds before a session expires
+    SESSIONS_CONTEXT_TOKENS = int(os.environ.get('SESSIONS_CONTEXT_TOKENS', 8000))
+    SESSIONS_COMPACT_RATIO = 0.5  # Trim to this share of the budget so the prefix stays stable for several turns
+    SESSIONS_SUMMARIZE = os.environ.get('SESSIONS_SUMMARIZE', 'false').lower() == 'true'
+    
+    # Usage retention: raw records older than this are folded into hourly and daily rollups
+    USAGE_COMPACTION_ENABLED = os.environ.get('USAGE_COMPACTION_ENABLED', 'true').lower() == 'true'
+    USAGE_RAW_RETENTION_DAYS = int(os.environ.get('USAGE_RAW_RETENTION_DAYS', 7))
+    USAGE_HOURLY_RETENTION_DAYS = int(os.environ.get('USAGE_HOURLY_RETENTION_DAYS', 30))  # Daily rollups are kept for good
+    USAGE_COMPACTION_INTERVAL = int(os.environ.get('USAGE_COMPACTION_INTERVAL', 3600))  # Seconds between passes
+    
+    # Batch endpoint
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 1000))
+    BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 8))
+    
     # API Configuration
     API_RATE_LIMITS = {
         'free': {'daily': 100, 'monthly': 1000},
@@ -46,6 +122,14 @@ class Config:
         'enterprise': {'daily': -1, 'monthly': -1}  # Unlimited
     }
     
+    # Token quotas (prompt + completion tokens) per plan
+    API_TOKEN_LIMITS = {
+        'free': {'daily': 200000, 'monthly': 2000000},
+        'starter': {'daily': 2000000, 'monthly': 50000000},
+        'pro': {'daily': 20000000, 'monthly': 500000000},
+        'enterprise': {'daily': -1, 'monthly': -1}  # Unlimited
+    }
+    
     # Subscription Plans
     SUBSCRIPTION_PLANS = {
         'free': {
@@ -113,10 +197,17 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    USAGE_COMPACTION_ENABLED = False
+
+class BenchmarkConfig(ProductionConfig):
+    """Load-test configuration: production settings without per-IP rate limits"""
+    RATELIMIT_ENABLED = False
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
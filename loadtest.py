@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the API through gunicorn, against a fake upstream.
+
+Starts stub_upstream.py with the given model speed and failure rates, then,
+for each worker class, starts gunicorn serving the app pointed at the stub
+and drives /api/v1/query (buffered and streamed), /research, /code,
+/analyze and /usage with closed-loop clients, one endpoint at a time.
+Reports throughput, p50/p95/p99 latency and memory per worker as JSON.
+With --baseline, an earlier report is compared against and the exit
+status is 1 if throughput, latency or memory regressed beyond --tolerance.
+
+Usage:
+    python loadtest.py [--worker-classes sync,gthread,gevent] [--workers 2]
+                       [--threads 8] [--concurrency 16] [--duration 10]
+                       [--tokens 64] [--tokens-per-sec 400] [--ttft 0.2]
+                       [--output report.json] [--baseline report.json]
+"""
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+API_KEY = os.environ.get('LOADTEST_API_KEY', 'sk-loadtest-0000000000000000000000000000000000000000')
+
+# name: (method, path, body builder or None)
+SCENARIOS = {
+    'query': ('POST', '/api/v1/query', lambda n: {'prompt': f'Load test prompt {n}'}),
+    'query_stream': ('POST', '/api/v1/query', lambda n: {'prompt': f'Load test prompt {n}', 'stream': True}),
+    'research': ('POST', '/api/v1/research', lambda n: {'topic': f'Load test topic {n}'}),
+    'code': ('POST', '/api/v1/code', lambda n: {'requirements': f'Load test function {n}'}),
+    'analyze': ('POST', '/api/v1/analyze', lambda n: {'content': f'Load test content {n}'}),
+    'usage': ('GET', '/api/v1/usage', None),
+}
+
+# Worker classes needing a package that may not be installed
+WORKER_PACKAGES = {'gevent': 'gevent', 'eventlet': 'eventlet'}
+
+
+def create_benchmark_app():
+    """
+    Gunicorn app factory: the app with a load-test user on the enterprise plan.
+
+    Each worker seeds its own in-memory store with the same API key.
+    """
+    from app import create_app
+    from app.models import APIKey, Subscription, User
+
+    app = create_app('benchmark')
+    user = User(email='loadtest@example.com', username='loadtest', email_verified=True)
+    Subscription(user_id=user.id, plan='enterprise')
+    APIKey(user_id=user.id, key=API_KEY, name='load test', cache_enabled=False)
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(check, timeout: float, process: subprocess.Popen, what: str):
+    """Poll ``check()`` until it is true, failing if ``process`` exits first."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{what} exited with status {process.returncode}")
+        try:
+            if check():
+                return
+        except (OSError, requests.RequestException):
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{what} did not start within {timeout} seconds")
+
+
+def start_stub(args, output):
+    """Start the fake upstream; return (process, chat-completions URL)."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'stub_upstream.py'), '--port', str(port),
+         '--tokens', str(args.tokens), '--tokens-per-sec', str(args.tokens_per_sec),
+         '--ttft', str(args.ttft), '--error-rate', str(args.error_rate),
+         '--stall-rate', str(args.stall_rate), '--stall-seconds', str(args.stall_seconds),
+         '--seed', '0'],
+        stdout=subprocess.DEVNULL, stderr=output)
+    wait_for(lambda: socket.create_connection(('127.0.0.1', port), timeout=1).close() is None,
+             10, process, 'Stub upstream')
+    return process, f'http://127.0.0.1:{port}/v1/chat/completions'
+
+
+def start_gunicorn(worker_class: str, args, stub_url: str, output):
+    """Start gunicorn serving the benchmark app; return (process, base URL)."""
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-k', worker_class,
+               '-b', f'127.0.0.1:{port}', '--timeout', '120', '--log-level', 'warning']
+    if worker_class == 'gthread':
+        command += ['--threads', str(args.threads)]
+    elif worker_class in WORKER_PACKAGES:
+        command += ['--worker-connections', str(max(args.concurrency * 2, 100))]
+    command.append('loadtest:create_benchmark_app()')
+
+    env = dict(os.environ,
+               UPSTREAM_PROVIDERS=json.dumps([{'name': 'stub', 'url': stub_url}]),
+               LOADTEST_API_KEY=API_KEY)
+    process = subprocess.Popen(command, cwd=HERE, env=env, stdout=output, stderr=output)
+    base_url = f'http://127.0.0.1:{port}'
+    wait_for(lambda: requests.get(base_url + '/api/v1/health', timeout=2).ok,
+             30, process, 'gunicorn')
+    return process, base_url
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def worker_pids(master_pid: int):
+    """PIDs of the gunicorn workers forked by ``master_pid`` (Linux only)."""
+    pids = []
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may hold spaces; fields resume after ")"
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == master_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def memory_mb(pid: int):
+    """Current and peak resident memory of a process, in MB, or None."""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    values[line[:5]] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return {'rss_mb': values.get('VmRSS'), 'peak_rss_mb': values.get('VmHWM')}
+
+
+def percentile(values, q: float):
+    """Nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+def run_scenario(base_url: str, name: str, concurrency: int, duration: float):
+    """Drive one endpoint with ``concurrency`` closed-loop clients for ``duration`` seconds."""
+    method, path, build = SCENARIOS[name]
+    headers = {'X-API-Key': API_KEY}
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))  # unique prompts: no cache hits or coalescing
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            with lock:
+                n = next(counter)
+            body = build(n) if build else None
+            start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, json=body,
+                                           headers=headers, timeout=120)
+                response.content  # read streams to the end
+                status = str(response.status_code)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == '200':
+                    latencies.append(elapsed)
+        session.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    total = sum(statuses.values())
+    return {
+        'requests': total,
+        'errors': total - len(latencies),
+        'status_codes': statuses,
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'latency_ms': {
+            key: round(value * 1000, 1) if value is not None else None
+            for key, value in (('p50', percentile(latencies, 50)),
+                               ('p95', percentile(latencies, 95)),
+                               ('p99', percentile(latencies, 99)),
+                               ('max', latencies[-1] if latencies else None))
+        }
+    }
+
+
+def run_worker_class(worker_class: str, args, stub_url: str, output):
+    """Load-test every scenario on one gunicorn worker class."""
+    process, base_url = start_gunicorn(worker_class, args, stub_url, output)
+    try:
+        # Touch every endpoint once so imports and first-use setup are not timed
+        for name in args.endpoints:
+            run_scenario(base_url, name, 1, 0.001)
+        endpoints = {}
+        for name in args.endpoints:
+            endpoints[name] = run_scenario(base_url, name, args.concurrency, args.duration)
+        memory = [memory_mb(pid) for pid in worker_pids(process.pid)]
+        memory = [m for m in memory if m is not None]
+    finally:
+        stop(process)
+    return {
+        'workers': args.workers,
+        'threads': args.threads if worker_class == 'gthread' else 1,
+        'memory_per_worker': memory,
+        'endpoints': endpoints
+    }
+
+
+def compare(report, baseline, tolerance: float, min_latency_ms: float = 5.0):
+    """
+    List regressions of ``report`` against ``baseline``.
+
+    Throughput may drop, and p95/p99 latency and peak worker memory may
+    grow, by ``tolerance`` (a fraction) before counting; latency changes
+    under ``min_latency_ms`` are ignored as noise.
+    """
+    regressions = []
+    for worker_class, result in report['results'].items():
+        base = baseline.get('results', {}).get(worker_class)
+        if not base or 'endpoints' not in base or 'endpoints' not in result:
+            continue
+        for name, now in result['endpoints'].items():
+            before = base['endpoints'].get(name)
+            if not before:
+                continue
+            if now['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+                regressions.append({'worker_class': worker_class, 'endpoint': name,
+                                    'metric': 'throughput_rps',
+                                    'baseline': before['throughput_rps'], 'current': now['throughput_rps']})
+            for key in ('p95', 'p99'):
+                old, new = before['latency_ms'][key], now['latency_ms'][key]
+                if old is not None and new is not None and new > old * (1 + tolerance) and new - old > min_latency_ms:
+                    regressions.append({'worker_class': worker_class, 'endpoint': name,
+                                        'metric': f'latency_ms.{key}', 'baseline': old, 'current': new})
+        old = max((m['peak_rss_mb'] or 0 for m in base.get('memory_per_worker', [])), default=0)
+        new = max((m['peak_rss_mb'] or 0 for m in result.get('memory_per_worker', [])), default=0)
+        if old and new > old * (1 + tolerance):
+            regressions.append({'worker_class': worker_class, 'endpoint': None,
+                                'metric': 'peak_rss_mb', 'baseline': old, 'current': new})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--worker-classes', default='sync,gthread,gevent',
+                        help='comma-separated gunicorn worker classes; missing packages are skipped')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    parser.add_argument('--endpoints', default=','.join(SCENARIOS),
+                        help=f"comma-separated scenarios from: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per endpoint')
+    parser.add_argument('--tokens', type=int, default=64, help='stub tokens per answer')
+    parser.add_argument('--tokens-per-sec', type=float, default=400.0)
+    parser.add_argument('--ttft', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--stall-seconds', type=float, default=5.0)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--verbose', action='store_true', help='show stub and gunicorn logs')
+    args = parser.parse_args()
+    args.endpoints = [name for name in args.endpoints.split(',') if name]
+    unknown = set(args.endpoints) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    output = None if args.verbose else subprocess.DEVNULL
+    report = {
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'baseline', 'verbose')},
+        'results': {}
+    }
+    stub, stub_url = start_stub(args, output)
+    try:
+        for worker_class in [k for k in args.worker_classes.split(',') if k]:
+            package = WORKER_PACKAGES.get(worker_class)
+            if package and importlib.util.find_spec(package) is None:
+                report['results'][worker_class] = {'skipped': f"{package} is not installed"}
+                continue
+            print(f"Load testing {worker_class} workers...", file=sys.stderr, flush=True)
+            report['results'][worker_class] = run_worker_class(worker_class, args, stub_url, output)
+    finally:
+        stop(stub)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+Incremental parsing of Server-Sent Events from chat-completions streams
+
+Upstream bodies are fed in as raw bytes straight off the socket and come
+out as content and reasoning deltas, delivered to a sink chosen by the
+caller: a callback, a generator or a queue. Nothing here writes to stdout
+unless a ConsoleSink is asked for explicitly.
+"""
+import sys
+import time
+
+import fast_json
+
+CONTENT = 'content'
+REASONING = 'reasoning'
+
+# Decoder for event payloads, which are compact JSON objects; orjson
+# parses the bytes directly when installed
+_decode = fast_json.decode_object
+
+
+class SSEParser:
+    """
+    Byte-level incremental parser for ``text/event-stream`` bodies.
+
+    Chunks may split lines, or even CRLF pairs, anywhere. ``on_data`` is
+    called with the ``data`` payload (bytes) of each complete event:
+    multi-line data is joined with ``\\n``, the space after ``data:`` is
+    optional, comment lines are skipped, and event/id/retry fields are
+    ignored because chat-completions streams do not use them.
+    """
+
+    __slots__ = ('_on_data', '_buffer', '_data')
+
+    def __init__(self, on_data):
+        self._on_data = on_data
+        self._buffer = b''
+        self._data = None  # data of the event being assembled
+
+    def feed(self, chunk):
+        """Parse a chunk of bytes, dispatching every event it completes"""
+        if self._buffer:
+            chunk = self._buffer + chunk
+        tail = b''
+        if b'\r' in chunk:
+            # A trailing CR may be the first half of a CRLF split across chunks
+            if chunk.endswith(b'\r'):
+                chunk, tail = chunk[:-1], b'\r'
+            chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+        find = chunk.find
+        startswith = chunk.startswith
+        on_data = self._on_data
+        data = self._data
+        start = 0
+        while True:
+            end = find(b'\n', start)
+            if end < 0:
+                break
+            if end == start:
+                # Blank line ends the event
+                if data is not None:
+                    on_data(data)
+                    data = None
+            elif startswith(b'data: ', start):
+                value = chunk[start + 6:end]
+                data = value if data is None else data + b'\n' + value
+            elif startswith(b'data', start):
+                value = self._field_value(chunk, start + 4, end)
+                if value is not None:
+                    data = value if data is None else data + b'\n' + value
+            # Anything else is a comment (":...") or an unused field
+            start = end + 1
+
+        self._data = data
+        self._buffer = chunk[start:] + tail if start < len(chunk) else tail
+
+    @staticmethod
+    def _field_value(chunk, start, end):
+        """Value of a ``data`` line with no space after the colon, or None for another field"""
+        if start == end:
+            return b''
+        if chunk[start] != 58:  # ':'
+            return None
+        return chunk[start + 1:end]
+
+    def close(self):
+        """
+        Flush a final event the stream ended without terminating.
+
+        Strict SSE discards it, but upstreams occasionally close the
+        connection right after the last ``data:`` line.
+        """
+        if self._buffer:
+            self.feed(b'\n')
+        if self._data is not None:
+            data, self._data = self._data, None
+            self._on_data(data)
+
+
+class ChatStreamDecoder:
+    """
+    Turns a chat-completions SSE body into deltas for a sink.
+
+    ``sink(kind, text)`` is called for every non-empty delta, where kind
+    is CONTENT or REASONING (``reasoning_content`` from reasoning models).
+    Keep-alives, role-only and malformed chunks are skipped; ``done`` is set
+    once the ``[DONE]`` marker arrives. ``usage`` holds the last non-empty
+    ``usage`` block seen, sent when ``stream_options.include_usage`` is on.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.done = False
+        self.usage = None
+        self._parser = SSEParser(self._on_data)
+
+    def feed(self, chunk):
+        """Parse a chunk of bytes"""
+        self._parser.feed(chunk)
+
+    def close(self):
+        """Flush anything left once the body has ended"""
+        self._parser.close()
+
+    def _on_data(self, data):
+        if data == b'[DONE]':
+            self.done = True
+            return
+        try:
+            chunk = _decode(data)
+            usage = chunk.get('usage')
+            if usage:
+                self.usage = usage
+            delta = chunk['choices'][0]['delta']
+            reasoning = delta.get('reasoning_content')
+            content = delta.get('content')
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):  # UnicodeDecodeError is a ValueError
+            return
+        if reasoning:
+            self.sink(REASONING, reasoning)
+        if content:
+            self.sink(CONTENT, content)
+
+
+def drain(chunks, sink):
+    """
+    Decode an iterable of byte chunks into ``sink`` (callback sink).
+
+    Stops reading at ``[DONE]`` so the connection can be released early.
+    Returns the upstream ``usage`` block, or None if none was sent.
+    """
+    decoder = ChatStreamDecoder(sink)
+    for chunk in chunks:
+        decoder.feed(chunk)
+        if decoder.done:
+            break
+    decoder.close()
+    return decoder.usage
+
+
+def _collector(include_reasoning):
+    """Return a list and a sink appending deltas to it"""
+    pending = []
+    append = pending.append
+
+    if include_reasoning:
+        def sink(kind, text):
+            append((kind, text))
+    else:
+        def sink(kind, text):
+            if kind == CONTENT:
+                append(text)
+    return pending, sink
+
+
+def iter_deltas(chunks, include_reasoning=False, on_usage=None):
+    """
+    Decode an iterable of byte chunks lazily (generator sink).
+
+    Yields content strings, or ``(kind, text)`` pairs when
+    ``include_reasoning`` is set. ``on_usage(usage)`` is called with the
+    upstream usage block (or None) once the stream ends.
+    """
+    pending, sink = _collector(include_reasoning)
+    decoder = ChatStreamDecoder(sink)
+    for chunk in chunks:
+        decoder.feed(chunk)
+        if pending:
+            yield from pending
+            pending.clear()
+        if decoder.done:
+            break
+    else:
+        decoder.close()
+        yield from pending
+    if on_usage is not None:
+        on_usage(decoder.usage)
+
+
+async def aiter_deltas(chunks, include_reasoning=False, on_usage=None):
+    """Async counterpart of iter_deltas for an async iterable of bytes"""
+    pending, sink = _collector(include_reasoning)
+    decoder = ChatStreamDecoder(sink)
+    async for chunk in chunks:
+        decoder.feed(chunk)
+        if pending:
+            for item in pending:
+                yield item
+            pending.clear()
+        if decoder.done:
+            break
+    else:
+        decoder.close()
+        for item in pending:
+            yield item
+    if on_usage is not None:
+        on_usage(decoder.usage)
+
+
+class QueueSink:
+    """
+    Sink that puts ``(kind, text)`` pairs on a queue for another thread.
+
+    Call ``close()`` when the stream ends to put the ``None`` sentinel.
+    """
+
+    def __init__(self, queue, include_reasoning=True):
+        self.queue = queue
+        self.include_reasoning = include_reasoning
+
+    def __call__(self, kind, text):
+        if kind == CONTENT or self.include_reasoning:
+            self.queue.put((kind, text))
+
+    def close(self):
+        self.queue.put(None)
+
+
+class ConsoleSink:
+    """
+    Sink that echoes content to a text stream, for the command line.
+
+    Output is buffered and flushed at a newline or after
+    ``flush_interval`` seconds, so a fast stream costs a few writes per
+    second instead of a write and flush per token.
+    """
+
+    def __init__(self, stream=None, flush_interval=0.05, include_reasoning=False):
+        self.stream = stream if stream is not None else sys.stdout
+        self.flush_interval = flush_interval
+        self.include_reasoning = include_reasoning
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def __call__(self, kind, text):
+        if kind != CONTENT and not self.include_reasoning:
+            return
+        self._pending.append(text)
+        if '\n' in text or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write out buffered text"""
+        if self._pending:
+            self.stream.write(''.join(self._pending))
+            self._pending.clear()
+        self.stream.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush and end the line"""
+        self._pending.append('\n')
+        self.flush()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Local fake of an OpenAI-compatible chat-completions endpoint.
+
+Answers ``POST .../chat/completions`` with generated text, streamed as SSE
+(``"stream": true``) or as one JSON body, so the app can be exercised and
+benchmarked without calling a real model provider. Speed and failures are
+configurable: time to first token, tokens per second, injected error
+responses and mid-stream stalls. Connections are kept alive, as with a
+real provider.
+
+Usage:
+    python stub_upstream.py [--port 8400] [--tokens 64] [--tokens-per-sec 200]
+                            [--ttft 0.3] [--error-rate 0.01] [--stall-rate 0.01]
+
+Point the app at it with:
+    UPSTREAM_PROVIDERS='[{"name": "stub", "url": "http://127.0.0.1:8400/v1/chat/completions"}]'
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubUpstream:
+    """
+    Fake chat-completions server running on a background thread.
+
+    Every answer is ``tokens`` deltas (``tok0 tok1 ...``), or ``reply`` as a
+    single delta when given. The first delta is sent ``ttft`` seconds after
+    the request, then deltas are paced at ``tokens_per_sec`` (0 for no
+    limit). A share ``error_rate`` of requests gets an ``error_status``
+    error instead, and a share ``stall_rate`` of streams pauses for
+    ``stall_seconds`` halfway through. Attributes may be changed while the
+    server runs.
+
+    The last request bodies and headers are kept in ``received``.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, tokens: int = 64,
+                 tokens_per_sec: float = 0.0, ttft: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, stall_rate: float = 0.0, stall_seconds: float = 5.0,
+                 reply: str = None, seed: int = None):
+        self.tokens = tokens
+        self.tokens_per_sec = tokens_per_sec
+        self.ttft = ttft
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.reply = reply
+        self.received = deque(maxlen=100)
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._errors = 0
+        self._stalls = 0
+
+        self.server = _Server((host, port), _handler(self))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The chat-completions URL to configure as a provider."""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1/chat/completions'
+
+    def start(self) -> 'StubUpstream':
+        """Serve on a daemon thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop serving and release the port."""
+        if self._thread is not None:
+            self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        """Return request counters."""
+        with self._lock:
+            return {'calls': self._calls, 'errors': self._errors, 'stalls': self._stalls}
+
+    def _plan(self):
+        """Decide the fate of one request: (fail, stall)."""
+        with self._lock:
+            self._calls += 1
+            fail = self._random.random() < self.error_rate
+            stall = not fail and self._random.random() < self.stall_rate
+            self._errors += fail
+            self._stalls += stall
+        return fail, stall
+
+    def _pieces(self):
+        if self.reply is not None:
+            return [self.reply]
+        return [f'tok{i} ' for i in range(self.tokens)]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is routine
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _handler(stub: StubUpstream):
+    """Build the request handler class bound to ``stub``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, chunked streams
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                return self._send_json(404, {'error': {'message': 'Not found'}})
+            try:
+                request = json.loads(body)
+            except ValueError:
+                return self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            stub.received.append((request, dict(self.headers)))
+
+            fail, stall = stub._plan()
+            if fail:
+                time.sleep(stub.ttft)
+                return self._send_json(stub.error_status, {'error': {'message': 'Injected failure'}})
+
+            pieces = stub._pieces()
+            messages = request.get('messages') or []
+            prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in messages)
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(pieces),
+                     'total_tokens': prompt_tokens + len(pieces)}
+            model = request.get('model', 'stub')
+            try:
+                if request.get('stream'):
+                    include_usage = (request.get('stream_options') or {}).get('include_usage')
+                    self._stream(pieces, model, usage if include_usage else None, stall)
+                else:
+                    self._complete(pieces, model, usage)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # the client gave up
+
+        def _complete(self, pieces, model, usage):
+            interval = 1.0 / stub.tokens_per_sec if stub.tokens_per_sec else 0.0
+            time.sleep(stub.ttft + interval * max(0, len(pieces) - 1))
+            self._send_json(200, {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': ''.join(pieces)}}],
+                'usage': usage
+            })
+
+        def _stream(self, pieces, model, usage, stall):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def event(delta, finish_reason=None):
+                return b'data: ' + json.dumps({
+                    'id': 'chatcmpl-stub',
+                    'object': 'chat.completion.chunk',
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+                }, separators=(',', ':')).encode() + b'\n\n'
+
+            self.wfile.flush()
+            pending = [event({'role': 'assistant'})]
+
+            def flush():
+                if pending:
+                    data = b''.join(pending)
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                    self.wfile.flush()
+                    pending.clear()
+
+            # Headers go out at once; the body starts with the first token
+            time.sleep(stub.ttft)
+            interval = 1.0 / stub.tokens_per_sec if stub.tokens_per_sec else 0.0
+            start = time.monotonic()
+            for i, text in enumerate(pieces):
+                if interval:
+                    # Batch whatever is already due into one write
+                    delay = start + i * interval - time.monotonic()
+                    if delay > 0.001:
+                        flush()
+                        time.sleep(delay)
+                if stall and i == len(pieces) // 2:
+                    flush()
+                    time.sleep(stub.stall_seconds)
+                    start += stub.stall_seconds
+                pending.append(event({'content': text}))
+            pending.append(event({}, 'stop'))
+            if usage is not None:
+                pending.append(b'data: ' + json.dumps({'choices': [], 'usage': usage}).encode() + b'\n\n')
+            pending.append(b'data: [DONE]\n\n')
+            flush()
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if status in (429, 503):
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8400)
+    parser.add_argument('--tokens', type=int, default=64, help='deltas per answer')
+    parser.add_argument('--tokens-per-sec', type=float, default=0.0, help='0 for no limit')
+    parser.add_argument('--ttft', type=float, default=0.0, help='seconds before the first token')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='share of streams that stall halfway')
+    parser.add_argument('--stall-seconds', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    stub = StubUpstream(args.host, args.port, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                        ttft=args.ttft, error_rate=args.error_rate, error_status=args.error_status,
+                        stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, seed=args.seed)
+    print(f"Stub upstream listening on {stub.url}", flush=True)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
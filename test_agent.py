@@ -4,10 +4,24 @@ Basic tests for the autonomous agent.
 Tests the core functionality without requiring API calls.
 """
 
+import asyncio
+import io
+import json
+import os
 import sys
+import tempfile
+import time
 import unittest
 from unittest.mock import Mock, patch, MagicMock
-from autonomous_agent import AutonomousAgent
+import queue
+import httpx
+import requests
+from sse import ConsoleSink, QueueSink, SSEParser, drain, iter_deltas
+from stub_upstream import StubUpstream
+from autonomous_agent import (
+    load_checkpoint, read_batch, run_batch, AutonomousAgent, AsyncAutonomousAgent, CircuitBreaker, CircuitOpen, DeadlineExceeded,
+    Provider, ProviderRegistry, RetryPolicy, Subtask, TokenUsage, UpstreamClient, get_upstream_client
+)
 
 
 class TestAutonomousAgent(unittest.TestCase):
@@ -28,7 +42,7 @@ class TestAutonomousAgent(unittest.TestCase):
         custom_agent = AutonomousAgent(model="custom-model")
         self.assertEqual(custom_agent.model, "custom-model")
     
-    @patch('autonomous_agent.r.post')
+    @patch('autonomous_agent.r.Session.post')
     def test_query_non_streaming(self, mock_post):
         """Test non-streaming query."""
         # Mock response
@@ -44,17 +58,17 @@ class TestAutonomousAgent(unittest.TestCase):
         self.assertEqual(result, 'Test response')
         mock_post.assert_called_once()
     
-    @patch('autonomous_agent.r.post')
+    @patch('autonomous_agent.r.Session.post')
     def test_query_streaming(self, mock_post):
         """Test streaming query."""
         # Mock streaming response
         mock_response = Mock()
-        mock_lines = [
-            b'data: {"choices":[{"delta":{"content":"Hello"}}]}',
-            b'data: {"choices":[{"delta":{"content":" World"}}]}',
-            b'data: [DONE]'
+        mock_chunks = [
+            b'data: {"choices":[{"delta":{"content":"Hello"}}]}\n\n',
+            b'data: {"choices":[{"delta":{"content":" World"}}]}\n\n',
+            b'data: [DONE]\n\n'
         ]
-        mock_response.iter_lines.return_value = mock_lines
+        mock_response.iter_content.return_value = mock_chunks
         mock_response.raise_for_status.return_value = None
         mock_post.return_value = mock_response
         
@@ -64,7 +78,60 @@ class TestAutonomousAgent(unittest.TestCase):
         self.assertEqual(result, 'Hello World')
         mock_post.assert_called_once()
     
-    @patch('autonomous_agent.r.post')
+    @patch('autonomous_agent.r.Session.post')
+    def test_stream(self, mock_post):
+        """Test that stream yields deltas without printing."""
+        mock_response = Mock()
+        mock_response.iter_content.return_value = [
+            b'data: {"choices":[{"delta":{"content":"Hello"}}]}\n\n',
+            b'data: {"choices":[{"delta":{"content":" World"}}]}\n\n',
+            b'data: [DONE]\n\n'
+        ]
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+        
+        with patch('builtins.print') as mock_print:
+            chunks = list(self.agent.stream("Test prompt"))
+        
+        self.assertEqual(chunks, ['Hello', ' World'])
+        mock_print.assert_not_called()
+        mock_response.close.assert_called_once()
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_stream_records_usage(self, mock_post):
+        """Test that the usage chunk of a stream is kept as last_usage."""
+        mock_response = Mock()
+        mock_response.iter_content.return_value = [
+            b'data: {"choices":[{"delta":{"content":"Hi"}}],"usage":null}\n\n',
+            b'data: {"choices":[],"usage":{"prompt_tokens":7,"completion_tokens":5,'
+            b'"completion_tokens_details":{"reasoning_tokens":3}}}\n\n',
+            b'data: [DONE]\n\n'
+        ]
+        mock_post.return_value = mock_response
+        
+        self.assertEqual(list(self.agent.stream("Test prompt")), ['Hi'])
+        
+        self.assertEqual(self.agent.last_usage, TokenUsage(7, 5, 3))
+        self.assertEqual(self.agent.last_usage.total_tokens, 12)
+        payload = mock_post.call_args.kwargs['json']
+        self.assertEqual(payload['stream_options'], {'include_usage': True})
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_query_non_streaming_records_usage(self, mock_post):
+        """Test that the usage block of a buffered response is kept."""
+        mock_response = Mock()
+        mock_response.json.return_value = {
+            'choices': [{'message': {'content': 'Test response'}}],
+            'usage': {'prompt_tokens': 4, 'completion_tokens': 2}
+        }
+        mock_post.return_value = mock_response
+        
+        self.agent.query("Test prompt", stream=False)
+        
+        self.assertEqual(self.agent.last_usage, TokenUsage(4, 2, 0))
+        self.assertNotIn('stream_options', mock_post.call_args.kwargs['json'])
+    
+    @patch('autonomous_agent.r.Session.post')
     def test_query_error_handling(self, mock_post):
         """Test error handling in query."""
         mock_post.side_effect = Exception("API Error")
@@ -76,7 +143,7 @@ class TestAutonomousAgent(unittest.TestCase):
     def test_handle_stream_empty(self):
         """Test stream handling with empty response."""
         mock_response = Mock()
-        mock_response.iter_lines.return_value = []
+        mock_response.iter_content.return_value = []
         
         with patch('builtins.print'):
             result = self.agent._handle_stream(mock_response)
@@ -86,17 +153,47 @@ class TestAutonomousAgent(unittest.TestCase):
     def test_handle_stream_with_content(self):
         """Test stream handling with content."""
         mock_response = Mock()
-        mock_lines = [
-            b'data: {"choices":[{"delta":{"content":"Test"}}]}',
-            b'data: [DONE]'
+        mock_chunks = [
+            b'data: {"choices":[{"delta":{"content":"Test"}}]}\n\n',
+            b'data: [DONE]\n\n'
         ]
-        mock_response.iter_lines.return_value = mock_lines
+        mock_response.iter_content.return_value = mock_chunks
         
         with patch('builtins.print'):
             result = self.agent._handle_stream(mock_response)
         
         self.assertEqual(result, 'Test')
     
+    def test_handle_stream_custom_sink(self):
+        """Test that a sink receives deltas and nothing is echoed."""
+        mock_response = Mock()
+        mock_response.iter_content.return_value = [
+            b'data: {"choices":[{"delta":{"reasoning_content":"Hmm"}}]}\n\n'
+            b'data: {"choices":[{"delta":{"content":"Test"}}]}\n\n'
+        ]
+        received = []
+        
+        with patch('sys.stdout') as mock_stdout:
+            result = self.agent._handle_stream(mock_response, lambda kind, text: received.append((kind, text)))
+        
+        self.assertEqual(result, 'Test')
+        self.assertEqual(received, [('reasoning', 'Hmm'), ('content', 'Test')])
+        mock_stdout.write.assert_not_called()
+    
+    def test_handle_stream_without_echo(self):
+        """Test that echo=False never writes to stdout."""
+        agent = AutonomousAgent(echo=False)
+        mock_response = Mock()
+        mock_response.iter_content.return_value = [
+            b'data: {"choices":[{"delta":{"content":"Test"}}]}\n\n'
+        ]
+        
+        with patch('sys.stdout') as mock_stdout:
+            result = agent._handle_stream(mock_response)
+        
+        self.assertEqual(result, 'Test')
+        mock_stdout.write.assert_not_called()
+    
     @patch.object(AutonomousAgent, 'query')
     def test_research_method(self, mock_query):
         """Test research method."""
@@ -149,6 +246,597 @@ class TestAutonomousAgent(unittest.TestCase):
         mock_query.assert_called_once()
 
 
+class TestParallelExecution(unittest.TestCase):
+    """Test cases for planned, concurrent subtask execution."""
+    
+    PLAN = json.dumps({'subtasks': [
+        {'id': 's1', 'task': 'Research Rust', 'depends_on': []},
+        {'id': 's2', 'task': 'Research Go', 'depends_on': []},
+        {'id': 's3', 'task': 'Compare them', 'depends_on': ['s1', 's2']},
+    ]})
+    
+    def test_parse_plan(self):
+        """Test that plans are read from fenced JSON and cycles are rejected."""
+        subtasks = AutonomousAgent._parse_plan(f"Here you go:\n```json\n{self.PLAN}\n```", 6)
+        self.assertEqual(subtasks, [Subtask('s1', 'Research Rust'), Subtask('s2', 'Research Go'),
+                                    Subtask('s3', 'Compare them', ('s1', 's2'))])
+        
+        cyclic = json.dumps({'subtasks': [{'id': 'a', 'task': 'x', 'depends_on': ['b']},
+                                          {'id': 'b', 'task': 'y', 'depends_on': ['a']}]})
+        self.assertIsNone(AutonomousAgent._parse_plan(cyclic, 6))
+        self.assertIsNone(AutonomousAgent._parse_plan("I cannot plan this", 6))
+        
+        unknown = json.dumps({'subtasks': [{'task': 'x', 'depends_on': ['zz']}, {'task': 'y'}]})
+        self.assertEqual(AutonomousAgent._parse_plan(unknown, 1), [Subtask('s1', 'x')])
+    
+    def test_independent_subtasks_run_concurrently(self):
+        """Test that wall-clock time follows the longest chain and results flow to dependents."""
+        prompts = []
+        
+        def fake_query(agent, prompt, stream=True, sink=None):
+            prompts.append(prompt)
+            agent.last_usage = TokenUsage(1, 10, 0)
+            if 'Reply with JSON only' in prompt:
+                return self.PLAN
+            if 'Subtask results:' in prompt:
+                return 'final answer'
+            time.sleep(0.3)
+            return prompt.split('Your subtask: ')[1].split('\n')[0].replace('Research', 'notes on')
+        
+        agent = AutonomousAgent(echo=False)
+        with patch.object(AutonomousAgent, 'query', autospec=True, side_effect=fake_query), \
+                patch('builtins.print'):
+            start = time.monotonic()
+            result = agent.parse_and_execute("Research Rust and Go, then compare them", parallel=True)
+            elapsed = time.monotonic() - start
+        
+        self.assertEqual(result, 'final answer')
+        self.assertLess(elapsed, 0.85)  # two levels of 0.3s, not three subtasks in a row
+        compare = next(p for p in prompts if 'Your subtask: Compare them' in p)
+        self.assertIn('notes on Rust', compare)
+        self.assertIn('notes on Go', compare)
+        self.assertIn('[s3] Compare them', prompts[-1])
+        self.assertEqual(agent.last_usage, TokenUsage(5, 50, 0))
+    
+    @patch.object(AutonomousAgent, 'query')
+    def test_unsplittable_task_runs_once(self, mock_query):
+        """Test the single-prompt fallback when no useful plan comes back."""
+        mock_query.side_effect = ['not json', 'Task completed']
+        
+        with patch('builtins.print'):
+            result = AutonomousAgent(echo=False).parse_and_execute("Do something", parallel=True)
+        
+        self.assertEqual(result, 'Task completed')
+        self.assertEqual(mock_query.call_count, 2)
+        self.assertIn('Execute the task now', mock_query.call_args.args[0])
+
+
+class TestBatchMode(unittest.TestCase):
+    """Test cases for JSONL batch runs from the command line."""
+    
+    def test_read_batch(self):
+        """Test ids, bare task strings and invalid lines."""
+        lines = ['{"id": "a", "type": "code", "requirements": "sort"}\n', '\n',
+                 '"Research AI"\n', 'oops\n', '[1]\n']
+        parsed = list(read_batch(lines))
+        
+        self.assertEqual(parsed[0], ('a', {'id': 'a', 'type': 'code', 'requirements': 'sort'}, None))
+        self.assertEqual(parsed[1], ('3', {'task': 'Research AI'}, None))
+        self.assertEqual([(p[0], p[1]) for p in parsed[2:]], [('4', None), ('5', None)])
+    
+    def test_runs_concurrently_and_writes_as_completed(self):
+        """Test concurrency, per-task records and skipping finished ids."""
+        def fake_stream(agent, prompt):
+            time.sleep(0.3 if 'slow' in prompt else 0.1)
+            agent.last_usage = TokenUsage(2, 5, 1)
+            yield 'answer'
+        
+        lines = [json.dumps({'id': f't{i}', 'task': 'slow' if i == 0 else f'task {i}'}) for i in range(5)]
+        lines.append(json.dumps({'id': 'bad', 'type': 'dance'}))
+        out = io.StringIO()
+        with patch.object(AutonomousAgent, 'stream', autospec=True, side_effect=fake_stream):
+            start = time.monotonic()
+            counts = run_batch(lines, out, concurrency=4, skip={'t4'})
+            elapsed = time.monotonic() - start
+        
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(counts, {'ok': 4, 'failed': 1, 'skipped': 1})
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(records[-1]['id'], 't0')  # the slow task finishes last
+        by_id = {r['id']: r for r in records}
+        self.assertEqual(by_id['t1']['tokens'], {'prompt': 2, 'completion': 5, 'reasoning': 1, 'total': 7})
+        self.assertEqual(by_id['bad']['status'], 'error')
+        self.assertIn('elapsed', by_id['t1'])
+    
+    def test_checkpoint_resume(self):
+        """Test that only answered ids are skipped and a torn last line is dropped."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.jsonl')
+            with open(path, 'w') as f:
+                f.write('{"id": "a", "status": "ok"}\n{"id": "b", "status": "error"}\n{"id": "c", "sta')
+            
+            self.assertEqual(load_checkpoint(path), {'a'})
+            with open(path) as f:
+                self.assertTrue(f.read().endswith('"error"}\n'))
+            self.assertEqual(load_checkpoint(os.path.join(tmp, 'missing.jsonl')), set())
+
+
+class TestSSEParser(unittest.TestCase):
+    """Test cases for the incremental SSE parser and sinks."""
+    
+    def _events(self, *chunks):
+        events = []
+        parser = SSEParser(events.append)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+        return events
+    
+    def test_multiline_and_spacing(self):
+        """Test multi-line data, optional space after the colon and comments."""
+        events = self._events(b': keep-alive\n\ndata:one\ndata: two\n\nevent: x\ndata\n\n')
+        self.assertEqual(events, [b'one\ntwo', b''])
+    
+    def test_split_chunks_and_line_endings(self):
+        """Test events split at every byte with CRLF and CR line endings."""
+        body = b'data: a\r\n\r\ndata: b\r\rdata: c\n\n'
+        events = self._events(*[body[i:i + 1] for i in range(len(body))])
+        self.assertEqual(events, [b'a', b'b', b'c'])
+    
+    def test_unterminated_final_event(self):
+        """Test that a last event without a blank line is still delivered."""
+        self.assertEqual(self._events(b'data: a\n\ndata: b'), [b'a', b'b'])
+    
+    def test_iter_deltas(self):
+        """Test content and reasoning deltas, skipping noise and stopping at [DONE]."""
+        body = (
+            b'data: {"choices":[{"delta":{"role":"assistant"}}]}\n\n'
+            b'data: {"choices":[{"delta":{"reasoning_content":"think"}}]}\n\n'
+            b'data: {"choices":[{"delta":{"content":"Hel"}}]}\n\n'
+            b'data: not json\n\n'
+            b'data: {"choices":[],"usage":{"total_tokens":3}}\n\n'
+            b'data: {"choices":[{"delta":{"content":"lo"}}]}\n\n'
+            b'data: [DONE]\n\n'
+            b'data: {"choices":[{"delta":{"content":"ignored"}}]}\n\n'
+        )
+        chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+        
+        self.assertEqual(list(iter_deltas(chunks)), ['Hel', 'lo'])
+        self.assertEqual(list(iter_deltas(chunks, include_reasoning=True)),
+                         [('reasoning', 'think'), ('content', 'Hel'), ('content', 'lo')])
+    
+    def test_queue_sink(self):
+        """Test that the queue sink forwards deltas and a closing sentinel."""
+        q = queue.Queue()
+        sink = QueueSink(q)
+        drain([b'data: {"choices":[{"delta":{"content":"x"}}]}\n\n'], sink)
+        sink.close()
+        self.assertEqual(q.get_nowait(), ('content', 'x'))
+        self.assertIsNone(q.get_nowait())
+    
+    def test_console_sink_batches_writes(self):
+        """Test that the console sink does not write once per token."""
+        out = Mock()
+        sink = ConsoleSink(out, flush_interval=60)
+        for _ in range(100):
+            sink('content', 'tok ')
+        sink('reasoning', 'hidden')
+        sink.close()
+        out.write.assert_called_once_with('tok ' * 100 + '\n')
+
+
+class TestUpstreamClient(unittest.TestCase):
+    """Test cases for the pooled upstream client."""
+    
+    def test_agents_share_process_client(self):
+        """Test that agents reuse the process-wide client by default."""
+        self.assertIs(AutonomousAgent().client, AutonomousAgent().client)
+        self.assertIs(AutonomousAgent().client, get_upstream_client())
+    
+    def test_custom_client(self):
+        """Test agent initialization with an explicit client."""
+        client = UpstreamClient(pool_size=2)
+        agent = AutonomousAgent(client=client)
+        self.assertIs(agent.client, client)
+        self.assertEqual(client.stats()['pool_size'], 2)
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_post_applies_timeouts_and_closes(self, mock_post):
+        """Test that pooled posts use configured timeouts and release connections."""
+        mock_response = Mock()
+        mock_post.return_value = mock_response
+        client = UpstreamClient(connect_timeout=1.5, read_timeout=30)
+        
+        with client.post("https://example.invalid", json={}) as response:
+            self.assertIs(response, mock_response)
+            self.assertEqual(client.stats()['in_flight'], 1)
+        
+        self.assertEqual(mock_post.call_args.kwargs['timeout'], (1.5, 30))
+        mock_response.close.assert_called_once()
+        stats = client.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['requests'], 1)
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_pool_waits_counted(self, mock_post):
+        """Test that requests beyond the pool size are counted as waits."""
+        mock_post.return_value = Mock()
+        client = UpstreamClient(pool_size=1)
+        
+        with client.post("https://example.invalid"):
+            with client.post("https://example.invalid"):
+                pass
+        
+        self.assertEqual(client.stats()['pool_waits'], 1)
+
+
+def stream_response(*chunks, status_code=200, headers=None, delay=0):
+    """Mock streaming response; ``delay`` stalls the first chunk."""
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(response=response)
+    
+    def iter_content(chunk_size=None):
+        time.sleep(delay)
+        return iter(chunks)
+    response.iter_content.side_effect = iter_content
+    return response
+
+
+class TestRetriesAndHedging(unittest.TestCase):
+    """Test cases for upstream retries, deadlines and hedged requests."""
+    
+    BODY = b'data: {"choices":[{"delta":{"content":"ok"}}]}\n\ndata: [DONE]\n\n'
+    
+    def test_retry_policy_classes(self):
+        """Test that only connection errors and transient statuses are retried."""
+        policy = RetryPolicy(max_retries=2, backoff_base=0.1, backoff_max=1.0)
+        
+        self.assertIsNotNone(policy.next_delay(0, requests.ConnectionError()))
+        self.assertIsNotNone(policy.next_delay(0, requests.HTTPError(response=Mock(status_code=503, headers={}))))
+        self.assertIsNone(policy.next_delay(0, requests.HTTPError(response=Mock(status_code=400, headers={}))))
+        self.assertIsNone(policy.next_delay(0, requests.ReadTimeout()))
+        self.assertIsNone(policy.next_delay(2, requests.ConnectionError()))
+        self.assertLessEqual(policy.next_delay(1, requests.ConnectionError()), 0.2)
+    
+    def test_retry_after_honoured(self):
+        """Test that Retry-After sets a minimum wait, and a long one gives up."""
+        policy = RetryPolicy(backoff_base=0.1, backoff_max=5.0)
+        
+        def error(retry_after):
+            return requests.HTTPError(response=Mock(status_code=429, headers={'Retry-After': retry_after}))
+        
+        self.assertEqual(policy.next_delay(0, error('3')), 3.0)
+        self.assertIsNone(policy.next_delay(0, error('60')))
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_stream_retries_transient_status(self, mock_post):
+        """Test that a 503 before any output is retried."""
+        mock_post.side_effect = [stream_response(status_code=503), stream_response(self.BODY)]
+        agent = AutonomousAgent(client=UpstreamClient(backoff_base=0.001))
+        
+        self.assertEqual(list(agent.stream("Test prompt")), ['ok'])
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(agent.client.stats()['retries'], 1)
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_client_errors_not_retried(self, mock_post):
+        """Test that a 400 fails at once."""
+        mock_post.return_value = stream_response(status_code=400)
+        agent = AutonomousAgent(client=UpstreamClient(backoff_base=0.001))
+        
+        with self.assertRaises(requests.HTTPError):
+            list(agent.stream("Test prompt"))
+        self.assertEqual(mock_post.call_count, 1)
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_deadline_bounds_timeouts(self, mock_post):
+        """Test that attempts use the time left and expired deadlines fail fast."""
+        mock_post.return_value = stream_response(self.BODY)
+        agent = AutonomousAgent(client=UpstreamClient(read_timeout=300),
+                                deadline=time.monotonic() + 2)
+        
+        list(agent.stream("Test prompt"))
+        self.assertLessEqual(mock_post.call_args.kwargs['timeout'][1], 2)
+        
+        agent.deadline = time.monotonic() - 1
+        with self.assertRaises(DeadlineExceeded):
+            list(agent.stream("Test prompt"))
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_hedged_request_wins(self, mock_post):
+        """Test that a slow first attempt is hedged and the faster answer used."""
+        slow = stream_response(b'data: {"choices":[{"delta":{"content":"slow"}}]}\n\n', delay=0.5)
+        fast = stream_response(b'data: {"choices":[{"delta":{"content":"fast"}}]}\n\n')
+        mock_post.side_effect = [slow, fast]
+        client = UpstreamClient(hedge=True, hedge_min_samples=5)
+        client._first_byte_times.extend([0.01] * 5)
+        agent = AutonomousAgent(client=client)
+        
+        self.assertEqual(list(agent.stream("Test prompt")), ['fast'])
+        stats = client.stats()
+        self.assertEqual((stats['hedges'], stats['hedge_wins']), (1, 1))
+        
+        # The losing attempt hands its connection back once it answers
+        deadline = time.monotonic() + 5
+        while not slow.close.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        slow.close.assert_called_once()
+    
+    def test_hedging_waits_for_samples(self):
+        """Test that hedging stays off until enough latencies were seen."""
+        client = UpstreamClient(hedge=True, hedge_min_samples=3)
+        client._first_byte_times.extend([0.1, 0.2])
+        self.assertIsNone(client.hedge_delay())
+        client._first_byte_times.append(0.3)
+        self.assertEqual(client.hedge_delay(), 0.3)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for the upstream circuit breaker."""
+    
+    def _calls(self, breaker, *outcomes, latency=0.1):
+        for failed in outcomes:
+            breaker.acquire()
+            breaker.record(failed, latency)
+    
+    def test_opens_on_error_rate(self):
+        """Test that the breaker opens once the failure ratio is reached."""
+        breaker = CircuitBreaker(min_calls=4, failure_ratio=0.5)
+        self._calls(breaker, False, False, True)
+        self.assertEqual(breaker.state, 'closed')
+        self._calls(breaker, True)
+        
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpen) as ctx:
+            breaker.check()
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+    
+    def test_opens_on_slow_calls(self):
+        """Test that mostly slow calls open the breaker."""
+        breaker = CircuitBreaker(min_calls=3, slow_call_duration=1.0, slow_call_ratio=0.6)
+        self._calls(breaker, False, False, False, latency=2.0)
+        self.assertEqual(breaker.state, 'open')
+    
+    def test_half_open_probe(self):
+        """Test that one probe is let through after the open period."""
+        breaker = CircuitBreaker(min_calls=1, open_duration=0.05)
+        self._calls(breaker, True)
+        time.sleep(0.06)
+        
+        breaker.acquire()
+        self.assertEqual(breaker.state, 'half_open')
+        with self.assertRaises(CircuitOpen):
+            breaker.acquire()
+        breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, 'closed')
+    
+    def test_failed_probe_reopens(self):
+        """Test that a failed probe opens the breaker again."""
+        breaker = CircuitBreaker(min_calls=1, open_duration=0.05)
+        self._calls(breaker, True)
+        time.sleep(0.06)
+        self._calls(breaker, True)
+        self.assertEqual(breaker.state, 'open')
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_client_fails_fast_when_open(self, mock_post):
+        """Test that an open breaker stops calls before they reach upstream."""
+        mock_post.side_effect = requests.ConnectionError('refused')
+        agent = AutonomousAgent(client=UpstreamClient(max_retries=0, breaker_min_calls=2))
+        
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                list(agent.stream("Test prompt"))
+        with self.assertRaises(CircuitOpen):
+            list(agent.stream("Test prompt"))
+        
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(agent.client.breaker.stats()['state'], 'open')
+    
+    @patch('autonomous_agent.r.Session.post')
+    def test_client_errors_do_not_count(self, mock_post):
+        """Test that 4xx responses leave the breaker closed."""
+        mock_post.return_value = stream_response(status_code=400)
+        client = UpstreamClient(breaker_min_calls=2)
+        
+        for _ in range(3):
+            with self.assertRaises(requests.HTTPError):
+                list(AutonomousAgent(client=client).stream("Test prompt"))
+        
+        self.assertEqual(client.breaker.state, 'closed')
+
+
+class TestProviderRegistry(unittest.TestCase):
+    """Test cases for routing across upstream providers, against local stub servers."""
+    
+    def _stub(self, reply, **kwargs):
+        stub = StubUpstream(reply=reply, **kwargs).start()
+        self.addCleanup(stub.close)
+        return stub
+    
+    def _provider(self, name, stub, weight=1.0):
+        return Provider(name, stub.url, weight=weight, client=UpstreamClient(max_retries=0))
+    
+    def test_fails_over_on_server_error(self):
+        """Test that a failing provider is skipped for the next one."""
+        broken, healthy = self._stub('a', error_rate=1.0), self._stub('b')
+        registry = ProviderRegistry([self._provider('a', broken),
+                                     self._provider('b', healthy, weight=0)])
+        agent = AutonomousAgent(providers=registry)
+        
+        self.assertEqual(list(agent.stream("Test prompt")), ['b'])
+        stats = registry.stats()
+        self.assertEqual(stats['failovers'], 1)
+        self.assertEqual([p['failures'] for p in stats['providers']], [1, 0])
+        self.assertGreater(registry.providers[0].error_rate, 0)
+    
+    def test_client_errors_not_failed_over(self):
+        """Test that a bad request is not retried on another provider."""
+        rejecting, healthy = self._stub('a', error_rate=1.0, error_status=400), self._stub('b')
+        registry = ProviderRegistry([self._provider('a', rejecting),
+                                     self._provider('b', healthy, weight=0)])
+        
+        with self.assertRaises(requests.HTTPError):
+            list(AutonomousAgent(providers=registry).stream("Test prompt"))
+        self.assertEqual(healthy.stats()['calls'], 0)
+    
+    def test_fails_over_when_slow(self):
+        """Test that a stalled provider is raced against the next one."""
+        slow, fast = self._stub('a', ttft=1.0), self._stub('b')
+        registry = ProviderRegistry([self._provider('a', slow),
+                                     self._provider('b', fast, weight=0)],
+                                    failover_after=0.1)
+        agent = AutonomousAgent(providers=registry)
+        
+        start = time.monotonic()
+        self.assertEqual(list(agent.stream("Test prompt")), ['b'])
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(registry.stats()['failovers'], 1)
+        self.assertIsNotNone(registry.providers[1].ttft)
+    
+    def test_routes_by_ttft_and_errors(self):
+        """Test that slow or failing providers get a smaller share of calls."""
+        a, b = Provider('a', 'http://a.invalid'), Provider('b', 'http://b.invalid')
+        registry = ProviderRegistry([a, b])
+        for _ in range(10):
+            a.record(2.0, False)
+            b.record(0.1, False)
+        self.assertAlmostEqual(a.ttft, 2.0)
+        
+        firsts = [registry.ranked()[0] for _ in range(200)]
+        self.assertGreater(firsts.count(b), 150)
+        
+        for _ in range(10):
+            b.record(None, True)
+        self.assertGreater(b.error_rate, 0.85)
+        self.assertGreater(a.score(0.1), b.score(0.1))
+    
+    def test_open_breakers_tried_last(self):
+        """Test that tripped providers go last and all-open fails fast."""
+        a, b = Provider('a', 'http://a.invalid'), Provider('b', 'http://b.invalid')
+        registry = ProviderRegistry([a, b])
+        a.client.breaker._trip()
+        
+        self.assertEqual(registry.ranked(), [b, a])
+        registry.check()
+        b.client.breaker._trip()
+        self.assertTrue(registry.is_open())
+        with self.assertRaises(CircuitOpen):
+            registry.check()
+    
+    @patch.dict(os.environ, {'STUB_API_KEY': 'sk-test'})
+    def test_from_config_sets_model_and_key(self):
+        """Test that providers send their own model name and bearer token."""
+        stub = self._stub('hi')
+        registry = ProviderRegistry.from_config(json.dumps([
+            {'name': 'stub', 'url': stub.url, 'model': 'stub-model', 'api_key_env': 'STUB_API_KEY'}
+        ]))
+        agent = AutonomousAgent(model='logical-model', providers=registry)
+        
+        self.assertEqual(agent.query("Test prompt", stream=True, sink=lambda kind, text: None), 'hi')
+        body, headers = stub.received[0]
+        self.assertEqual(body['model'], 'stub-model')
+        self.assertEqual(headers['Authorization'], 'Bearer sk-test')
+    
+    def test_default_registry(self):
+        """Test that an empty spec gives the default endpoint on the shared client."""
+        agent = AutonomousAgent()
+        self.assertEqual([p.name for p in agent.providers.providers], ['default'])
+        self.assertIs(agent.client, get_upstream_client())
+        self.assertEqual(agent.providers.primary.api_url, agent.api_url)
+
+
+class TestStubUpstream(unittest.TestCase):
+    """Test cases for the bundled fake upstream."""
+    
+    def setUp(self):
+        self.stub = StubUpstream(tokens=20, tokens_per_sec=1000, ttft=0.05, seed=1).start()
+        self.addCleanup(self.stub.close)
+        self.client = UpstreamClient(max_retries=0)
+        self.agent = AutonomousAgent(providers=ProviderRegistry([Provider('stub', self.stub.url, client=self.client)]))
+    
+    def test_streams_paced_tokens_with_usage(self):
+        """Test that streams honour TTFT and rate, report usage and keep the connection."""
+        start = time.monotonic()
+        deltas = list(self.agent.stream("count to twenty"))
+        elapsed = time.monotonic() - start
+        
+        self.assertEqual(deltas, [f'tok{i} ' for i in range(20)])
+        self.assertGreaterEqual(elapsed, 0.05 + 19 / 1000)
+        self.assertEqual(self.agent.last_usage, TokenUsage(3, 20, 0))
+        
+        list(self.agent.stream("again"))
+        self.assertEqual(self.client.stats()['connections_opened'], 1)
+    
+    def test_non_streaming_answer(self):
+        """Test a buffered completion."""
+        self.assertEqual(self.agent.query("Hi", stream=False), ''.join(f'tok{i} ' for i in range(20)))
+        self.assertEqual(self.agent.last_usage.completion_tokens, 20)
+    
+    def test_error_injection(self):
+        """Test that injected failures surface as HTTP errors."""
+        self.stub.error_rate = 1.0
+        with self.assertRaises(requests.HTTPError):
+            list(self.agent.stream("Hi"))
+        self.assertEqual(self.stub.stats(), {'calls': 1, 'errors': 1, 'stalls': 0})
+
+
+class TestAsyncAutonomousAgent(unittest.TestCase):
+    """Test cases for AsyncAutonomousAgent against a mock transport."""
+    
+    STREAM_BODY = (
+        b'data: {"choices":[{"delta":{"content":"Hello"}}]}\n\n'
+        b'data: {"choices":[{"delta":{"content":" World"}}]}\n\n'
+        b'data: [DONE]\n\n'
+    )
+    
+    def _agent(self, handler):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return AsyncAutonomousAgent(client=client)
+    
+    def test_query_non_streaming(self):
+        """Test non-streaming async query."""
+        def handler(request):
+            self.assertEqual(json.loads(request.content)['stream'], 0)
+            return httpx.Response(200, json={'choices': [{'message': {'content': 'Test response'}}]})
+        
+        result = asyncio.run(self._agent(handler).query("Test prompt"))
+        
+        self.assertEqual(result, 'Test response')
+    
+    def test_stream(self):
+        """Test async streaming yields deltas in order."""
+        def handler(request):
+            return httpx.Response(200, content=self.STREAM_BODY)
+        
+        async def collect():
+            return [chunk async for chunk in self._agent(handler).stream("Test prompt")]
+        
+        self.assertEqual(asyncio.run(collect()), ['Hello', ' World'])
+    
+    def test_query_streaming_joins_deltas(self):
+        """Test that a streamed async query returns the full text."""
+        def handler(request):
+            return httpx.Response(200, content=self.STREAM_BODY)
+        
+        result = asyncio.run(self._agent(handler).query("Test prompt", stream=True))
+        
+        self.assertEqual(result, 'Hello World')
+    
+    def test_query_error_handling(self):
+        """Test that upstream errors return None."""
+        def handler(request):
+            return httpx.Response(502)
+        
+        with patch('sys.stderr'):
+            result = asyncio.run(self._agent(handler).query("Test prompt"))
+        
+        self.assertIsNone(result)
+
+
 class TestCompactVersion(unittest.TestCase):
     """Test the compact version code structure."""
     
@@ -184,6 +872,15 @@ def run_tests():
     
     # Add test cases
     suite.addTests(loader.loadTestsFromTestCase(TestAutonomousAgent))
+    suite.addTests(loader.loadTestsFromTestCase(TestParallelExecution))
+    suite.addTests(loader.loadTestsFromTestCase(TestBatchMode))
+    suite.addTests(loader.loadTestsFromTestCase(TestSSEParser))
+    suite.addTests(loader.loadTestsFromTestCase(TestUpstreamClient))
+    suite.addTests(loader.loadTestsFromTestCase(TestRetriesAndHedging))
+    suite.addTests(loader.loadTestsFromTestCase(TestCircuitBreaker))
+    suite.addTests(loader.loadTestsFromTestCase(TestProviderRegistry))
+    suite.addTests(loader.loadTestsFromTestCase(TestStubUpstream))
+    suite.addTests(loader.loadTestsFromTestCase(TestAsyncAutonomousAgent))
     suite.addTests(loader.loadTestsFromTestCase(TestCompactVersion))
     
     # Run tests
@@ -0,0 +1,1113 @@
+#!/usr/bin/env python3
+"""
+Tests for the /api/v1 blueprint.
+Upstream model calls are mocked so no network access is required.
+"""
+
+import gzip
+import itertools
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app import create_app, response_cache, session_store
+from app.admission import AdmissionController, AdmissionRejected
+from app.cache import ResponseCache
+from app.compression import ResponseCompressor
+from app.json_provider import OrjsonProvider
+from app.sessions import SessionStore
+from app.singleflight import SingleFlight
+from app.models import User, APIKey, APIUsage
+from app.retention import UsageCompactor
+from app import usage_store
+from app.usage_store import DAY_US, UsageLog, to_micros
+from werkzeug.http import parse_accept_header
+from flask.json.provider import DefaultJSONProvider
+import fast_json
+from autonomous_agent import AutonomousAgent, DeadlineExceeded, TokenUsage, get_upstream_client
+
+
+_user_seq = itertools.count(1)
+
+
+class APITestCase(unittest.TestCase):
+    """Base class that creates an app, a user and an API key."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+
+        n = next(_user_seq)
+        self.user = User(email=f'api-test-{n}@example.com', username=f'api-test-{n}')
+        self.api_key = APIKey(user_id=self.user.id, key=APIKey.generate_key(), name='test')
+        self.headers = {'X-API-Key': self.api_key.key}
+
+    def usage_records(self):
+        """Usage records logged for the test user."""
+        return APIUsage.query_by_user_id(self.user.id)
+
+    @staticmethod
+    def parse_sse(body):
+        """Split a text/event-stream body into its data payloads."""
+        events = []
+        for block in body.decode().split('\n\n'):
+            if block.startswith('data: '):
+                data = block[len('data: '):]
+                events.append(data if data == '[DONE]' else json.loads(data))
+        return events
+
+
+class TestQueryEndpoint(APITestCase):
+    """Test cases for POST /api/v1/query."""
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_query_buffered(self, mock_stream):
+        """Test the default buffered JSON response."""
+        mock_stream.return_value = iter(['Hello', ' World'])
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['response'], 'Hello World')
+        self.assertEqual(len(self.usage_records()), 1)
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_query_stream(self, mock_stream):
+        """Test that stream=true relays deltas as Server-Sent Events."""
+        mock_stream.return_value = iter(['Hello', ' World'])
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi', 'stream': True},
+                                    headers=self.headers)
+        events = self.parse_sse(response.get_data())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual([e['delta'] for e in events if 'delta' in e], ['Hello', ' World'])
+        self.assertTrue(events[-2]['done'])
+        self.assertEqual(events[-1], '[DONE]')
+
+        usage = self.usage_records()
+        self.assertEqual(len(usage), 1)
+        self.assertEqual(usage[0].status_code, 200)
+        self.assertIsNotNone(usage[0].time_to_first_token)
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_query_stream_error(self, mock_stream):
+        """Test that upstream failures mid-stream end with an error event."""
+        def failing(prompt):
+            yield 'Hello'
+            raise RuntimeError('upstream went away')
+        mock_stream.side_effect = failing
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi', 'stream': True},
+                                    headers=self.headers)
+        events = self.parse_sse(response.get_data())
+
+        self.assertEqual(events[-1]['error'], 'Internal error')
+        self.assertEqual(self.usage_records()[0].status_code, 500)
+
+    def test_query_missing_prompt(self):
+        """Test that a missing prompt is rejected."""
+        response = self.client.post('/api/v1/query', json={}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_request_timeout_header_sets_deadline(self):
+        """Test that X-Request-Timeout shortens the upstream deadline."""
+        budgets = []
+
+        def fake_stream(agent, prompt):
+            budgets.append(agent.deadline - time.monotonic())
+            yield 'ok'
+
+        with patch.object(AutonomousAgent, 'stream', fake_stream):
+            self.client.post('/api/v1/query', json={'prompt': 'Hi'},
+                             headers={**self.headers, 'X-Request-Timeout': '5'})
+
+        self.assertTrue(0 < budgets[0] <= 5)
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_deadline_exceeded_is_unavailable(self, mock_stream):
+        """Test that a missed deadline is reported as 503."""
+        mock_stream.side_effect = DeadlineExceeded('Upstream call deadline exceeded')
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 503)
+
+
+def fake_stream_with_usage(agent, prompt):
+    """Stand-in for AutonomousAgent.stream that reports token usage."""
+    agent.last_usage = None
+    yield 'Hello'
+    yield ' World'
+    agent.last_usage = TokenUsage(prompt_tokens=12, completion_tokens=30, reasoning_tokens=8)
+
+
+class TestTokenUsage(APITestCase):
+    """Test cases for token accounting and token quotas."""
+
+    @patch.object(AutonomousAgent, 'stream', fake_stream_with_usage)
+    def test_buffered_query_records_tokens(self):
+        """Test that token counts are returned and stored on the usage record."""
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+
+        self.assertEqual(response.get_json()['usage']['tokens'],
+                         {'prompt': 12, 'completion': 30, 'reasoning': 8, 'total': 42})
+        record = self.usage_records()[0]
+        self.assertEqual((record.prompt_tokens, record.completion_tokens, record.reasoning_tokens),
+                         (12, 30, 8))
+
+    @patch.object(AutonomousAgent, 'stream', fake_stream_with_usage)
+    def test_stream_done_event_has_tokens(self):
+        """Test that the final stream event reports token counts."""
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi', 'stream': True},
+                                    headers=self.headers)
+        events = self.parse_sse(response.get_data())
+
+        self.assertEqual(events[-2]['usage']['tokens']['total'], 42)
+        self.assertEqual(self.usage_records()[0].total_tokens, 42)
+
+    def test_usage_reports_tokens(self):
+        """Test that /usage rolls up tokens for the user."""
+        APIUsage(user_id=self.user.id, endpoint='/api/v1/query', method='POST', status_code=200,
+                 prompt_tokens=100, completion_tokens=50, reasoning_tokens=20)
+
+        response = self.client.get('/api/v1/usage', headers=self.headers)
+        tokens = response.get_json()['tokens']
+
+        self.assertEqual(tokens['usage']['daily'],
+                         {'prompt': 100, 'completion': 50, 'reasoning': 20, 'total': 150})
+        self.assertEqual(tokens['remaining']['daily'], self.app.config['API_TOKEN_LIMITS']['free']['daily'] - 150)
+
+    def test_token_quota_enforced(self):
+        """Test that a used-up token quota is rejected like the request quota."""
+        APIUsage(user_id=self.user.id, endpoint='/api/v1/query', method='POST', status_code=200,
+                 prompt_tokens=self.app.config['API_TOKEN_LIMITS']['free']['daily'])
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('token_limits', response.get_json())
+
+
+class _NoScan(UsageLog):
+    """Usage log stand-in that fails the test if it is scanned."""
+
+    def positions(self, *args, **kwargs):
+        raise AssertionError('the usage log was scanned')
+
+    count = token_sums = positions
+
+
+class TestUsageCounters(APITestCase):
+    """Test cases for the per-user day and month usage counters."""
+
+    def log(self, timestamp, tokens=0):
+        return APIUsage(user_id=self.user.id, endpoint='/api/v1/query', method='POST', status_code=200,
+                        timestamp=timestamp, prompt_tokens=tokens)
+
+    def expected(self, records, day=None, month=None):
+        return sum(1 for r in records
+                   if (day is None or r.timestamp.date() == day)
+                   and (month is None or (r.timestamp.year, r.timestamp.month) == month))
+
+    def test_counts_match_a_scan_across_periods(self):
+        """Test that counted and scanned answers agree, including past periods."""
+        now = datetime.utcnow()
+        records = [self.log(now - timedelta(days=40)), self.log(now - timedelta(days=1), 5),
+                   self.log(now, 7), self.log(now, 11)]
+        today = now.date()
+        yesterday = today - timedelta(days=1)
+
+        self.assertEqual(APIUsage.count_by_date(self.user.id, today), self.expected(records, day=today))
+        self.assertEqual(APIUsage.count_by_date(self.user.id, yesterday), self.expected(records, day=yesterday))
+        self.assertEqual(APIUsage.count_by_month(self.user.id, today),
+                         self.expected(records, month=(today.year, today.month)))
+        self.assertEqual(APIUsage.token_totals(self.user.id, datetime.combine(today, datetime.min.time()))['total'], 18)
+
+        # A record from a later day rolls the counters over
+        self.log(now + timedelta(days=1))
+        self.assertEqual(APIUsage.count_by_date(self.user.id, today), 2)
+
+    def test_quota_checks_do_not_scan(self):
+        """Test that quota checks and /usage answer from the counters."""
+        now = datetime.utcnow()
+        self.log(now, 3)
+        self.log(now, 4)
+
+        with patch('app.models.api_usage_storage', _NoScan()):
+            with self.app.app_context():
+                remaining = self.user.remaining_requests()
+                self.assertTrue(self.user.can_make_request())
+            usage = self.client.get('/api/v1/usage', headers=self.headers).get_json()
+
+        self.assertEqual(remaining, self.app.config['API_RATE_LIMITS']['free']['daily'] - 2)
+        self.assertEqual(usage['usage'], {'daily': 2, 'monthly': 2})
+        self.assertEqual(usage['tokens']['usage']['monthly']['prompt'], 7)
+
+
+class TestUsageLog(unittest.TestCase):
+    """Test cases for the columnar usage log."""
+
+    def setUp(self):
+        self.log = UsageLog()
+        self.base = datetime(2024, 3, 1, 12, 30, 15, 123456)
+        rows = [(1, '/api/v1/query', 200, 0.5, 0), (1, '/api/v1/query', 500, None, 1),
+                (2, '/api/v1/stream', 200, 1.5, 2), (1, '/api/v1/stream', 200, 0.0, 2), (3, None, None, None, 3)]
+        for i, (user_id, endpoint, status, response_time, days) in enumerate(rows, 1):
+            self.log.append(SimpleNamespace(
+                id=i, user_id=user_id, api_key_id=None if user_id == 3 else 7, endpoint=endpoint,
+                method=None if endpoint is None else 'POST', status_code=status,
+                timestamp=self.base + timedelta(days=days), response_time=response_time,
+                time_to_first_token=None, prompt_tokens=i, completion_tokens=2 * i, reasoning_tokens=0))
+
+    def test_rows_round_trip(self):
+        """Test that rows decode to the values stored, including missing ones."""
+        self.assertEqual(self.log.row(0), {
+            'id': 1, 'user_id': 1, 'api_key_id': 7, 'endpoint': '/api/v1/query', 'method': 'POST',
+            'status_code': 200, 'timestamp': self.base, 'response_time': 0.5, 'time_to_first_token': None,
+            'prompt_tokens': 1, 'completion_tokens': 2, 'reasoning_tokens': 0})
+        missing = self.log.row(4)
+        self.assertEqual((missing['api_key_id'], missing['endpoint'], missing['method'],
+                          missing['status_code'], missing['response_time']), (None, None, None, None, None))
+
+    def test_aggregations(self):
+        """Test that aggregations agree with and without NumPy."""
+        start = to_micros(self.base + timedelta(days=1))
+        day = to_micros(self.base) // DAY_US
+        for backend in (usage_store.numpy, None):
+            with patch('app.usage_store.numpy', backend):
+                self.assertEqual(self.log.positions(1, start), [1, 3])
+                self.assertEqual(self.log.count(None, start, to_micros(self.base + timedelta(days=2))), 1)
+                self.assertEqual(self.log.token_sums(1), (7, 14, 0))
+                self.assertEqual(self.log.daily_counts(start), [(day + 1, 1), (day + 2, 2), (day + 3, 1)])
+                self.assertEqual(sorted(self.log.endpoint_stats(1)),
+                                 [('/api/v1/query', 2, 0.5), ('/api/v1/stream', 1, 0)])
+                self.assertEqual(dict(self.log.user_counts(start)), {1: 2, 2: 1, 3: 1})
+
+    def test_user_index_keeps_time_order(self):
+        """Test that backfilled rows land in time order and latest rows come newest first."""
+        self.log.append(SimpleNamespace(**dict(self.log.row(0), id=6, timestamp=self.base - timedelta(days=1))))
+        self.log.append(SimpleNamespace(**dict(self.log.row(0), id=7, timestamp=self.base + timedelta(days=5))))
+        self.assertEqual(self.log.positions(1), [5, 0, 1, 3, 6])
+        self.assertEqual(self.log.latest(1), [6, 3, 1, 0, 5])
+        self.assertEqual(self.log.latest(1, to_micros(self.base), limit=2), [6, 3])
+        self.assertEqual(self.log.latest(1, to_micros(self.base + timedelta(days=9))), [])
+        self.assertEqual(self.log.latest(99), [])
+        self.assertEqual(self.log.count(1, to_micros(self.base), to_micros(self.base + timedelta(days=2))), 2)
+        day = to_micros(self.base) // DAY_US
+        for backend in (usage_store.numpy, None):
+            with patch('app.usage_store.numpy', backend):
+                self.assertEqual(self.log.daily_counts(to_micros(self.base), user_id=1),
+                                 [(day, 1), (day + 1, 1), (day + 2, 1), (day + 5, 1)])
+                self.assertEqual(self.log.token_sums(99), (0, 0, 0))
+                self.assertEqual(self.log.endpoint_stats(99), [])
+
+    def test_time_index_matches_a_scan(self):
+        """Test that windows and day counts agree with a scan when rows arrive out of order."""
+        rng = random.Random(7)
+        log = UsageLog()
+        stamps = []
+        for i in range(300):
+            # Mostly in order, with some backfilled rows and some sharing a timestamp
+            offset = i * 3600 if rng.random() > 0.2 else rng.randint(0, 300 * 3600)
+            timestamp = self.base + timedelta(seconds=offset - offset % 1800)
+            stamps.append(to_micros(timestamp))
+            log.append(SimpleNamespace(**dict(self.log.row(0), id=i, user_id=1 + i % 3, timestamp=timestamp)))
+        bounds = [None, to_micros(self.base), to_micros(self.base + timedelta(days=4, minutes=30)),
+                  to_micros(self.base + timedelta(days=8)), to_micros(self.base + timedelta(days=30))]
+        for start, end in itertools.product(bounds, bounds):
+            expected = [i for i, t in enumerate(stamps)
+                        if (start is None or t >= start) and (end is None or t < end)]
+            self.assertEqual(sorted(log.positions(None, start, end)), expected)
+            self.assertEqual(log.count(None, start, end), len(expected))
+        for start in bounds:
+            expected = Counter(t // DAY_US for t in stamps if start is None or t >= start)
+            self.assertEqual(log.daily_counts(start), sorted(expected.items()))
+            for backend in (usage_store.numpy, None):
+                with patch('app.usage_store.numpy', backend):
+                    self.assertEqual(dict(log.user_counts(start)),
+                                     dict(Counter(1 + i % 3 for i, t in enumerate(stamps)
+                                                  if start is None or t >= start)))
+        ordered = [stamps[i] for i in log.positions()]
+        self.assertEqual(ordered, sorted(stamps))
+
+    def snapshot(self, log, user_id, bounds):
+        """Answers of every aggregate over hour-aligned windows."""
+        return [(log.count(user, start, end), log.token_sums(user, start, end), log.daily_counts(start, user),
+                 sorted((e, c, round(t, 3)) for e, c, t in log.endpoint_stats(user_id, start)),
+                 dict(log.user_counts(start)))
+                for user in (None, user_id) for start, end in itertools.product(bounds, bounds)]
+
+    def test_compaction_keeps_aggregates(self):
+        """Test that folding old rows into rollups leaves every aggregate unchanged."""
+        for backend, backfill in itertools.product((usage_store.numpy, None), (0, 0.2)):
+            with patch('app.usage_store.numpy', backend):
+                rng = random.Random(11)
+                log = UsageLog()
+                for i in range(400):
+                    offset = i * 900 if rng.random() >= backfill else rng.randint(0, 400 * 900)
+                    log.append(SimpleNamespace(**dict(
+                        self.log.row(0), id=i, user_id=1 + i % 3, endpoint=rng.choice(['/a', '/b']),
+                        status_code=rng.choice([200, 200, 429, 500]), response_time=rng.choice([None, 0.3, 4.0]),
+                        prompt_tokens=i, completion_tokens=2 * i, timestamp=self.base + timedelta(seconds=offset))))
+                hour = self.base.replace(minute=0, second=0, microsecond=0)
+                bounds = [None] + [to_micros(hour + timedelta(hours=h)) for h in (0, 5, 30, 60, 200)]
+                before = self.snapshot(log, 1, bounds)
+
+                folded = log.compact(to_micros(hour + timedelta(hours=60)))
+                self.assertEqual(len(log), 400 - folded)
+                self.assertGreater(folded, 100)
+                self.assertEqual(self.snapshot(log, 1, bounds), before)
+
+                # Rows stay listable and indexable after the front is freed
+                cutoff = to_micros(hour + timedelta(hours=60))
+                latest = [log.timestamps[i] for i in log.latest(1)]
+                self.assertEqual(latest, sorted(latest, reverse=True))
+                self.assertTrue(all(t >= cutoff for t in latest))
+                log.append(SimpleNamespace(**dict(self.log.row(0), id=500, timestamp=self.base + timedelta(days=9))))
+                self.assertEqual(log.row(log.latest(1, limit=1)[0])['id'], 500)
+
+                # Dropping hourly rollups keeps day-aligned answers
+                day = to_micros(datetime.combine(self.base.date(), datetime.min.time()))
+                days = [(log.count(1, day + d * DAY_US, day + (d + 1) * DAY_US), log.daily_counts(day, 1))
+                        for d in range(3)]
+                log.compact(cutoff, day + 2 * DAY_US)
+                self.assertEqual([(log.count(1, day + d * DAY_US, day + (d + 1) * DAY_US), log.daily_counts(day, 1))
+                                  for d in range(3)], days)
+                self.assertLess(log.stats()['hourly_rollups'], log.stats()['daily_rollups'] * 24)
+
+    def test_rows_are_compact(self):
+        """Test that a row, with its index entries, costs a few dozen bytes."""
+        log = UsageLog()
+        for i in range(1000):
+            log.append(SimpleNamespace(**dict(self.log.row(0), id=i, timestamp=self.base + timedelta(minutes=i))))
+        self.assertLessEqual(log.nbytes() / len(log), 52)
+
+
+class TestUsageCompaction(APITestCase):
+    """Test cases for folding old usage into rollups."""
+
+    def test_stats_survive_compaction(self):
+        """Test that quotas and statistics are unchanged once old records are folded."""
+        now = datetime.utcnow()
+        old = now - timedelta(days=40)
+        for timestamp, tokens in ((old, 5), (old, 7), (now, 11)):
+            APIUsage(user_id=self.user.id, endpoint='/api/v1/query', method='POST', status_code=200,
+                     timestamp=timestamp, response_time=1.5, prompt_tokens=tokens)
+        since = now - timedelta(days=60)
+        before = (APIUsage.count_by_month(self.user.id, old.date()), APIUsage.token_totals(self.user.id, since),
+                  APIUsage.get_endpoint_stats(self.user.id, since), APIUsage.get_daily_stats(since, self.user.id))
+
+        compactor = UsageCompactor()
+        self.assertGreaterEqual(compactor.compact(), 2)
+
+        self.assertEqual((APIUsage.count_by_month(self.user.id, old.date()), APIUsage.token_totals(self.user.id, since),
+                          APIUsage.get_endpoint_stats(self.user.id, since),
+                          APIUsage.get_daily_stats(since, self.user.id)), before)
+        self.assertEqual([u.prompt_tokens for u in self.usage_records()], [11])
+        self.assertEqual(compactor.stats()['runs'], 1)
+
+    def test_health_reports_usage_log(self):
+        """Test that /health includes the usage log size and rollups."""
+        usage = self.client.get('/api/v1/health').get_json()['usage']
+        self.assertFalse(usage['enabled'])
+        self.assertIn('rows', usage)
+        self.assertIn('daily_rollups', usage)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for the two-tier response cache."""
+
+    def make_cache(self, **options):
+        cache = ResponseCache()
+        cache.enabled = True
+        for name, value in options.items():
+            setattr(cache, name, value)
+        return cache
+
+    def test_key_depends_on_model_prompt_and_params(self):
+        """Test that every key component changes the key."""
+        key = ResponseCache.make_key('m', 'p', {'t': 1})
+        self.assertEqual(key, ResponseCache.make_key('m', 'p', {'t': 1}))
+        self.assertNotEqual(key, ResponseCache.make_key('m2', 'p', {'t': 1}))
+        self.assertNotEqual(key, ResponseCache.make_key('m', 'p2', {'t': 1}))
+        self.assertNotEqual(key, ResponseCache.make_key('m', 'p', {'t': 2}))
+
+    def test_lru_eviction_by_bytes(self):
+        """Test that the least recently used entries go first when over budget."""
+        cache = self.make_cache(max_bytes=10)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        cache.get('a')
+        cache.set('c', 'cccc')
+
+        self.assertEqual(cache.get('a'), 'aaaa')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+    def test_ttl_expiry(self):
+        """Test that expired entries are not returned."""
+        cache = self.make_cache(ttl=60)
+        cache.set('a', 'value')
+        with patch('app.cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get('a'))
+
+    def test_disk_tier_shared(self):
+        """Test that a second cache instance reads entries written by the first."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.make_cache(cache_dir=cache_dir).set('k' * 64, 'shared')
+            self.assertEqual(self.make_cache(cache_dir=cache_dir).get('k' * 64), 'shared')
+
+
+class TestCachedEndpoints(APITestCase):
+    """Test cases for X-Cache behaviour on agent endpoints."""
+
+    def setUp(self):
+        """Enable the response cache for these tests."""
+        super().setUp()
+        self.app.config['RESPONSE_CACHE_ENABLED'] = True
+        response_cache.init_app(self.app)
+
+    def tearDown(self):
+        """Restore the default cache configuration."""
+        self.app.config['RESPONSE_CACHE_ENABLED'] = False
+        response_cache.init_app(self.app)
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_miss_then_hit(self, mock_stream):
+        """Test that identical research requests are served from cache."""
+        mock_stream.side_effect = lambda prompt: iter(['Research', ' results'])
+
+        first = self.client.post('/api/v1/research', json={'topic': 'AI'}, headers=self.headers)
+        second = self.client.post('/api/v1/research', json={'topic': 'AI'}, headers=self.headers)
+
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.get_json()['response'], 'Research results')
+        mock_stream.assert_called_once()
+        self.assertEqual(len(self.usage_records()), 2)
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_no_cache_header_bypasses(self, mock_stream):
+        """Test that Cache-Control: no-cache skips the cache."""
+        mock_stream.side_effect = lambda prompt: iter(['Fresh'])
+        headers = dict(self.headers, **{'Cache-Control': 'no-cache'})
+
+        self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=headers)
+
+        self.assertEqual(response.headers['X-Cache'], 'BYPASS')
+        self.assertEqual(mock_stream.call_count, 2)
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_api_key_opt_out(self, mock_stream):
+        """Test that keys with caching disabled never use the cache."""
+        mock_stream.side_effect = lambda prompt: iter(['Fresh'])
+        self.api_key.cache_enabled = False
+
+        self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+
+        self.assertEqual(response.headers['X-Cache'], 'BYPASS')
+        self.assertEqual(mock_stream.call_count, 2)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for single-flight coalescing."""
+
+    def test_concurrent_callers_share_one_producer(self):
+        """Test that joiners during a flight reuse the running producer."""
+        group = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def produce():
+            calls.append(1)
+            yield 'Hello'
+            release.wait(5)
+            yield ' World'
+
+        leader = group.join('key', produce)
+        follower = group.join('key', produce)
+        streamed = follower.iter_deltas()
+        self.assertEqual(next(streamed), 'Hello')
+        release.set()
+
+        self.assertIs(leader, follower)
+        self.assertEqual(leader.result(5), 'Hello World')
+        self.assertEqual(list(streamed), [' World'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(group.stats()['coalesced'], 1)
+
+    def test_errors_reach_every_waiter(self):
+        """Test that a failed producer raises for all waiters."""
+        group = SingleFlight()
+
+        def produce():
+            raise RuntimeError('upstream failed')
+            yield
+
+        flight = group.join('key', produce)
+        with self.assertRaises(RuntimeError):
+            flight.result(5)
+        with self.assertRaises(RuntimeError):
+            list(flight.iter_deltas())
+
+    def test_new_flight_after_completion(self):
+        """Test that a finished flight is not reused."""
+        group = SingleFlight()
+        first = group.join('key', lambda: iter(['a']))
+        first.result(5)
+        second = group.join('key', lambda: iter(['b']))
+
+        self.assertEqual(second.result(5), 'b')
+
+    def test_producer_return_value_is_usage(self):
+        """Test that a generator producer's return value is kept on the flight."""
+        def produce():
+            yield 'a'
+            return TokenUsage(1, 2, 0)
+
+        flight = SingleFlight().join('key', produce)
+
+        self.assertEqual(flight.result(5), 'a')
+        self.assertEqual(flight.usage, TokenUsage(1, 2, 0))
+
+
+class TestCoalescedEndpoints(APITestCase):
+    """Test cases for coalescing identical API requests."""
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_concurrent_research_shares_upstream(self, mock_stream):
+        """Test that concurrent identical requests make one upstream call and are each metered."""
+        release = threading.Event()
+
+        def slow_stream(prompt):
+            release.wait(5)
+            yield 'Shared answer'
+        mock_stream.side_effect = slow_stream
+
+        results = []
+
+        def call():
+            client = self.app.test_client()
+            results.append(client.post('/api/v1/research', json={'topic': 'trending'},
+                                       headers=self.headers))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual([r.get_json()['response'] for r in results], ['Shared answer'] * 3)
+        mock_stream.assert_called_once()
+        self.assertEqual(len(self.usage_records()), 3)
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test cases for the admission gate."""
+
+    def make_gate(self, **options):
+        gate = AdmissionController()
+        for name, value in options.items():
+            setattr(gate, name, value)
+        return gate
+
+    def test_full_queue_fails_fast(self):
+        """Test that requests beyond limit plus queue are rejected with a retry hint."""
+        gate = self.make_gate(limit=1.0, max_queue=0)
+        gate.acquire()
+
+        with self.assertRaises(AdmissionRejected) as ctx:
+            gate.acquire()
+
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(gate.stats()['rejected'], 1)
+
+    def test_queued_request_admitted_on_release(self):
+        """Test that a waiting request gets the slot freed by a finished call."""
+        gate = self.make_gate(limit=1.0, max_queue=1, adaptive=False)
+        gate.acquire()
+        admitted = threading.Event()
+
+        def waiter():
+            gate.acquire()
+            admitted.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(gate.stats()['queue_depth'], 1)
+
+        gate.release(0.1)
+        thread.join(5)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(gate.stats()['in_flight'], 1)
+
+    def test_queue_timeout(self):
+        """Test that waiting longer than the queue timeout is rejected."""
+        gate = self.make_gate(limit=1.0, queue_timeout=0.01)
+        gate.acquire()
+
+        with self.assertRaises(AdmissionRejected):
+            gate.acquire()
+
+    def test_aimd_limit(self):
+        """Test additive increase on fast calls and multiplicative decrease on slow ones."""
+        gate = self.make_gate(limit=4.0, target_latency=1.0)
+        for _ in range(4):
+            gate.acquire()
+            gate.release(0.1)
+        self.assertEqual(gate.stats()['limit'], 4)
+        self.assertGreater(gate.limit, 4.9)
+
+        gate.acquire()
+        gate.release(5.0)
+        self.assertLess(gate.limit, 4.0)
+
+
+class TestLoadShedding(APITestCase):
+    """Test cases for 503 responses when admission control sheds load."""
+
+    @patch('app.upstream.admission.acquire')
+    def test_shed_request_gets_retry_after(self, mock_acquire):
+        """Test that a rejected call returns 503 with Retry-After."""
+        mock_acquire.side_effect = AdmissionRejected('Server is at capacity', retry_after=7)
+
+        response = self.client.post('/api/v1/code', json={'requirements': 'x'}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '7')
+        self.assertEqual(self.usage_records()[0].status_code, 503)
+
+    @patch('app.upstream.admission.acquire')
+    def test_shed_stream_request(self, mock_acquire):
+        """Test that streaming requests are shed before the stream starts."""
+        mock_acquire.side_effect = AdmissionRejected('Server is at capacity', retry_after=3)
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi', 'stream': True},
+                                    headers=self.headers)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.mimetype, 'application/json')
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_open_breaker_fails_fast(self, mock_stream):
+        """Test that an open breaker sheds requests without calling upstream."""
+        breaker = get_upstream_client().breaker
+        with breaker._lock:
+            breaker._trip()
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Hi'}, headers=self.headers)
+        health = self.client.get('/api/v1/health')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        mock_stream.assert_not_called()
+        self.assertEqual(health.status_code, 503)
+        self.assertEqual(health.get_json()['status'], 'degraded')
+        self.assertEqual(health.get_json()['upstream']['breaker']['state'], 'open')
+        self.assertEqual(health.get_json()['upstream']['routing']['providers'][0]['breaker'], 'open')
+
+    def test_health_reports_admission(self):
+        """Test that health exposes queue depth and in-flight counts."""
+        stats = self.client.get('/api/v1/health').get_json()['admission']
+
+        self.assertIn('queue_depth', stats)
+        self.assertIn('in_flight', stats)
+
+
+class TestJobs(APITestCase):
+    """Test cases for the asynchronous job API."""
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_job_lifecycle(self, mock_stream):
+        """Test that a job is accepted immediately and its result can be long-polled."""
+        mock_stream.return_value = iter(['Job', ' result'])
+
+        created = self.client.post('/api/v1/jobs', json={'type': 'research', 'topic': 'AI'},
+                                   headers=self.headers)
+        job_id = created.get_json()['id']
+        polled = self.client.get(f'/api/v1/jobs/{job_id}?wait=5', headers=self.headers)
+
+        self.assertEqual(created.status_code, 202)
+        self.assertEqual(created.headers['Location'], f'/api/v1/jobs/{job_id}')
+        self.assertEqual(polled.get_json()['status'], 'succeeded')
+        self.assertEqual(polled.get_json()['response'], 'Job result')
+        usage = self.usage_records()
+        self.assertEqual([u.endpoint for u in usage], ['/api/v1/jobs/research'])
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_cancel_running_job(self, mock_stream):
+        """Test that cancelling stops a running job at the next delta."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_stream(prompt):
+            yield 'partial'
+            started.set()
+            release.wait(5)
+            yield 'more'
+        mock_stream.side_effect = slow_stream
+
+        job_id = self.client.post('/api/v1/jobs', json={'prompt': 'Hi'},
+                                  headers=self.headers).get_json()['id']
+        started.wait(5)
+        cancelled = self.client.delete(f'/api/v1/jobs/{job_id}', headers=self.headers)
+        release.set()
+        final = self.client.get(f'/api/v1/jobs/{job_id}?wait=5', headers=self.headers).get_json()
+
+        self.assertEqual(cancelled.status_code, 200)
+        self.assertEqual(final['status'], 'cancelled')
+        self.assertNotIn('response', final)
+
+    def test_invalid_job_type(self):
+        """Test that unknown job types are rejected."""
+        response = self.client.post('/api/v1/jobs', json={'type': 'dance'}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 400)
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_jobs_are_private(self, mock_stream):
+        """Test that a job cannot be read with another user's key."""
+        mock_stream.return_value = iter(['secret'])
+        job_id = self.client.post('/api/v1/jobs', json={'prompt': 'Hi'},
+                                  headers=self.headers).get_json()['id']
+        other = User(email=f'api-other-{job_id}@example.com', username=f'api-other-{job_id}')
+        other_key = APIKey(user_id=other.id, key=APIKey.generate_key(), name='other')
+
+        response = self.client.get(f'/api/v1/jobs/{job_id}', headers={'X-API-Key': other_key.key})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class TestBatch(APITestCase):
+    """Test cases for POST /api/v1/batch."""
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_batch_streams_ndjson(self, mock_stream):
+        """Test that each item gets a result line with its own status."""
+        mock_stream.side_effect = lambda prompt: iter([f'answer to {prompt[-3:]}'])
+        items = [
+            {'type': 'query', 'prompt': 'one'},
+            {'type': 'research', 'topic': 'two'},
+            {'type': 'code'}
+        ]
+
+        response = self.client.post('/api/v1/batch', json={'items': items, 'concurrency': 2},
+                                    headers=self.headers)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        results = {line['index']: line for line in lines}
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(results[0]['response'], 'answer to one')
+        self.assertEqual(results[1]['status'], 'ok')
+        self.assertEqual(results[2]['status_code'], 400)
+        self.assertEqual(len(self.usage_records()), 3)
+
+    def test_batch_exceeding_quota_rejected(self):
+        """Test that a batch larger than the remaining quota is rejected up front."""
+        items = [{'prompt': str(i)} for i in range(101)]
+
+        response = self.client.post('/api/v1/batch', json={'items': items}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.usage_records(), [])
+
+    def test_batch_requires_items(self):
+        """Test that an empty batch is rejected."""
+        response = self.client.post('/api/v1/batch', json={'items': []}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestSessionStore(unittest.TestCase):
+    """Test cases for conversation trimming and session eviction."""
+
+    def test_compact_trims_whole_exchanges(self):
+        """Test that old exchanges are dropped down to the compact ratio in one step."""
+        store = SessionStore()
+        store.context_tokens, store.compact_ratio = 200, 0.5
+        session = store.create(1, system='Be brief.')
+        for i in range(6):
+            session.add_turn(f'question {i} ' + 'x' * 80, f'answer {i} ' + 'y' * 80)
+
+        dropped = store.compact(session, 'next')
+        messages = session.messages('next')
+
+        self.assertEqual(dropped % 2, 0)
+        self.assertLessEqual(session.context_tokens(), 100)
+        self.assertEqual(messages[0], {'role': 'system', 'content': 'Be brief.'})
+        self.assertEqual(messages[1]['role'], 'user')
+        self.assertEqual(messages[-1], {'role': 'user', 'content': 'next'})
+        self.assertEqual(store.compact(session, 'next'), 0)  # the prefix is stable again
+
+    def test_compact_summarizes_trimmed_turns(self):
+        """Test that trimmed turns are folded into a summary sent after the system prompt."""
+        store = SessionStore()
+        store.context_tokens = 100
+        session = store.create(1, system='Be brief.')
+        session.add_turn('My name is Ada. ' + 'x' * 200, 'Hello Ada. ' + 'y' * 200)
+
+        store.compact(session, 'What is my name?', summarize=lambda summary, turns: 'User is Ada.')
+
+        self.assertEqual(session.turns, [])
+        self.assertEqual([m['role'] for m in session.messages('What is my name?')],
+                         ['system', 'system', 'user'])
+        self.assertIn('User is Ada.', session.messages('')[1]['content'])
+
+    def test_lru_eviction_and_per_user_limit(self):
+        """Test that the store stays bounded."""
+        store = SessionStore()
+        store.max_sessions, store.max_per_user = 3, 2
+        first = store.create(1)
+        store.create(2)
+        store.create(3)
+        store.get(first.id)
+        store.create(4)
+
+        self.assertIsNotNone(store.get(first.id))
+        self.assertEqual(store.stats()['sessions'], 3)
+        self.assertEqual(store.stats()['evictions'], 1)
+        store.create(1)
+        with self.assertRaises(ValueError):
+            store.create(1)
+
+    def test_idle_sessions_expire(self):
+        """Test the idle TTL."""
+        store = SessionStore()
+        store.ttl = 0
+        session = store.create(1)
+
+        self.assertIsNone(store.get(session.id))
+
+
+class TestSessions(APITestCase):
+    """Test cases for the /api/v1/sessions API."""
+
+    def setUp(self):
+        super().setUp()
+        self.prompts = []
+
+        def fake_stream(agent, prompt):
+            self.prompts.append(prompt)
+            yield f'reply {len(self.prompts)}'
+            agent.last_usage = TokenUsage(prompt_tokens=10, completion_tokens=2)
+
+        patcher = patch.object(AutonomousAgent, 'stream', fake_stream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_session(self, **body):
+        response = self.client.post('/api/v1/sessions', json=body, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['id']
+
+    def test_history_is_kept_on_the_server(self):
+        """Test that each turn sends the system prompt first, then the conversation so far."""
+        session_id = self.create_session(system='You are terse.')
+        url = f'/api/v1/sessions/{session_id}/messages'
+
+        first = self.client.post(url, json={'content': 'Hi'}, headers=self.headers)
+        second = self.client.post(url, json={'content': 'Again'}, headers=self.headers)
+
+        self.assertEqual(first.get_json()['response'], 'reply 1')
+        self.assertEqual(second.get_json()['context']['messages'], 4)
+        self.assertEqual(self.prompts[1], [
+            {'role': 'system', 'content': 'You are terse.'},
+            {'role': 'user', 'content': 'Hi'},
+            {'role': 'assistant', 'content': 'reply 1'},
+            {'role': 'user', 'content': 'Again'}
+        ])
+        self.assertEqual([u.endpoint for u in self.usage_records()], ['/api/v1/sessions/messages'] * 2)
+
+    def test_streamed_turn_is_recorded(self):
+        """Test that a streamed answer joins the history and frees the session."""
+        session_id = self.create_session()
+        url = f'/api/v1/sessions/{session_id}/messages'
+
+        streamed = self.client.post(url, json={'content': 'Hi', 'stream': True}, headers=self.headers)
+        events = self.parse_sse(streamed.get_data())
+        streamed.close()
+        followup = self.client.post(url, json={'content': 'Next'}, headers=self.headers)
+
+        self.assertEqual(events[0], {'delta': 'reply 1'})
+        self.assertEqual(followup.status_code, 200)
+        self.assertEqual(len(self.prompts[1]), 3)
+
+    def test_summaries_use_tokens_of_the_turn(self):
+        """Test that summarizing trimmed turns is metered with the turn."""
+        session_store.summarize = True
+        session_store.context_tokens = 40
+        session_id = self.create_session()
+        url = f'/api/v1/sessions/{session_id}/messages'
+        self.client.post(url, json={'content': 'x' * 120}, headers=self.headers)
+
+        response = self.client.post(url, json={'content': 'Next'}, headers=self.headers).get_json()
+
+        self.assertEqual(response['usage']['tokens']['prompt'], 20)
+        self.assertIn('Summary of the earlier conversation', self.prompts[-1][0]['content'])
+        self.assertEqual(len(self.usage_records()), 2)
+
+    def test_busy_session_and_privacy(self):
+        """Test that a session answers one message at a time and only for its owner."""
+        session_id = self.create_session()
+        session = session_store.get(session_id)
+        other = User(email=f'sess-other-{session_id}@example.com', username=f'sess-other-{session_id}')
+        other_key = APIKey(user_id=other.id, key=APIKey.generate_key(), name='other')
+
+        session.acquire()
+        busy = self.client.post(f'/api/v1/sessions/{session_id}/messages', json={'content': 'Hi'},
+                                headers=self.headers)
+        session.release()
+        foreign = self.client.get(f'/api/v1/sessions/{session_id}', headers={'X-API-Key': other_key.key})
+        deleted = self.client.delete(f'/api/v1/sessions/{session_id}', headers=self.headers)
+
+        self.assertEqual(busy.status_code, 409)
+        self.assertEqual(foreign.status_code, 404)
+        self.assertEqual(deleted.status_code, 204)
+        self.assertEqual(self.client.get(f'/api/v1/sessions/{session_id}', headers=self.headers).status_code, 404)
+
+
+class TestCompression(APITestCase):
+    """Test cases for negotiated response compression."""
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_large_response_gzipped(self, mock_stream):
+        """Test that a long answer is compressed for clients that accept gzip."""
+        mock_stream.return_value = iter(['def sort(items):\n    return sorted(items)\n' * 50])
+
+        response = self.client.post('/api/v1/code', json={'requirements': 'sort'},
+                                    headers={**self.headers, 'Accept-Encoding': 'gzip, deflate'})
+        body = response.get_data()
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(int(response.headers['Content-Length']), len(body))
+        self.assertEqual(json.loads(gzip.decompress(body))['response'],
+                         'def sort(items):\n    return sorted(items)\n' * 50)
+
+    def test_small_or_unaccepted_responses_left_alone(self):
+        """Test the size threshold and clients that do not accept compression."""
+        small = self.client.get('/api/v1/usage', headers={**self.headers, 'Accept-Encoding': 'gzip'})
+        refused = self.client.get('/api/v1/usage', headers={**self.headers, 'Accept-Encoding': 'gzip;q=0'})
+
+        self.assertNotIn('Content-Encoding', small.headers)
+        self.assertNotIn('Content-Encoding', refused.headers)
+        self.assertIn('user', small.get_json())
+
+    def test_encoding_preference(self):
+        """Test that quality values win and ties go to the server's preference."""
+        compressor = ResponseCompressor()
+        compressor.encodings = ('zstd', 'br', 'gzip')
+
+        self.assertEqual(compressor.select_encoding(parse_accept_header('gzip, br, zstd')), 'zstd')
+        self.assertEqual(compressor.select_encoding(parse_accept_header('gzip, br;q=0.5')), 'gzip')
+        self.assertEqual(compressor.select_encoding(parse_accept_header('*')), 'zstd')
+        self.assertIsNone(compressor.select_encoding(parse_accept_header('identity')))
+
+    @patch('app.blueprints.api.AutonomousAgent.stream')
+    def test_stream_flushed_per_event(self, mock_stream):
+        """Test that every compressed chunk of a stream decodes to whole events."""
+        mock_stream.return_value = iter(['Hello', ' World', '!'])
+
+        response = self.client.post('/api/v1/query', json={'prompt': 'Compress me', 'stream': True},
+                                    headers={**self.headers, 'Accept-Encoding': 'gzip'}, buffered=False)
+        decoder = zlib.decompressobj(31)
+        events = []
+        for chunk in response.response:
+            text = decoder.decompress(chunk).decode()
+            if text:
+                self.assertTrue(text.endswith('\n\n'))
+                events.append(text)
+        response.close()
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(events[0], 'data: {"delta":"Hello"}\n\n')
+        self.assertEqual(events[-1], 'data: [DONE]\n\n')
+        self.assertEqual(self.usage_records()[0].status_code, 200)
+
+
+@dataclass
+class _Point:
+    x: int
+    y: int
+
+
+@unittest.skipIf(fast_json.orjson is None, 'orjson is not installed')
+class TestJSONProvider(unittest.TestCase):
+    """Test cases for the orjson-backed Flask JSON provider."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.fast = OrjsonProvider(self.app)
+        self.standard = DefaultJSONProvider(self.app)
+
+    def test_same_values_as_flask(self):
+        """Test that Flask's extra types serialize to the same values."""
+        obj = {
+            'when': datetime(2024, 1, 2, 3, 4, 5),
+            'day': date(2024, 1, 2),
+            'price': Decimal('9.99'),
+            'id': uuid.UUID(int=1),
+            'point': _Point(1, 2),
+            'text': 'Türkçe ✓',
+            'big': 2 ** 70,
+            'b': [1, 2.5, None, True],
+            'a': {2: 'two'}
+        }
+
+        self.assertEqual(json.loads(self.fast.dumps(obj)), json.loads(self.standard.dumps(obj)))
+        with self.app.app_context():
+            self.assertEqual(self.fast.response(obj).get_json(), self.standard.response(obj).get_json())
+        self.assertEqual(self.fast.dumps({'b': 1, 'a': 2}), '{"a":2,"b":1}')
+
+    def test_same_errors_as_flask(self):
+        """Test that unsupported values and malformed input fail the same way."""
+        with self.assertRaises(TypeError):
+            self.fast.dumps({'x': object()})
+        with self.assertRaises(ValueError):
+            self.fast.loads(b'{"x": ')
+
+    def test_app_uses_provider(self):
+        """Test that create_app installs the provider and bad bodies still get 400."""
+        client = self.app.test_client()
+        user = User(email='json-provider@example.com', username='json-provider')
+        key = APIKey(user_id=user.id, key=APIKey.generate_key(), name='test')
+
+        response = client.post('/api/v1/query', data='{"prompt": ', content_type='application/json',
+                               headers={'X-API-Key': key.key})
+
+        self.assertIsInstance(self.app.json, OrjsonProvider)
+        self.assertEqual(response.status_code, 400)
+
+
+def run_tests():
+    """Run all tests."""
+    loader = unittest.TestLoader()
+    suite = loader.loadTestsFromModule(sys.modules[__name__])
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())